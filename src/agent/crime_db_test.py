@@ -0,0 +1,579 @@
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+
+import pytest
+
+from src.agent.db import (AsyncArticleWriter, DatabaseManager, TextCodec, UrlSeenIndex,
+                          normalize_location, zstandard)
+
+# Moduły scrapera importują "agent.*" - tak jak przy uruchomieniu z katalogu src/
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+
+def make_manager():
+    return DatabaseManager(os.path.join(tempfile.mkdtemp(), "crime_data.db"))
+
+
+def fts_ids(manager, query):
+    return [row["id"] for row in manager.search_articles(query)]
+
+
+def fts_integrity_check(manager):
+    # Porównuje indeks z widokiem articles_fts_content; rozjazd kończy się błędem
+    manager.get_connection().execute(
+        "INSERT INTO articles_fts(articles_fts, rank) VALUES ('integrity-check', 1)")
+
+
+def test_fts_triggers():
+    print("=== Starting FTS trigger tests ===")
+
+    manager = make_manager()
+    article_id = manager.save_article("https://example.com/fts", "Kradzież samochodu", "Treść " * 20,
+                                      "test", "kradzież", "ul. Wielicka, Kraków", "Skradziono audi",
+                                      "kradzież", 50.03, 19.98)
+    assert fts_ids(manager, "audi") == [article_id], "Summary should be indexed"
+    assert fts_ids(manager, "krakow") == [article_id], "Location should match without diacritics"
+    fts_integrity_check(manager)
+    print("✅ New article indexed")
+
+    with manager.transaction() as cursor:
+        cursor.execute("UPDATE raw_articles SET title = 'Napad na kantor' WHERE id = ?", (article_id,))
+        cursor.execute("UPDATE processed_articles SET summary = 'Skradziono bmw' WHERE raw_article_id = ?",
+                       (article_id,))
+    assert fts_ids(manager, "samochodu") == [] and fts_ids(manager, "audi") == [], \
+        "Old title and summary should leave the index"
+    assert fts_ids(manager, "kantor") == [article_id] and fts_ids(manager, "bmw") == [article_id], \
+        "New title and summary should be indexed"
+    fts_integrity_check(manager)
+    print("✅ Updates re-indexed")
+
+    with manager.transaction() as cursor:
+        cursor.execute("DELETE FROM processed_articles WHERE raw_article_id = ?", (article_id,))
+    assert fts_ids(manager, "bmw") == [] and fts_ids(manager, "kantor") == [article_id], \
+        "Deleting the processed row should drop only its summary"
+    with manager.transaction() as cursor:
+        cursor.execute("DELETE FROM raw_articles WHERE id = ?", (article_id,))
+    assert fts_ids(manager, "kantor") == [], "Deleted article should leave the index"
+    fts_integrity_check(manager)
+    print("✅ Deletes removed from the index")
+
+    print("=== All tests passed ===")
+
+
+def test_nested_transaction_rolls_back_savepoint():
+    print("=== Starting nested transaction tests ===")
+
+    manager = make_manager()
+
+    def urls():
+        return [row[0] for row in manager.get_connection().execute("SELECT url FROM raw_articles ORDER BY id")]
+
+    with manager.transaction():
+        manager.save_raw_article("https://example.com/t1", "Zewnętrzny", "Treść", "test")
+        with pytest.raises(ValueError):
+            with manager.transaction():
+                manager.save_raw_article("https://example.com/t2", "Wewnętrzny", "Treść", "test")
+                raise ValueError("błąd w wewnętrznym bloku")
+        manager.save_raw_article("https://example.com/t3", "Po błędzie", "Treść", "test")
+    assert urls() == ["https://example.com/t1", "https://example.com/t3"], \
+        "Only the inner block should be rolled back"
+    assert manager._local.depth == 0 and not manager.get_connection().in_transaction, \
+        "The outer transaction should be committed"
+    print("✅ Inner SAVEPOINT rolled back, outer transaction committed")
+
+    with pytest.raises(ValueError):
+        with manager.transaction():
+            manager.save_raw_article("https://example.com/t4", "Cofnięty", "Treść", "test")
+            raise ValueError("błąd w zewnętrznym bloku")
+    assert urls() == ["https://example.com/t1", "https://example.com/t3"], \
+        "An error in the outer block should roll back everything"
+    assert not manager.get_connection().in_transaction, "No transaction should be left open"
+    print("✅ Outer ROLLBACK undoes the whole block")
+
+    print("=== All tests passed ===")
+
+
+def test_resave_marks_last_seen():
+    print("=== Starting last_seen upsert tests ===")
+
+    manager = make_manager()
+    url = "https://example.com/seen"
+
+    def row():
+        return manager.get_connection().execute(
+            "SELECT id, title, last_seen_at FROM raw_articles WHERE url = ?", (url,)).fetchone()
+
+    article_id, inserted = manager.save_raw_article(url, "Pierwszy tytuł", "Treść", "test")
+    assert inserted and row()["last_seen_at"] is None, "A new article should not be marked as seen again"
+
+    again_id, inserted = manager.save_raw_article(url, "Zmieniony tytuł", "Inna treść", "test")
+    assert (again_id, inserted) == (article_id, False), "A repeated URL should return the existing id"
+    assert row()["title"] == "Pierwszy tytuł", "The stored article should not be overwritten"
+    assert row()["last_seen_at"] is not None, "A repeated URL should set last_seen_at"
+    assert manager.get_connection().execute("SELECT COUNT(*) FROM raw_articles").fetchone()[0] == 1, \
+        "The upsert should not add a row"
+    assert manager.get_connection().execute("SELECT COUNT(*) FROM seen_urls").fetchone()[0] == 1, \
+        "The URL should be indexed once"
+    print("✅ Repeated URL updates last_seen_at in one statement")
+
+    print("=== All tests passed ===")
+
+
+def test_article_leases():
+    print("=== Starting lease queue tests ===")
+
+    manager = make_manager()
+    for i in range(3):
+        manager.save_raw_article(f"https://example.com/q{i}", f"Artykuł {i}", "Treść", "test")
+
+    first = [row["id"] for row in manager.claim_articles("w1", limit=2)]
+    second = [row["id"] for row in manager.claim_articles("w2", limit=10)]
+    assert len(first) == 2 and len(second) == 1 and not set(first) & set(second), \
+        "Leased articles should not be claimed twice"
+    assert manager.claim_articles("w3") == [], "All articles are leased"
+    print("✅ Claims reserve disjoint articles")
+
+    expired, kept = first
+    with manager.transaction() as cursor:
+        cursor.execute("UPDATE raw_articles SET lease_expires_at = datetime('now', '-1 seconds') WHERE id = ?",
+                       (expired,))
+    assert [row["id"] for row in manager.claim_articles("w2")] == [expired], \
+        "An expired lease should return the article to the pool"
+    assert not manager.ack_article(expired, "w1", {"crime_type": "kradzież", "location": "Kraków"}), \
+        "The previous owner should lose the article after expiry"
+    assert manager.ack_article(expired, "w2", {"crime_type": "kradzież", "location": "Kraków",
+                                               "latitude": 50.06, "longitude": 19.94}), \
+        "The new owner should acknowledge the article"
+    processed = manager.get_connection().execute(
+        "SELECT COUNT(*) FROM processed_articles WHERE raw_article_id = ?", (expired,)).fetchone()[0]
+    assert processed == 1, "Only the current owner's result should be saved"
+    print("✅ Expired lease taken over; stale ack rejected")
+
+    manager.nack_article(kept, "w1")
+    assert [row["id"] for row in manager.claim_articles("w2", max_attempts=3)] == [kept], \
+        "A nacked article should be claimable again"
+    manager.nack_article(kept, "w2")
+    assert manager.claim_articles("w2", max_attempts=2) == [], \
+        "An article should stop being claimed after max_attempts"
+    print("✅ nack returns the article until max_attempts")
+
+    print("=== All tests passed ===")
+
+
+@contextmanager
+def crawl_db_manager():
+    """Tymczasowa baza jako singleton initialize_db_manager, którego używają middleware i spidery"""
+    import agent.db as crawl_db
+
+    saved = crawl_db.DB_MANAGER
+    crawl_db.DB_MANAGER = crawl_db.DatabaseManager(os.path.join(tempfile.mkdtemp(), "crime_data.db"))
+    try:
+        yield crawl_db.DB_MANAGER
+    finally:
+        crawl_db.DB_MANAGER.close()
+        crawl_db.DB_MANAGER = saved
+
+
+def make_crawler(settings=None):
+    import scrapy
+    from scrapy.utils.test import get_crawler
+
+    crawler = get_crawler(scrapy.Spider, settings)
+    crawler.spider = scrapy.Spider("test")
+    return crawler
+
+
+def test_conditional_get_middleware():
+    from scrapy.exceptions import IgnoreRequest, NotConfigured
+    from scrapy.http import Request, Response
+    from agent.crime_news_scrapper.middlewares import ConditionalGetMiddleware
+
+    print("=== Starting conditional GET tests ===")
+
+    url = "https://example.com/lista"
+    with crawl_db_manager() as manager:
+        crawler = make_crawler()
+        middleware = ConditionalGetMiddleware.from_crawler(crawler)
+
+        first = Request(url)
+        middleware.process_request(first)
+        assert b"If-None-Match" not in first.headers, "The first fetch has no validators to send"
+        response = Response(url, status=200, headers={"ETag": '"v1"', "Last-Modified": "Sat, 04 Oct 2025 10:00:00 GMT"})
+        assert middleware.process_response(first, response) is response, "A 200 response should pass through"
+        assert manager.get_http_validators(url)["etag"] == '"v1"', "Validators of a 200 response should be saved"
+
+        second = Request(url)
+        middleware.process_request(second)
+        assert second.headers[b"If-None-Match"] == b'"v1"' and \
+            second.headers[b"If-Modified-Since"] == b"Sat, 04 Oct 2025 10:00:00 GMT", \
+            "The next fetch should be conditional"
+        print("✅ Validators saved and sent back")
+
+        with pytest.raises(IgnoreRequest):
+            middleware.process_response(second, Response(url, status=304, headers={"ETag": '"v2"'}))
+        validators = manager.get_http_validators(url)
+        assert (validators["etag"], validators["last_modified"]) == ('"v2"', "Sat, 04 Oct 2025 10:00:00 GMT"), \
+            "A 304 should refresh the ETag and keep Last-Modified"
+        assert crawler.stats.get_value("conditional_get/not_modified") == 1, "The 304 should be counted"
+        print("✅ 304 ends the request without parsing")
+
+        article = Request(url, callback=lambda response: None)
+        middleware.process_request(article)
+        assert b"If-None-Match" not in article.headers, "Article requests should not be conditional"
+        forced = Request(url, callback=lambda response: None, meta={"conditional_get": True})
+        middleware.process_request(forced)
+        assert forced.headers[b"If-None-Match"] == b'"v2"', "meta conditional_get should enable it for any callback"
+        print("✅ Only listing pages (or meta conditional_get) are conditional")
+
+        with pytest.raises(NotConfigured):
+            ConditionalGetMiddleware.from_crawler(make_crawler({"HTTPCACHE_ENABLED": True}))
+        print("✅ Disabled while replaying from HTTPCACHE")
+
+    print("=== All tests passed ===")
+
+
+def test_source_throttle_middleware():
+    from types import SimpleNamespace
+    from scrapy.core.downloader import Slot
+    from scrapy.http import Request, Response
+    from agent.crime_news_scrapper.middlewares import SourceThrottleMiddleware
+
+    print("=== Starting source throttle tests ===")
+
+    crawler = make_crawler({"DOWNLOAD_SLOTS": {"naszemiasto.pl": {"concurrency": 1}, "policja.gov.pl": {}},
+                            "AUTOTHROTTLE_START_DELAY": 5, "AUTOTHROTTLE_MAX_DELAY": 30})
+    middleware = SourceThrottleMiddleware.from_crawler(crawler)
+
+    def slot_of(url, **meta):
+        request = Request(url, meta=meta)
+        middleware.process_request(request)
+        return request.meta.get("download_slot")
+
+    assert slot_of("https://krakow.naszemiasto.pl/a") == slot_of("https://tarnow.naszemiasto.pl/b") == "naszemiasto.pl", \
+        "Subdomains of one source should share its slot"
+    assert slot_of("https://malopolska.policja.gov.pl/krk/") == "policja.gov.pl"
+    assert slot_of("https://notnaszemiasto.pl/a") is None, "Only whole host labels should match a source"
+    assert slot_of("https://krakow.naszemiasto.pl/a", download_slot="inny") == "inny", \
+        "An explicit download_slot should be kept"
+    print("✅ Requests grouped into per-source slots")
+
+    slot = Slot(1, 2.0)
+    crawler.engine = SimpleNamespace(downloader=SimpleNamespace(slots={"naszemiasto.pl": slot}))
+    request = Request("https://krakow.naszemiasto.pl/a", meta={"download_slot": "naszemiasto.pl"})
+
+    def respond(status, **headers):
+        middleware.process_response(request, Response(request.url, status=status, headers=headers))
+        return slot.delay
+
+    assert respond(200) == 2.0, "Successful responses should not change the delay"
+    assert respond(503) == 5.0, "The first backoff should be at least AUTOTHROTTLE_START_DELAY"
+    assert respond(503) == 10.0, "Repeated overload should double the delay"
+    assert respond(429, **{"Retry-After": "25"}) == 25.0, "Retry-After in seconds should be honoured"
+    assert respond(429, **{"Retry-After": "Sat, 04 Oct 2025 10:00:00 GMT"}) == 30.0, \
+        "An HTTP-date Retry-After should fall back to doubling, capped at AUTOTHROTTLE_MAX_DELAY"
+    assert crawler.stats.get_value("backoff/503") == 2 and crawler.stats.get_value("backoff/429") == 2
+    print("✅ 429 / 5xx back off the slot delay")
+
+    print("=== All tests passed ===")
+
+
+def test_feed_and_sitemap_parsing():
+    from datetime import datetime
+    from scrapy.http import HtmlResponse
+    from agent.crime_news_scrapper.discovery import (FeedEntry, find_feed_link, iter_feed_entries,
+                                                     pick_news_sitemap, sitemaps_from_robots)
+
+    print("=== Starting feed discovery tests ===")
+
+    rss = b"""<?xml version="1.0"?><rss version="2.0"><channel><title>Kana\xc5\x82</title>
+        <item><title>Napad na kantor</title><link>https://example.com/a1</link>
+              <pubDate>Sat, 04 Oct 2025 12:00:00 +0200</pubDate></item>
+        <item><title>Bez daty</title><link>https://example.com/a2</link></item>
+    </channel></rss>"""
+    assert list(iter_feed_entries(rss)) == [
+        FeedEntry("https://example.com/a1", "Napad na kantor", datetime(2025, 10, 4, 10, 0)),
+        FeedEntry("https://example.com/a2", "Bez daty", None),
+    ], "RSS items should give URL, title and the date in UTC"
+
+    atom = b"""<feed xmlns="http://www.w3.org/2005/Atom"><title>Kana\xc5\x82</title>
+        <entry><title>Kradzie\xc5\xbc auta</title><link rel="self" href="https://example.com/self"/>
+               <link rel="alternate" href="https://example.com/b1"/><published>2025-10-04T08:30:00Z</published></entry>
+    </feed>"""
+    assert list(iter_feed_entries(atom)) == [
+        FeedEntry("https://example.com/b1", "Kradzież auta", datetime(2025, 10, 4, 8, 30))], \
+        "Atom entries should use the alternate link"
+
+    sitemap = b"""<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"
+                          xmlns:news="http://www.google.com/schemas/sitemap-news/0.9">
+        <url><loc>https://example.com/c1</loc><news:news><news:title>Wypadek na A4</news:title>
+             <news:publication_date>2025-10-04T09:00:00+02:00</news:publication_date></news:news></url>
+    </urlset>"""
+    assert list(iter_feed_entries(sitemap)) == [
+        FeedEntry("https://example.com/c1", "Wypadek na A4", datetime(2025, 10, 4, 7, 0))], \
+        "News sitemap entries should use loc, news:title and news:publication_date"
+
+    broken = rss.replace(b"</channel></rss>", b"<item><title>Urwany")
+    assert [entry.url for entry in iter_feed_entries(broken)] == ["https://example.com/a1", "https://example.com/a2"], \
+        "Malformed XML should stop after the last complete entry"
+    assert list(iter_feed_entries(b"<html><body>Nie kana\xc5\x82</body></html>")) == [], \
+        "An HTML page has no feed entries"
+    print("✅ RSS, Atom and news sitemap entries parsed")
+
+    page = HtmlResponse("https://example.com/wiadomosci", body=b"""<html><head>
+        <link rel="alternate" hreflang="en" href="/en/">
+        <link rel="alternate" type="application/rss+xml" href="/rss.xml">
+    </head></html>""")
+    assert find_feed_link(page) == "https://example.com/rss.xml", "The RSS link should be resolved against the page"
+    assert find_feed_link(HtmlResponse("https://example.com/", body=b"<html></html>")) is None
+    print("✅ Feed link found in <link rel=alternate>")
+
+    robots = """User-agent: *
+Disallow: /admin
+Sitemap: https://example.com/sitemap.xml
+sitemap: https://example.com/news-sitemap.xml  # news
+"""
+    urls = sitemaps_from_robots(robots)
+    assert urls == ["https://example.com/sitemap.xml", "https://example.com/news-sitemap.xml"], \
+        "Sitemap lines should be read case-insensitively without comments"
+    assert pick_news_sitemap(urls) == "https://example.com/news-sitemap.xml", "The news sitemap should be picked"
+    assert pick_news_sitemap(["https://example.com/sitemap.xml"]) is None, "Plain sitemaps should be skipped"
+    print("✅ News sitemap picked from robots.txt")
+
+    print("=== All tests passed ===")
+
+
+def scanned_statistics(manager):
+    """Liczniki policzone pełnym skanem - wzorzec dla tabel utrzymywanych przez triggery"""
+    conn = manager.get_connection()
+    sources = {row[0]: (row[1], row[2]) for row in conn.execute(
+        "SELECT COALESCE(source, 'unknown'), COUNT(*), SUM(is_processed != 0) FROM raw_articles GROUP BY 1")}
+    crime_types = {row[0]: row[1] for row in conn.execute(
+        "SELECT COALESCE(crime_type, 'inne'), COUNT(*) FROM processed_articles GROUP BY 1")}
+    return sources, crime_types
+
+
+def check_statistics(manager):
+    stats = manager.get_statistics()
+    sources, crime_types = scanned_statistics(manager)
+    assert {s["source"]: (s["total"], s["processed"]) for s in stats["sources"]} == sources, \
+        "source_stats should match a scan of raw_articles"
+    assert stats["crime_types"] == crime_types, "crime_type_stats should match a scan of processed_articles"
+
+
+def test_stats_triggers():
+    print("=== Starting statistics trigger tests ===")
+
+    manager = make_manager()
+    manager.save_raw_article("https://example.com/s1", "Pierwszy", "Treść pierwsza", "tvn24")
+    manager.save_raw_article("https://example.com/s2", "Drugi", "Treść druga", "tvn24")
+    manager.save_article("https://example.com/s3", "Trzeci", "Treść trzecia", "fakt",
+                         "kradzież", "Kraków", "Streszczenie", "kradzież", 50.06, 19.94)
+    check_statistics(manager)
+    assert manager.get_statistics()["pending"] == 2, "Two articles are not processed yet"
+    print("✅ Inserts counted")
+
+    with manager.transaction() as cursor:
+        cursor.execute("UPDATE raw_articles SET is_processed = 1 WHERE url = 'https://example.com/s1'")
+        cursor.execute("UPDATE raw_articles SET source = 'policja' WHERE url = 'https://example.com/s2'")
+        cursor.execute("UPDATE processed_articles SET crime_type = 'napad'")
+    check_statistics(manager)
+    print("✅ Updates of is_processed, source and crime_type counted")
+
+    with manager.transaction() as cursor:
+        cursor.execute("DELETE FROM processed_articles")
+        cursor.execute("DELETE FROM raw_articles WHERE url = 'https://example.com/s1'")
+    check_statistics(manager)
+    stats = manager.get_statistics()
+    assert stats["total_articles"] == 2 and stats["crime_types"] == {}, "Deleted rows should leave the counters"
+    print("✅ Deletes counted")
+
+    print("=== All tests passed ===")
+
+
+def test_normalize_location():
+    print("=== Starting normalize_location tests ===")
+
+    assert normalize_location("ul. Wielicka, Kraków") == \
+        ("Wielicka, Kraków", "Kraków", "wielicka, krakow", "krakow")
+    # Prefiks, wielkość liter, polskie znaki i odstępy nie zmieniają klucza
+    for variant in ("Wielicka, Kraków", "ulica Wielicka,  KRAKÓW", "Ul.Wielicka, krakow"):
+        assert normalize_location(variant)[2] == "wielicka, krakow", f"Unexpected key for {variant!r}"
+    assert normalize_location("Łódź")[2:] == ("lodz", "lodz"), "ł and other diacritics should be folded"
+    assert normalize_location("os. Piastów, Kraków")[3] == normalize_location("Kraków")[3], \
+        "Places in one municipality should share its key"
+    print("✅ Variants of one place map to one key")
+
+    for empty in (None, "", " , ", "ul. , -"):
+        assert normalize_location(empty) is None, f"{empty!r} has no place name"
+    print("✅ Empty names rejected")
+
+    manager = make_manager()
+    for i, location in enumerate(("ul. Wielicka, Kraków", "Wielicka, KRAKÓW", "os. Piastów, Kraków", "Tarnów")):
+        manager.save_article(f"https://example.com/l{i}", f"Artykuł {i}", "Treść", "test",
+                             "kradzież", location, "Streszczenie", "kradzież", 50.0, 19.9)
+    places = {row["name"]: row["count"] for row in manager.get_location_stats(by_municipality=False)}
+    assert places == {"Wielicka, Kraków": 2, "Piastów, Kraków": 1, "Tarnów": 1}, \
+        "Spelling variants should share one locations row"
+    municipalities = {row["name"]: row["count"] for row in manager.get_location_stats()}
+    assert municipalities == {"Kraków": 3, "Tarnów": 1}, "Places should group by municipality"
+    print("✅ get_location_stats groups by place and municipality")
+
+    print("=== All tests passed ===")
+
+
+def test_url_seen_index_save_and_reload():
+    print("=== Starting URL-seen index tests ===")
+
+    manager = make_manager()
+    for i in range(50):
+        manager.save_raw_article(f"https://example.com/seen/{i}", f"Artykuł {i}", "Treść", "test")
+
+    index = UrlSeenIndex(manager, capacity=200)
+    assert all(f"https://example.com/seen/{i}" in index for i in range(50)), "Saved URLs should be seen"
+    assert "https://example.com/seen/7#komentarze" in index, "The #fragment should not matter"
+    index.save()
+
+    # Zapisy innego procesu po zapisaniu filtra
+    for i in range(50, 60):
+        manager.save_raw_article(f"https://example.com/seen/{i}", f"Artykuł {i}", "Treść", "test")
+
+    stored = manager.get_connection().execute(
+        "SELECT bits, covered_id FROM bloom_filters WHERE name = ?", (UrlSeenIndex.NAME,)).fetchone()
+    reloaded = UrlSeenIndex(manager, capacity=200)
+    assert reloaded.capacity == 200 and stored["covered_id"] == 50, "The saved filter should be reused"
+    assert all(f"https://example.com/seen/{i}" in reloaded for i in range(60)), \
+        "Reloaded filter should cover saved URLs and catch up on newer ones"
+    assert not any(f"https://example.com/unseen/{i}" in reloaded for i in range(200)), \
+        "Unsaved URLs should not be seen"
+    assert len(reloaded) == 60, "All stored URLs should be counted"
+    print("✅ Bloom filter saved, reloaded and caught up")
+
+    reloaded.add("https://example.com/queued")
+    assert "https://example.com/queued" in reloaded, "URLs added in this session should be seen before saving"
+
+    # Filtr zapisany z pojemnością mniejszą niż obecna liczba URL (przepełniony)
+    small = UrlSeenIndex(manager, capacity=10)
+    small._reset(32)
+    small._catch_up()
+    small.save()
+    grown = UrlSeenIndex(manager, capacity=10)
+    assert grown.capacity >= 2 * 60, "A saved filter smaller than seen_urls should be rebuilt larger"
+    assert all(f"https://example.com/seen/{i}" in grown for i in range(60)), "Rebuilt filter should keep all URLs"
+    print("✅ Overfull filter rebuilt from seen_urls")
+
+    print("=== All tests passed ===")
+
+
+def test_repeated_article_saved_once():
+    article = dict(url="https://example.com/twice", title="Napad na sklep", raw_text="Treść " * 20,
+                   source="test", crime_type="napad", location="Kraków", summary="Napad",
+                   keywords="napad", latitude=50.06, longitude=19.94)
+
+    print("=== Starting repeated article tests ===")
+
+    manager = make_manager()
+    first = manager.save_article(**article)
+    assert manager.save_article(**article) == first, "The same URL should map to one raw article"
+
+    # Te same rekordy przez zapis w tle, także w jednej paczce
+    writer = AsyncArticleWriter(manager, flush_interval_ms=50)
+    writer.submit_article(**article)
+    writer.submit_article(**dict(article, url="https://example.com/other"))
+    writer.submit_article(**dict(article, url="https://example.com/other"))
+    writer.close()
+
+    conn = manager.get_connection()
+    counts = dict(conn.execute("""
+        SELECT r.url, COUNT(p.id) FROM raw_articles r
+        LEFT JOIN processed_articles p ON p.raw_article_id = r.id GROUP BY r.url"""
+                               ).fetchall())
+    assert counts == {"https://example.com/twice": 1, "https://example.com/other": 1}, \
+        "Each article should have exactly one processed row"
+    assert manager.get_statistics()["crime_types"] == {"napad": 2}, "Repeats should not be counted"
+    fts_integrity_check(manager)
+    print("✅ Repeated submits add no processed rows")
+
+    print("=== All tests passed ===")
+
+
+def test_article_text_round_trip():
+    text = "Kradzież roweru na ul. Wielickiej w Krakowie. " * 20
+
+    print("=== Starting article_text round-trip tests ===")
+
+    manager = make_manager()
+    article_id, inserted = manager.save_raw_article("https://example.com/a", "Kradzież", text, "test")
+    assert inserted, "First save should insert the article"
+
+    stored = manager.get_connection().execute(
+        "SELECT raw_text FROM raw_articles WHERE id = ?", (article_id,)).fetchone()[0]
+    assert isinstance(stored, bytes) and stored[:1] in (TextCodec.ZLIB, TextCodec.ZSTD), \
+        "Long text should be stored compressed"
+    assert manager.get_article_text(article_id) == text, "get_article_text should decompress"
+    assert manager.get_connection().execute(
+        "SELECT article_text(raw_text) FROM raw_articles WHERE id = ?", (article_id,)).fetchone()[0] == text, \
+        "article_text() should decompress in SQL"
+    print("✅ Compressed text decompressed through article_text")
+
+    short_id, _ = manager.save_raw_article("https://example.com/b", "Krótki", "abc", "test")
+    assert manager.get_article_text(short_id) == "abc", "Short text is kept as plain TEXT"
+    print("✅ Short text stored and read back as TEXT")
+
+    print("=== All tests passed ===")
+
+
+def test_dictionary_trained_by_another_process():
+    if zstandard is None:
+        pytest.skip("zstandard not installed")
+
+    print("=== Starting zstd dictionary tests ===")
+
+    reader = make_manager()
+    # Drugi menedżer na tym samym pliku = inny proces, który wytrenował słownik
+    writer = DatabaseManager(reader.db_path)
+    samples = [(f"Policja z Krakowa informuje o zdarzeniu nr {i}. "
+                f"Sprawca uciekł w kierunku ulicy {i % 37}. Komunikat KMP. " * 5).encode("utf-8")
+               for i in range(400)]
+    zdict = zstandard.train_dictionary(4096, samples)
+    with writer.transaction() as cursor:
+        cursor.execute("INSERT INTO text_dictionaries (id, data) VALUES (?, ?)",
+                       (zdict.dict_id(), zdict.as_bytes()))
+    writer.codec.add_dictionary(zdict.dict_id(), zdict.as_bytes())
+
+    text = samples[7].decode("utf-8")
+    article_id, _ = writer.save_raw_article("https://example.com/z", "Zdarzenie", text, "test")
+    assert zdict.dict_id() not in reader.codec.dictionaries, "Reader should not know the dictionary yet"
+    assert reader.get_connection().execute(
+        "SELECT article_text(raw_text) FROM raw_articles WHERE id = ?", (article_id,)).fetchone()[0] == text, \
+        "Unknown dictionary should be loaded from text_dictionaries"
+    assert reader.codec.active_dict_id is None, "A loaded dictionary must not become active for writes"
+    print("✅ Dictionary trained elsewhere loaded on demand")
+
+    with writer.transaction() as cursor:
+        cursor.execute("DELETE FROM text_dictionaries")
+    with pytest.raises(LookupError):
+        make_manager().codec.decompress(writer.get_connection().execute(
+            "SELECT raw_text FROM raw_articles WHERE id = ?", (article_id,)).fetchone()[0])
+    print("✅ Missing dictionary raises a clear error")
+
+    print("=== All tests passed ===")
+
+
+if __name__ == "__main__":
+    test_fts_triggers()
+    test_nested_transaction_rolls_back_savepoint()
+    test_resave_marks_last_seen()
+    test_article_leases()
+    test_conditional_get_middleware()
+    test_source_throttle_middleware()
+    test_feed_and_sitemap_parsing()
+    test_stats_triggers()
+    test_normalize_location()
+    test_url_seen_index_save_and_reload()
+    test_repeated_article_saved_once()
+    test_article_text_round_trip()
+    test_dictionary_trained_by_another_process()
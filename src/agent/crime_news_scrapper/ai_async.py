@@ -0,0 +1,102 @@
+import logging
+import threading
+import time
+
+from geopy.extra.rate_limiter import RateLimiter
+from twisted.internet import threads
+from twisted.internet.defer import DeferredQueue
+from twisted.python.threadpool import ThreadPool
+from scrapy.utils.defer import maybe_deferred_to_future
+
+logger = logging.getLogger(__name__)
+
+
+class RequestsPerMinute:
+    """
+    Limit zapytań do API modelu na minutę, wspólny dla wątków DeferredAIFilter.
+
+    acquire() rezerwuje miejsce w bieżącej minucie. Gdy limit jest wyczerpany,
+    czeka pod blokadą - pozostałe wątki czekają na nową minutę razem z nim,
+    zamiast przekroczyć limit licznikiem czytanym bez blokady.
+    """
+
+    def __init__(self, limit: int, on_reset=None):
+        self.limit = limit
+        self.on_reset = on_reset
+        self.count = 0
+        self.minute_start = time.time()
+        self._lock = threading.Lock()
+
+    def _reset(self):
+        self.count = 0
+        self.minute_start = time.time()
+        if self.on_reset is not None:
+            self.on_reset()
+
+    def acquire(self):
+        with self._lock:
+            if time.time() - self.minute_start > 60:
+                self._reset()
+            if self.count >= self.limit:
+                wait_time = 60 - (time.time() - self.minute_start) + 2
+                logger.warning(f"LIMIT! Osiągnięto {self.count} req. Czekam {wait_time:.0f}s...")
+                time.sleep(wait_time)
+                self._reset()
+            self.count += 1
+
+
+def nominatim_geocode(geolocator):
+    """geolocator.geocode z polityką Nominatim (max 1 zapytanie/s); RateLimiter geopy jest bezpieczny dla wątków"""
+    return RateLimiter(geolocator.geocode, min_delay_seconds=1,
+                       max_retries=0, swallow_exceptions=False)
+
+
+class DeferredAIFilter:
+    """
+    Nieblokująca nakładka na CrimeFilterLocal (dowolny backend).
+
+    Wywołania LLM (blokujące requests/SDK) idą do ograniczonej puli wątków,
+    a spider dostaje Deferred - reaktor w tym czasie dalej pobiera strony.
+    Pula jest osobna od puli reaktora, żeby wolny model nie zajął wątków DNS.
+    """
+
+    def __init__(self, ai_filter, max_threads: int = 4):
+        self.ai_filter = ai_filter
+        self.pool = ThreadPool(minthreads=1, maxthreads=max_threads, name="ai-filter")
+        self.pool.start()
+
+    def _call(self, fn, *args):
+        # Import w metodzie: reaktor instaluje Scrapy (asyncio), nie ten moduł
+        from twisted.internet import reactor
+        return threads.deferToThreadPool(reactor, self.pool, fn, *args)
+
+    def is_crime_related(self, title: str, teaser: str = "", content: str = ""):
+        """Deferred[bool]"""
+        return self._call(self.ai_filter.is_crime_related, title, teaser, content)
+
+    def extract_event_info(self, title: str, teaser: str = "", content: str = ""):
+        """Deferred[dict]"""
+        return self._call(self.ai_filter.extract_event_info, title, teaser, content)
+
+    async def filter_crime_related(self, candidates):
+        """
+        Dla listy (title, payload) zwraca (async for) te, które przeszły filtr,
+        w kolejności ZAKOŃCZENIA klasyfikacji, nie w kolejności na stronie -
+        pierwsze żądania ruszają, zanim model oceni resztę tytułów.
+        """
+        done = DeferredQueue()
+        for title, payload in candidates:
+            d = self.is_crime_related(title)
+            d.addCallbacks(lambda ok, t=title, p=payload: done.put((t, p, ok, None)),
+                           lambda f, t=title, p=payload: done.put((t, p, False, f)))
+
+        for _ in range(len(candidates)):
+            title, payload, ok, failure = await maybe_deferred_to_future(done.get())
+            if failure is not None:
+                logger.error(f"Błąd filtra AI dla '{title[:50]}': {failure.getErrorMessage()}")
+            elif ok:
+                yield title, payload
+
+    def close(self):
+        """Czeka na bieżące wywołania i zatrzymuje wątki puli"""
+        self.pool.stop()
@@ -1,10 +1,11 @@
 import logging
 import json
 import os
-import time
+import threading
 import google.generativeai as genai
 from geopy.geocoders import Nominatim
 from geopy.exc import GeocoderTimedOut
+from agent.crime_news_scrapper.ai_async import RequestsPerMinute, nominatim_geocode
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
@@ -35,11 +36,12 @@ class CrimeFilterLocal:
         logger.info("Model: gemini-pro")
         logger.info("Limit: 60 requestów/minutę (DARMOWE)")
         
-        # Rate limiting
-        self.request_count = 0
-        self.last_minute_start = time.time()
-        self.max_requests_per_minute = 12  # Bezpieczny margines (15-3)
+        # Rate limiting - bezpieczny margines (15-3); co minutę zapis cache
+        self.rate_limit = RequestsPerMinute(12, on_reset=self._save_cache)
         
+        # Filtr bywa wołany z wielu wątków (DeferredAIFilter) - zapis cache pod blokadą
+        self._cache_lock = threading.Lock()
+
         # Cache
         self.filter_cache = {}
         self.extract_cache = {}
@@ -48,6 +50,7 @@ class CrimeFilterLocal:
         
         # Geokoder z cache
         self.geolocator = Nominatim(user_agent="krakow_crime_gemini", timeout=10)
+        self.geocode = nominatim_geocode(self.geolocator)
         self.geocode_cache = {}
 
     def _load_cache(self):
@@ -67,35 +70,21 @@ class CrimeFilterLocal:
         """Zapisz cache na dysk"""
         try:
             os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
-            with open(self.cache_file, 'w', encoding='utf-8') as f:
-                json.dump({
-                    'filter': self.filter_cache,
-                    'extract': self.extract_cache,
-                    'geocode': self.geocode_cache
-                }, f, ensure_ascii=False, indent=2)
+            with self._cache_lock:
+                # Kopie: inne wątki mogą dopisywać do cache w trakcie zapisu
+                snapshot = {
+                    'filter': dict(self.filter_cache),
+                    'extract': dict(self.extract_cache),
+                    'geocode': dict(self.geocode_cache)
+                }
+                with open(self.cache_file, 'w', encoding='utf-8') as f:
+                    json.dump(snapshot, f, ensure_ascii=False, indent=2)
         except Exception as e:
             logger.error(f"Błąd zapisu cache: {e}")
 
-    def check_rate_limit(self):
-        """Sprawdza i egzekwuje limit RPM"""
-        if time.time() - self.last_minute_start > 60:
-            self.request_count = 0
-            self.last_minute_start = time.time()
-            logger.info("Reset licznika requestów")
-            self._save_cache()
-        
-        if self.request_count >= self.max_requests_per_minute:
-            elapsed = time.time() - self.last_minute_start
-            if elapsed < 60:
-                wait_time = 60 - elapsed + 2
-                logger.warning(f"LIMIT! Czekam {wait_time:.0f}s...")
-                time.sleep(wait_time)
-                self.request_count = 0
-                self.last_minute_start = time.time()
-
     def ask_llm(self, prompt: str) -> str:
         """Wysyła zapytanie do Gemini"""
-        self.check_rate_limit()
+        self.rate_limit.acquire()
         
         try:
             response = self.model.generate_content(
@@ -106,8 +95,6 @@ class CrimeFilterLocal:
                 }
             )
             
-            self.request_count += 1
-            
             return response.text.strip()
                 
         except Exception as e:
@@ -259,7 +246,7 @@ WAŻNE:
             full_address = f"{location_name}, Kraków, Polska"
             logger.info(f"Geokodowanie: {full_address}")
             
-            location = self.geolocator.geocode(full_address, language="pl")
+            location = self.geocode(full_address, language="pl")
             
             if location:
                 coords = (location.latitude, location.longitude)
@@ -267,7 +254,7 @@ WAŻNE:
                 self.geocode_cache[location_name] = coords
                 return coords
             
-            location = self.geolocator.geocode(f"{location_name}, Polska", language="pl")
+            location = self.geocode(f"{location_name}, Polska", language="pl")
             if location:
                 coords = (location.latitude, location.longitude)
                 self.geocode_cache[location_name] = coords
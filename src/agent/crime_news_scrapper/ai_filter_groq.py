@@ -1,10 +1,11 @@
 import logging
 import json
 import os
-import time
+import threading
 from groq import Groq
 from geopy.geocoders import Nominatim
 from geopy.exc import GeocoderTimedOut
+from agent.crime_news_scrapper.ai_async import RequestsPerMinute, nominatim_geocode
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
@@ -31,12 +32,14 @@ class CrimeFilterLocal:
         logger.info(f"Model: {self.model}")
         logger.info("Limit: 30 requestów/minutę (DARMOWE)")
 
-        self.request_count = 0
-        self.last_minute_start = time.time()
-        self.max_requests_per_minute = 25
+        self.rate_limit = RequestsPerMinute(25)
 
         self.geolocator = Nominatim(user_agent="malopolska_crime_groq", timeout=10)
 
+        self.geocode = nominatim_geocode(self.geolocator)
+        # Filtr bywa wołany z wielu wątków (DeferredAIFilter) - zapis cache pod blokadą
+        self._cache_lock = threading.Lock()
+
         # NOWOŚĆ: Cache, aby nie przetwarzać ponownie tych samych artykułów
         self.filter_cache = {}
         self.extract_cache = {}
@@ -59,28 +62,20 @@ class CrimeFilterLocal:
     def _save_cache(self):
         try:
             os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
-            with open(self.cache_file, 'w', encoding='utf-8') as f:
-                json.dump({
-                    'filter': self.filter_cache,
-                    'extract': self.extract_cache,
-                    'geocode': self.geocode_cache
-                }, f, ensure_ascii=False, indent=2)
+            with self._cache_lock:
+                # Kopie: inne wątki mogą dopisywać do cache w trakcie zapisu
+                snapshot = {
+                    'filter': dict(self.filter_cache),
+                    'extract': dict(self.extract_cache),
+                    'geocode': dict(self.geocode_cache)
+                }
+                with open(self.cache_file, 'w', encoding='utf-8') as f:
+                    json.dump(snapshot, f, ensure_ascii=False, indent=2)
         except Exception as e:
             logger.error(f"Błąd zapisu cache: {e}")
 
-    def check_rate_limit(self):
-        if time.time() - self.last_minute_start > 60:
-            self.request_count = 0
-            self.last_minute_start = time.time()
-        if self.request_count >= self.max_requests_per_minute:
-            wait_time = 60 - (time.time() - self.last_minute_start) + 2
-            logger.warning(f"LIMIT! Osiągnięto {self.request_count} req. Czekam {wait_time:.0f}s...")
-            time.sleep(wait_time)
-            self.request_count = 0
-            self.last_minute_start = time.time()
-
     def ask_llm(self, system_prompt: str, user_prompt: str) -> str:
-        self.check_rate_limit()
+        self.rate_limit.acquire()
         try:
             response = self.client.chat.completions.create(
                 model=self.model,
@@ -91,7 +86,6 @@ class CrimeFilterLocal:
                 temperature=0.1,
                 max_tokens=500
             )
-            self.request_count += 1
             return response.choices[0].message.content.strip()
         except Exception as e:
             logger.error(f"Błąd Groq: {e}")
@@ -189,7 +183,7 @@ Zwróć TYLKO JSON:"""
         try:
             full_address = f"{location_name}, Małopolska, Polska"
             logger.info(f"Geokodowanie: {full_address}")
-            location = self.geolocator.geocode(full_address, language="pl")
+            location = self.geocode(full_address, language="pl")
             if location:
                 coords = (location.latitude, location.longitude)
                 self.geocode_cache[location_name] = coords
@@ -197,7 +191,7 @@ Zwróć TYLKO JSON:"""
                 return coords
 
             logger.warning(f"Nie znaleziono w Małopolsce, próba ogólna: {location_name}")
-            location = self.geolocator.geocode(f"{location_name}, Polska", language="pl")
+            location = self.geocode(f"{location_name}, Polska", language="pl")
             if location:
                 coords = (location.latitude, location.longitude)
                 self.geocode_cache[location_name] = coords
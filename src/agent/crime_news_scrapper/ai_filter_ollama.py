@@ -1,9 +1,11 @@
 import logging
 import json
 import os
+import threading
 import requests
 from geopy.geocoders import Nominatim
 from geopy.exc import GeocoderTimedOut
+from agent.crime_news_scrapper.ai_async import nominatim_geocode
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
@@ -56,6 +58,9 @@ class CrimeFilterLocal:
         logger.info("ZERO limitów API!")
         logger.info("Działa offline")
         
+        # Filtr bywa wołany z wielu wątków (DeferredAIFilter) - zapis cache pod blokadą
+        self._cache_lock = threading.Lock()
+
         # Cache
         self.filter_cache = {}
         self.extract_cache = {}
@@ -64,6 +69,7 @@ class CrimeFilterLocal:
         
         # Geokoder z cache
         self.geolocator = Nominatim(user_agent="krakow_crime_ollama", timeout=10)
+        self.geocode = nominatim_geocode(self.geolocator)
         self.geocode_cache = {}
         logger.info(f"Cache: {len(self.filter_cache)} filtrów, {len(self.geocode_cache)} lokalizacji")
 
@@ -84,12 +90,15 @@ class CrimeFilterLocal:
         """Zapisz cache"""
         try:
             os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
-            with open(self.cache_file, 'w', encoding='utf-8') as f:
-                json.dump({
-                    'filter': self.filter_cache,
-                    'extract': self.extract_cache,
-                    'geocode': self.geocode_cache
-                }, f, ensure_ascii=False, indent=2)
+            with self._cache_lock:
+                # Kopie: inne wątki mogą dopisywać do cache w trakcie zapisu
+                snapshot = {
+                    'filter': dict(self.filter_cache),
+                    'extract': dict(self.extract_cache),
+                    'geocode': dict(self.geocode_cache)
+                }
+                with open(self.cache_file, 'w', encoding='utf-8') as f:
+                    json.dump(snapshot, f, ensure_ascii=False, indent=2)
             logger.info("Cache Ollama zapisany.")
         except Exception as e:
             logger.error(f"Błąd zapisu cache: {e}")
@@ -275,7 +284,7 @@ WAŻNE:
             full_address = f"{location_name}, Małopolska, Polska"
             logger.info(f"Geokodowanie: {full_address}")
             
-            location = self.geolocator.geocode(full_address, language="pl")
+            location = self.geocode(full_address, language="pl")
             
             if location:
                 coords = (location.latitude, location.longitude)
@@ -284,7 +293,7 @@ WAŻNE:
                 return coords
             
             # Fallback bez Małopolski
-            location = self.geolocator.geocode(f"{location_name}, Polska", language="pl")
+            location = self.geocode(f"{location_name}, Polska", language="pl")
             if location:
                 coords = (location.latitude, location.longitude)
                 self.geocode_cache[location_name] = coords
@@ -0,0 +1,138 @@
+"""
+Odkrywanie artykułów z kanałów RSS / Atom i sitemap Google News.
+
+Kanał strony znajdujemy w <link rel="alternate"> jej HTML, a sitemapę news
+w liniach "Sitemap:" pliku robots.txt serwisu.
+
+Kanał daje tytuły, daty i URL w jednym małym pliku zamiast ciężkiej strony
+HTML z setkami linków. XML czytamy strumieniowo (iterparse) i czyścimy
+przetworzone elementy, więc pamięć nie rośnie z rozmiarem kanału.
+"""
+import io
+import logging
+from collections import namedtuple
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+from lxml import etree
+
+logger = logging.getLogger(__name__)
+
+FeedEntry = namedtuple("FeedEntry", "url title published")
+
+FEED_TYPES = ("application/rss+xml", "application/atom+xml")
+
+# Elementy jednego wpisu: <item> (RSS), <entry> (Atom), <url> (sitemapa)
+_ENTRY_TAGS = {"item", "entry", "url"}
+
+
+def _local(tag):
+    return tag.rsplit("}", 1)[-1] if isinstance(tag, str) else ""
+
+
+def parse_date(text):
+    """RFC 822 (RSS) albo ISO 8601 (Atom, sitemapa, <time>) -> naiwny datetime w UTC z dokładnością do sekundy"""
+    if not text:
+        return None
+    text = text.strip()
+    try:
+        dt = parsedate_to_datetime(text)
+    except (TypeError, ValueError):
+        try:
+            dt = datetime.fromisoformat(text.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt.replace(microsecond=0)
+
+
+def _entry(elem):
+    url = title = published = None
+    for child in elem.iter():
+        name = _local(child.tag)
+        text = (child.text or "").strip()
+        if name == "link":
+            # Atom: <link rel="alternate" href="..."/>, RSS: <link>url</link>
+            href = child.get("href")
+            if href and child.get("rel", "alternate") == "alternate":
+                url = url or href
+            elif text:
+                url = url or text
+        elif name == "loc" and _local(elem.tag) == "url":
+            url = url or text
+        elif name == "title" and text:
+            # news:title w sitemapie, title w RSS / Atom
+            title = title or text
+        elif name in ("pubDate", "published", "updated", "publication_date", "date"):
+            published = published or parse_date(text)
+    return FeedEntry(url, title, published) if url else None
+
+
+def iter_feed_entries(data: bytes):
+    """
+    Wpisy kanału RSS / Atom lub sitemapy news w kolejności z pliku.
+    Uszkodzony XML kończy iterację (z ostrzeżeniem) po ostatnim dobrym wpisie.
+    """
+    parser = etree.iterparse(io.BytesIO(data), events=("end",), resolve_entities=False,
+                             no_network=True, recover=False)
+    try:
+        for _, elem in parser:
+            if _local(elem.tag) not in _ENTRY_TAGS:
+                continue
+            # <url> wewnątrz wpisu Atom/RSS to nie wpis sitemapy
+            parent = elem.getparent()
+            if parent is not None and _local(parent.tag) in _ENTRY_TAGS:
+                continue
+            entry = _entry(elem)
+            # Zwolnij przetworzony wpis i rodzeństwo przed nim
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+            if entry is not None:
+                yield entry
+    except etree.XMLSyntaxError as e:
+        logger.warning(f"Niepoprawny XML kanału: {e}")
+
+
+def find_feed_link(response):
+    """URL kanału RSS / Atom z <link rel="alternate"> strony HTML albo None"""
+    for link in response.css('link[rel="alternate"]'):
+        if link.attrib.get("type", "").lower() in FEED_TYPES and link.attrib.get("href"):
+            return response.urljoin(link.attrib["href"])
+    return None
+
+
+def article_published(response):
+    """Data publikacji z <meta> lub <time> strony artykułu (jak parse_date) albo None"""
+    for value in response.css('meta[property="article:published_time"]::attr(content), '
+                              'meta[itemprop="datePublished"]::attr(content), '
+                              'time::attr(datetime)').getall():
+        published = parse_date(value)
+        if published is not None:
+            return published
+    return None
+
+
+def sitemaps_from_robots(text: str):
+    """URL-e z linii "Sitemap:" pliku robots.txt (w kolejności z pliku)"""
+    urls = []
+    for line in text.splitlines():
+        field, _, value = line.partition(":")
+        value = value.split("#", 1)[0].strip()
+        if field.strip().lower() == "sitemap" and value:
+            urls.append(value)
+    return urls
+
+
+def pick_news_sitemap(urls):
+    """
+    Sitemapa news spośród sitemap z robots.txt albo None.
+    Zwykłe sitemapy (cały serwis, indeksy) pomijamy - strona z listą zostaje
+    wtedy przy zbieraniu linków z HTML.
+    """
+    for url in urls:
+        if "news" in urlparse(url).path.lower():
+            return url
+    return None
@@ -2,11 +2,20 @@ import scrapy
 import os
 import json
 import logging
-from datetime import date, datetime, timedelta
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
 from urllib.parse import urlparse, urljoin
 
+from scrapy.exceptions import IgnoreRequest
+from scrapy.spidermiddlewares.httperror import HttpError
+from scrapy.utils.defer import maybe_deferred_to_future
+
 from agent.crime_news_scrapper.ai_filter_ollama import CrimeFilterLocal
-from agent.db import initialize_db_manager
+from agent.crime_news_scrapper.ai_async import DeferredAIFilter
+from agent.crime_news_scrapper.discovery import (iter_feed_entries, find_feed_link, article_published,
+                                                 sitemaps_from_robots, pick_news_sitemap)
+from agent.crime_news_scrapper import settings as crawl_settings
+from agent.db import initialize_db_manager, AsyncArticleWriter, UrlSeenIndex
 
 logger = logging.getLogger(__name__)
 
@@ -55,10 +64,10 @@ class MalopolskaCrimeSpider(scrapy.Spider):
     ]
 
     custom_settings = {
+        # Sloty per źródło, AutoThrottle, zapytania warunkowe, cache (settings.py)
+        **crawl_settings.SHARED_SPIDER_SETTINGS,
         'USER_AGENT': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
         'ROBOTSTXT_OBEY': False,
-        'DOWNLOAD_DELAY': 2.0,
-        'CONCURRENT_REQUESTS': 2,
         'COOKIES_ENABLED': False,
         'LOG_LEVEL': 'INFO',
         'CLOSESPIDER_PAGECOUNT': 100,
@@ -67,6 +76,13 @@ class MalopolskaCrimeSpider(scrapy.Spider):
         'DOWNLOAD_TIMEOUT': 30,
     }
 
+    # Serwisy, z których bierzemy artykuły (linki i wpisy kanałów spoza nich pomijamy)
+    SOURCE_DOMAINS = ['tvn24.pl', 'naszemiasto.pl', 'gazetakrakowska.pl',
+                      'fakt.pl', 'policja.gov.pl']
+
+    # Wpisy kanału starsze niż tyle dni pomijamy bez pytania AI
+    FEED_MAX_AGE_DAYS = 7
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -88,52 +104,142 @@ class MalopolskaCrimeSpider(scrapy.Spider):
 
 
         # Model AI (Ollama - lokalny!)
-        self.ai_filter = CrimeFilterLocal()
+        # Scheduler (run_scheduler.py) wstrzykuje wspólny, "ciepły" filtr AI i indeks URL
+        self.ai_filter = kwargs.get("ai_filter") or CrimeFilterLocal()
+        # Wywołania modelu w puli wątków - reaktor nie czeka na Ollamę
+        self.ai = DeferredAIFilter(self.ai_filter, max_threads=int(kwargs.get("ai_threads", 4)))
         self.db = initialize_db_manager("data/crime_data.db")
 
-        self.processed_urls = self._load_processed_urls()
-        self.logger.info(f"Wczytano {len(self.processed_urls)} przetworzonych URL (ostatnie 7 dni)")
+        # Wszystkie zapisane URL (cała historia) - filtr Blooma + indeks w bazie
+        # URL-e artykułów przetwarzanych w tej chwili (między sprawdzeniem a zapisem)
+        self.in_flight = set()
+        self.seen_urls = kwargs.get("seen_urls")
+        if self.seen_urls is None:
+            self.seen_urls = UrlSeenIndex(self.db)
+        self.logger.info(f"Indeks odwiedzonych URL: {len(self.seen_urls)} wpisów")
 
         self.stats = {
             "visited_pages": 0,
+            "visited_feeds": 0,
+            "old_feed_entries_skipped": 0,
             "articles_checked": 0,
             "passed_ai_filter": 0,
+            "queued_to_db": 0,
             "saved_to_db": 0,
+            "db_write_errors": 0,
             "duplicates_skipped": 0,
             "errors": 0,
         }
         
         self.scrape_start = datetime.now()
 
-    def _load_processed_urls(self):
-        """Wczytuje TYLKO URL z ostatnich 7 dni (nie przetwarza starych)"""
-        processed = set()
-        conn = self.db.get_connection()
-        
-        try:
-            week_ago = (datetime.now() - timedelta(days=7)).isoformat()
-            
-            for row in conn.execute(
-                "SELECT url FROM raw_articles WHERE scraped_at > ?",
-                (week_ago,)
-            ):
-                processed.add(row[0])
-                
-        except Exception as e:
-            logger.warning(f"Błąd ładowania cache: {e}")
-        
-        return processed
+        # Sitemapa news z robots.txt obejmuje cały serwis, więc zastępuje stronę
+        # z listą tylko na hostach z jedną stroną startową - inaczej regionalne
+        # i tematyczne listy (fakt.pl/krakow, tagi policji) dostałyby cały serwis
+        hosts = Counter(urlparse(url).netloc for url in self.start_urls)
+        self.sitemap_hosts = {host for host, count in hosts.items() if count == 1}
+
+        # Zapis w tle - callbacki nie czekają na commit/fsync SQLite.
+        # saved_to_db i db_write_errors aktualizuje wątek zapisu
+        self.writer = AsyncArticleWriter(self.db, stats=self.stats)
+
+    async def start(self):
+        """
+        Dla stron ze znanym kanałem RSS/Atom/sitemapą pobiera kanał zamiast HTML.
+        Kanał wspólny dla kilku stron z listą pobieramy raz.
+        """
+        feeds = {}
+        for url in self.start_urls:
+            feed_url = self.db.get_feed(url)
+            if feed_url:
+                feeds.setdefault(feed_url, []).append(url)
+            else:
+                yield self._listing_request(url)
+
+        for feed_url, listing_urls in feeds.items():
+            yield scrapy.Request(
+                feed_url,
+                callback=self.parse_feed,
+                errback=self.feed_failed,
+                meta={"listing_urls": listing_urls, "conditional_get": True},
+                dont_filter=True,
+            )
+
+    def _listing_request(self, url):
+        return scrapy.Request(url, callback=self.parse, meta={"listing_url": url}, dont_filter=True)
+
+    def _candidate(self, full_url, title, on_page):
+        """True, jeśli link warto ocenić filtrem AI (domena, duplikaty, tytuł)"""
+        # Skip niepotrzebne
+        if any(x in full_url for x in ["#", "mailto:", "javascript"]):
+            return False
+
+        # Skip spoza dozwolonych domen
+        if not any(d in full_url for d in self.SOURCE_DOMAINS):
+            return False
+
+        # Skip duplikatów
+        if full_url in self.seen_urls:
+            self.stats["duplicates_skipped"] += 1
+            return False
+
+        # Skip za krótkich tytułów i linków powtórzonych na tej stronie
+        if len(title) < 10 or full_url in on_page:
+            return False
+        on_page.add(full_url)
+
+        self.stats["articles_checked"] += 1
+        return True
+
+    async def _filter_titles(self, candidates, domain):
+        """
+        FILTR TYTUŁÓW przez AI (z cache!) - wszystkie naraz w puli wątków,
+        żądania wychodzą w kolejności, w jakiej model kończy ocenę
+        """
+        async for title, (full_url, published) in self.ai.filter_crime_related(candidates):
+            self.stats["passed_ai_filter"] += 1
+            self.logger.info(f"Przeszło: {title[:60]}...")
+
+            yield scrapy.Request(
+                full_url,
+                callback=self.parse_article,
+                meta={"title": title, "source": domain, "url": full_url, "published": published},
+                dont_filter=True,
+            )
 
-    def parse(self, response):
+    async def parse(self, response):
         """KROK 1: Zbiera linki i filtruje TYTUŁY przez AI"""
         self.stats["visited_pages"] += 1
         domain = urlparse(response.url).netloc
         self.logger.info(f"[PAGE {self.stats['visited_pages']}] {response.url}")
 
-        allowed_domains = ['tvn24.pl', 'naszemiasto.pl', 'gazetakrakowska.pl', 
-                           'fakt.pl', 'policja.gov.pl']
+        # Strona z listy startowej reklamuje kanał - od następnego crawla czytamy kanał
+        listing_url = response.meta.get("listing_url")
+        feed_url = find_feed_link(response) if listing_url else None
+        if feed_url:
+            self.db.save_feed(listing_url, feed_url)
+            self.logger.info(f"Znaleziono kanał dla {listing_url}: {feed_url}")
+        elif listing_url and urlparse(listing_url).netloc in self.sitemap_hosts:
+            # Bez kanału RSS/Atom - szukamy sitemapy news w robots.txt
+            parsed = urlparse(listing_url)
+            yield scrapy.Request(
+                f"{parsed.scheme}://{parsed.netloc}/robots.txt",
+                callback=self.parse_robots,
+                errback=self.robots_failed,
+                meta={"listing_url": listing_url, "conditional_get": False},
+                dont_filter=True,
+            )
+
+        # Paginacja najpierw - następna strona pobiera się, gdy AI ocenia tę.
+        # Zawsze szukaj następnej strony (bez warunku na passed_ai_filter)
+        next_page = response.css('a[rel="next"]::attr(href), a.pagination__next::attr(href)').get()
+        if next_page:
+            self.logger.info(f"Przechodzę do następnej strony: {next_page}")
+            yield response.follow(next_page, self.parse)
 
         # POPRAWIONE: Prostsze pobieranie linków (bez XPath)
+        candidates = []
+        on_page = set()
         for link in response.css("a"):
             href = link.css("::attr(href)").get()
             text = link.css("::text").get()
@@ -143,54 +249,88 @@ class MalopolskaCrimeSpider(scrapy.Spider):
             
             full_url = urljoin(response.url, href)
             title = text.strip()
-            
-            # Skip niepotrzebne
-            if any(x in full_url for x in ["#", "mailto:", "javascript"]):
-                continue
-            
-            # Skip spoza dozwolonych domen
-            if not any(d in full_url for d in allowed_domains):
-                continue
-            
-            # Skip duplikatów
-            if full_url in self.processed_urls:
-                self.stats["duplicates_skipped"] += 1
-                continue
-            
-            # Skip za krótkich tytułów
-            if len(title) < 10:
+            if self._candidate(full_url, title, on_page):
+                candidates.append((title, (full_url, None)))
+
+        async for request in self._filter_titles(candidates, domain):
+            yield request
+
+    def parse_robots(self, response):
+        """Sitemapa news z robots.txt; od następnego crawla czytamy ją zamiast HTML"""
+        text = response.body.decode("utf-8", errors="replace")
+        sitemap_url = pick_news_sitemap(sitemaps_from_robots(text))
+        # Brak sitemapy news: strona z listą zostaje przy HTML
+        if sitemap_url:
+            listing_url = response.meta["listing_url"]
+            self.db.save_feed(listing_url, sitemap_url)
+            self.logger.info(f"Znaleziono sitemapę news dla {listing_url}: {sitemap_url}")
+
+    def robots_failed(self, failure):
+        """Brak robots.txt - zostaje zbieranie linków z HTML"""
+        self.logger.debug(f"robots.txt niedostępny: {failure.request.url} ({failure.getErrorMessage()})")
+
+    async def parse_feed(self, response):
+        """KROK 1 (kanał): tytuły, daty i URL z jednego małego pliku XML"""
+        self.stats["visited_feeds"] += 1
+        listing_urls = response.meta["listing_urls"]
+        domain = urlparse(listing_urls[0]).netloc
+        self.logger.info(f"[FEED {self.stats['visited_feeds']}] {response.url}")
+
+        cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=self.FEED_MAX_AGE_DAYS)
+        entries = 0
+        candidates = []
+        on_page = set()
+        for entry in iter_feed_entries(response.body):
+            entries += 1
+            if entry.published is not None and entry.published < cutoff:
+                self.stats["old_feed_entries_skipped"] += 1
                 continue
+            full_url = urljoin(response.url, entry.url)
+            if entry.title and self._candidate(full_url, entry.title, on_page):
+                candidates.append((entry.title, (full_url, entry.published)))
+
+        if not entries:
+            # To nie jest (już) kanał - wracamy do zbierania linków z HTML
+            self.logger.warning(f"Pusty lub niepoprawny kanał {response.url}, pobieram {listing_urls}")
+            for request in self._drop_feed(listing_urls):
+                yield request
+            return
 
-            self.stats["articles_checked"] += 1
-            
-            # FILTR TYTUŁU przez AI (z cache!)
-            if self.ai_filter.is_crime_related(title):
-                self.stats["passed_ai_filter"] += 1
-                self.logger.info(f"Przeszło: {title[:60]}...")
-                
-                yield scrapy.Request(
-                    full_url,
-                    callback=self.parse_article,
-                    meta={"title": title, "source": domain, "url": full_url},
-                    dont_filter=True,
-                )
-
-        # Paginacja: Zawsze szukaj następnej strony.
-        # USUNIĘTO WARUNEK if self.stats["passed_ai_filter"] > 0
-        next_page = response.css('a[rel="next"]::attr(href), a.pagination__next::attr(href)').get()
-        if next_page:
-            self.logger.info(f"Przechodzę do następnej strony: {next_page}")
-            yield response.follow(next_page, self.parse)
+        async for request in self._filter_titles(candidates, domain):
+            yield request
 
-    def parse_article(self, response):
+    def feed_failed(self, failure):
+        """Kanał niedostępny: strona z listą przez HTML; 304 (bez zmian) to nie błąd"""
+        # HttpError (404, 500...) też dziedziczy po IgnoreRequest
+        if failure.check(IgnoreRequest) and not failure.check(HttpError):
+            return
+        listing_urls = failure.request.meta["listing_urls"]
+        self.logger.warning(f"Kanał {failure.request.url} niedostępny "
+                            f"({failure.getErrorMessage()}), pobieram {listing_urls}")
+        yield from self._drop_feed(listing_urls)
+
+    def _drop_feed(self, listing_urls):
+        for listing_url in listing_urls:
+            self.db.drop_feed(listing_url)
+            yield self._listing_request(listing_url)
+
+    async def parse_article(self, response):
         """KROK 2: Wchodzi w artykuł i AI wyciąga szczegóły"""
         title = response.meta["title"]
         url = response.meta["url"]
         source = response.meta["source"]
 
-        if url in self.processed_urls:
+        # Ten sam link bywa na kilku stronach list: drugi egzemplarz nie może
+        # przejść sprawdzenia, gdy pierwszy czeka na AI (seen_urls dopiero po zapisie)
+        if url in self.seen_urls or url in self.in_flight:
             return
+        self.in_flight.add(url)
+        try:
+            await self._process_article(response, title, url, source)
+        finally:
+            self.in_flight.discard(url)
 
+    async def _process_article(self, response, title, url, source):
         # Pobierz treść
         paragraphs = response.css("article p::text, div p::text, main p::text").getall()
         text = "\n".join(p.strip() for p in paragraphs if len(p.strip()) > 20)
@@ -199,8 +339,20 @@ class MalopolskaCrimeSpider(scrapy.Spider):
             self.logger.debug(f"Pomijam pusty: {url}")
             return
 
-        # ANALIZA przez AI (z cache!)
-        info = self.ai_filter.extract_event_info(title, "", text)
+        # Data zdarzenia dla heatmapy: z kanału, a bez niej ze strony artykułu
+        published = response.meta.get("published") or article_published(response)
+        published_at = str(published) if published else None
+
+        # Tryb odroczony: tylko surowy tekst, ekstrakcję robi agent.enrichment_worker
+        if self.settings.getbool("DEFER_ENRICHMENT"):
+            self.writer.submit_raw_article(url=url, title=title, raw_text=text, source=source,
+                                           published_at=published_at)
+            self.seen_urls.add(url)
+            self.stats["queued_to_db"] += 1
+            return
+
+        # ANALIZA przez AI (z cache!) - w puli wątków, bez blokowania reaktora
+        info = await maybe_deferred_to_future(self.ai.extract_event_info(title, "", text))
         
         crime_type = info["crime_type"]
         location_name = info["location_name"]
@@ -215,23 +367,24 @@ class MalopolskaCrimeSpider(scrapy.Spider):
 
         # Zapis do bazy
         try:
-            self.db.save_raw_article(url, title, text, source)
-            raw_id = self.db.get_connection().execute(
-                "SELECT id FROM raw_articles WHERE url=?", (url,)
-            ).fetchone()[0]
-
-            self.db.update_processed_article(
-                raw_article_id=raw_id,
+            # Surowy + przetworzony artykuł - do kolejki zapisu w tle
+            self.writer.submit_article(
+                url=url,
+                title=title,
+                raw_text=text,
+                source=source,
                 crime_type=crime_type,
                 location=location_name,
                 summary=summary,
                 keywords=crime_type,
                 latitude=lat,
                 longitude=lon,
+                severity=severity,
+                published_at=published_at,
             )
 
-            self.processed_urls.add(url)
-            self.stats["saved_to_db"] += 1
+            self.seen_urls.add(url)
+            self.stats["queued_to_db"] += 1
 
         except Exception as e:
             self.logger.error(f"❌ Błąd zapisu: {e}")
@@ -255,7 +408,7 @@ class MalopolskaCrimeSpider(scrapy.Spider):
             f.write(json.dumps(event_record, ensure_ascii=False) + "\n")
 
         self.logger.info(
-            f"[{self.stats['saved_to_db']}] {crime_type} | "
+            f"[{self.stats['queued_to_db']}] {crime_type} | "
             f"{location_name} ({lat:.4f}, {lon:.4f}) | "
             f"waga: {severity}/10"
         )
@@ -264,6 +417,9 @@ class MalopolskaCrimeSpider(scrapy.Spider):
         """Podsumowanie i WYMUSZONY ZAPIS CACHE"""
         self.logger.info("=" * 60)
         
+        # Najpierw dokończ trwające wywołania AI, potem zapisz cache
+        self.ai.close()
+
         # ZAPIS CACHE
         try:
             self.ai_filter._save_cache() 
@@ -271,6 +427,10 @@ class MalopolskaCrimeSpider(scrapy.Spider):
         except Exception as e:
             self.logger.error(f"Błąd zapisu cache: {e}")
         
+        # Zapisz wszystko, co czeka w kolejce, zanim wypiszemy statystyki
+        self.writer.close()
+        self.seen_urls.save()
+        self.db.close()
         self.logger.info("Zakończono scrapowanie Krakowa")
         self.logger.info("-" * 60)
         for k, v in self.stats.items():
@@ -0,0 +1,140 @@
+import logging
+
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.utils.httpobj import urlparse_cached
+
+from agent.db import initialize_db_manager
+
+logger = logging.getLogger(__name__)
+
+
+class ConditionalGetMiddleware:
+    """
+    Zapytania warunkowe dla stron z listami artykułów.
+
+    Po odpowiedzi 200 zapisuje ETag / Last-Modified w http_validators, a przy
+    kolejnym pobraniu wysyła If-None-Match / If-Modified-Since. Odpowiedź 304
+    kończy żądanie (IgnoreRequest) - bez parsowania linków i filtra AI.
+
+    Dotyczy żądań bez callbacku (start_urls) i z callbackiem spider.parse
+    (paginacja); meta["conditional_get"] wymusza / wyłącza to dla innych.
+    """
+
+    def __init__(self, crawler, db_path):
+        self.crawler = crawler
+        self.db = initialize_db_manager(db_path)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool("CONDITIONAL_GET_ENABLED", True):
+            raise NotConfigured
+        # Przy odtwarzaniu z HTTPCACHE walidatory dałyby 304 zapisane w cache
+        if settings.getbool("HTTPCACHE_ENABLED"):
+            raise NotConfigured
+        return cls(crawler, settings.get("CRIME_DB_PATH", "data/crime_data.db"))
+
+    def _applies(self, request):
+        if "conditional_get" in request.meta:
+            return request.meta["conditional_get"]
+        return request.method == "GET" and request.callback in (None, self.crawler.spider.parse)
+
+    def process_request(self, request, spider=None):
+        if not self._applies(request):
+            return None
+        validators = self.db.get_http_validators(request.url)
+        if validators is None:
+            return None
+        if validators["etag"]:
+            request.headers.setdefault("If-None-Match", validators["etag"])
+        if validators["last_modified"]:
+            request.headers.setdefault("If-Modified-Since", validators["last_modified"])
+        self.crawler.stats.inc_value("conditional_get/sent")
+        return None
+
+    def process_response(self, request, response, spider=None):
+        if not self._applies(request):
+            return response
+
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+
+        if response.status == 304:
+            stored = self.db.get_http_validators(request.url) or {}
+            # 304 może nieść nowy ETag; odświeżamy też checked_at
+            self.db.save_http_validators(
+                request.url,
+                etag.decode("latin-1") if etag else stored.get("etag"),
+                last_modified.decode("latin-1") if last_modified else stored.get("last_modified"),
+            )
+            self.crawler.stats.inc_value("conditional_get/not_modified")
+            logger.info(f"Bez zmian (304): {request.url}")
+            raise IgnoreRequest(f"Not modified: {request.url}")
+
+        if response.status == 200 and (etag or last_modified):
+            self.db.save_http_validators(
+                request.url,
+                etag.decode("latin-1") if etag else None,
+                last_modified.decode("latin-1") if last_modified else None,
+            )
+        return response
+
+
+class SourceThrottleMiddleware:
+    """
+    Sloty pobierania per źródło i wycofanie przy przeciążeniu.
+
+    Żądanie trafia do slotu z DOWNLOAD_SLOTS, którego klucz jest końcówką
+    hosta (krakow.naszemiasto.pl i tarnow.naszemiasto.pl dzielą slot
+    "naszemiasto.pl"), więc limit współbieżności dotyczy całego serwisu.
+    Opóźnienie slotu dostraja AutoThrottle według czasu odpowiedzi; po 429
+    lub 5xx ten middleware podwaja je (albo ustawia Retry-After), a ponowienie
+    zostawia RetryMiddleware.
+    """
+
+    BACKOFF_CODES = {429, 500, 502, 503, 504}
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.sources = sorted(crawler.settings.getdict("DOWNLOAD_SLOTS"), key=len, reverse=True)
+        self.max_delay = crawler.settings.getfloat("AUTOTHROTTLE_MAX_DELAY", 60.0)
+        self.min_backoff = crawler.settings.getfloat("AUTOTHROTTLE_START_DELAY", 5.0)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def _source(self, host):
+        for source in self.sources:
+            if host == source or host.endswith("." + source):
+                return source
+        return None
+
+    def process_request(self, request, spider=None):
+        if "download_slot" not in request.meta:
+            source = self._source(urlparse_cached(request).hostname or "")
+            if source:
+                request.meta["download_slot"] = source
+        return None
+
+    def process_response(self, request, response, spider=None):
+        if response.status not in self.BACKOFF_CODES:
+            return response
+
+        key = request.meta.get("download_slot")
+        slot = self.crawler.engine.downloader.slots.get(key)
+        if slot is None:
+            return response
+
+        retry_after = response.headers.get("Retry-After")
+        try:
+            retry_after = float(retry_after) if retry_after else 0.0
+        except ValueError:  # data HTTP zamiast sekund - zostaje podwojenie
+            retry_after = 0.0
+
+        old_delay = slot.delay
+        slot.delay = min(self.max_delay, max(old_delay * 2, self.min_backoff, retry_after))
+        self.crawler.stats.inc_value(f"backoff/{response.status}")
+        logger.warning(f"{response.status} z {key}: opóźnienie slotu "
+                       f"{old_delay:.1f}s -> {slot.delay:.1f}s")
+        return response
@@ -39,14 +39,14 @@ class RawArticlePipeline:
         source = adapter.get('source') 
 
         if self.db_manager:
-            article_id = self.db_manager.save_raw_article(
+            article_id, inserted = self.db_manager.save_raw_article(
                 url=url,
                 title=title,
                 raw_text=raw_text,
                 source=source
             )
             
-            if article_id:
+            if inserted:
                 self.saved_count += 1
                 self.logger.info(f"Zapisano ID={article_id}: {title[:50]}...")
             else:
@@ -1,11 +1,16 @@
 import scrapy
 import os
 import json
-from datetime import date, datetime, timedelta
+from datetime import date, datetime
 from urllib.parse import urlparse, urljoin
 
+from scrapy.utils.defer import maybe_deferred_to_future
+
 from agent.crime_news_scrapper.ai_filter_groq import CrimeFilterLocal
-from agent.db import initialize_db_manager
+from agent.crime_news_scrapper.ai_async import DeferredAIFilter
+from agent.crime_news_scrapper.discovery import article_published, parse_date
+from agent.crime_news_scrapper import settings as crawl_settings
+from agent.db import initialize_db_manager, AsyncArticleWriter, UrlSeenIndex
 
 
 class PoliceDirectSpider(scrapy.Spider):
@@ -24,10 +29,10 @@ class PoliceDirectSpider(scrapy.Spider):
     ]
 
     custom_settings = {
+        # Sloty per źródło, AutoThrottle, zapytania warunkowe, cache (settings.py)
+        **crawl_settings.SHARED_SPIDER_SETTINGS,
         'USER_AGENT': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)',
         'ROBOTSTXT_OBEY': False,
-        'DOWNLOAD_DELAY': 1.5,  # Szybciej dla równoległego
-        'CONCURRENT_REQUESTS': 2,
         'COOKIES_ENABLED': False,
         'LOG_LEVEL': 'INFO',
         'CLOSESPIDER_PAGECOUNT': 25,
@@ -45,41 +50,35 @@ class PoliceDirectSpider(scrapy.Spider):
         self.logger.info(f"Zapis do: {self.output_file}")
 
         # AI tylko do ekstrakcji (nie do filtrowania!)
-        self.ai_filter = CrimeFilterLocal()
+        # Scheduler (run_scheduler.py) wstrzykuje wspólny, "ciepły" filtr AI i indeks URL
+        self.ai_filter = kwargs.get("ai_filter") or CrimeFilterLocal()
+        # Ekstrakcja w puli wątków - reaktor pobiera kolejne strony w tym czasie
+        self.ai = DeferredAIFilter(self.ai_filter, max_threads=int(kwargs.get("ai_threads", 4)))
         self.db = initialize_db_manager("data/crime_data.db")
 
-        # Cache URL z ostatnich 7 dni
-        self.processed_urls = self._load_processed_urls()
-        self.logger.info(f"Wczytano {len(self.processed_urls)} przetworzonych URL")
+        # Wszystkie zapisane URL (cała historia) - filtr Blooma + indeks w bazie
+        # URL-e artykułów przetwarzanych w tej chwili (między sprawdzeniem a zapisem)
+        self.in_flight = set()
+        self.seen_urls = kwargs.get("seen_urls")
+        if self.seen_urls is None:
+            self.seen_urls = UrlSeenIndex(self.db)
+        self.logger.info(f"Indeks odwiedzonych URL: {len(self.seen_urls)} wpisów")
 
         self.stats = {
             "visited_pages": 0,
             "articles_found": 0,
+            "queued_to_db": 0,
             "saved_to_db": 0,
+            "db_write_errors": 0,
             "duplicates_skipped": 0,
             "old_articles_skipped": 0,
         }
         
         self.scrape_start = datetime.now()
 
-    def _load_processed_urls(self):
-        """Wczytuje TYLKO URL z ostatnich 7 dni"""
-        processed = set()
-        conn = self.db.get_connection()
-        
-        try:
-            week_ago = (datetime.now() - timedelta(days=7)).isoformat()
-            
-            for row in conn.execute(
-                "SELECT url FROM raw_articles WHERE scraped_at > ?",
-                (week_ago,)
-            ):
-                processed.add(row[0])
-                
-        except Exception as e:
-            self.logger.warning(f"Błąd ładowania cache: {e}")
-        
-        return processed
+        # Zapis w tle - callbacki nie czekają na commit/fsync SQLite.
+        # saved_to_db i db_write_errors aktualizuje wątek zapisu
+        self.writer = AsyncArticleWriter(self.db, stats=self.stats)
 
     def parse(self, response):
         """
@@ -118,7 +117,7 @@ class PoliceDirectSpider(scrapy.Spider):
                 continue
 
 
-            if full_url in self.processed_urls:
+            if full_url in self.seen_urls:
                 self.stats["duplicates_skipped"] += 1
                 continue
 
@@ -127,7 +126,8 @@ class PoliceDirectSpider(scrapy.Spider):
             yield scrapy.Request(
                 full_url,
                 callback=self.parse_article,
-                meta={"title": title, "source": "policja.gov.pl", "url": full_url},
+                meta={"title": title, "source": "policja.gov.pl", "url": full_url,
+                      "published": parse_date(article['date'])},
                 dont_filter=True,
             )
 
@@ -137,7 +137,7 @@ class PoliceDirectSpider(scrapy.Spider):
             if next_page:
                 yield response.follow(next_page, self.parse)
 
-    def parse_article(self, response):
+    async def parse_article(self, response):
         """
         Ekstrakcja szczegółów przez AI (z cache!)
         """
@@ -146,9 +146,17 @@ class PoliceDirectSpider(scrapy.Spider):
         source = response.meta["source"]
 
         # Double-check duplikatów
-        if url in self.processed_urls:
+        # Ten sam link bywa na kilku stronach list: drugi egzemplarz nie może
+        # przejść sprawdzenia, gdy pierwszy czeka na AI (seen_urls dopiero po zapisie)
+        if url in self.seen_urls or url in self.in_flight:
             return
+        self.in_flight.add(url)
+        try:
+            await self._process_article(response, title, url, source)
+        finally:
+            self.in_flight.discard(url)
 
+    async def _process_article(self, response, title, url, source):
         # Pobierz treść
         paragraphs = response.css("article p::text, div.news-content p::text, main p::text").getall()
         text = "\n".join(p.strip() for p in paragraphs if len(p.strip()) > 20)
@@ -157,8 +165,20 @@ class PoliceDirectSpider(scrapy.Spider):
             self.logger.warning(f"Pomijam pusty artykuł: {url}")
             return
 
+        # Data zdarzenia dla heatmapy: z listy komunikatów, a bez niej ze strony artykułu
+        published = response.meta.get("published") or article_published(response)
+        published_at = str(published) if published else None
+
+        # Tryb odroczony: tylko surowy tekst, ekstrakcję robi agent.enrichment_worker
+        if self.settings.getbool("DEFER_ENRICHMENT"):
+            self.writer.submit_raw_article(url=url, title=title, raw_text=text, source=source,
+                                           published_at=published_at)
+            self.seen_urls.add(url)
+            self.stats["queued_to_db"] += 1
+            return
+
         # Ekstrakcja przez AI (z cache!)
-        info = self.ai_filter.extract_event_info(title, "", text)
+        info = await maybe_deferred_to_future(self.ai.extract_event_info(title, "", text))
         
         crime_type = info["crime_type"]
         location_name = info["location_name"]
@@ -173,23 +193,24 @@ class PoliceDirectSpider(scrapy.Spider):
 
         # Zapis do bazy
         try:
-            self.db.save_raw_article(url, title, text, source)
-            raw_id = self.db.get_connection().execute(
-                "SELECT id FROM raw_articles WHERE url=?", (url,)
-            ).fetchone()[0]
-
-            self.db.update_processed_article(
-                raw_article_id=raw_id,
+            # Surowy + przetworzony artykuł - do kolejki zapisu w tle
+            self.writer.submit_article(
+                url=url,
+                title=title,
+                raw_text=text,
+                source=source,
                 crime_type=crime_type,
                 location=location_name,
                 summary=summary,
                 keywords=crime_type,
                 latitude=lat,
                 longitude=lon,
+                severity=severity,
+                published_at=published_at,
             )
 
-            self.processed_urls.add(url)
-            self.stats["saved_to_db"] += 1
+            self.seen_urls.add(url)
+            self.stats["queued_to_db"] += 1
 
         except Exception as e:
             self.logger.error(f"Błąd zapisu: {e}")
@@ -213,13 +234,18 @@ class PoliceDirectSpider(scrapy.Spider):
             f.write(json.dumps(event_record, ensure_ascii=False) + "\n")
 
         self.logger.info(
-            f"[{self.stats['saved_to_db']}] {crime_type} | "
+            f"[{self.stats['queued_to_db']}] {crime_type} | "
             f"{location_name} ({lat:.4f}, {lon:.4f}) | "
             f"waga: {severity}/10"
         )
 
     def closed(self, reason):
         """Podsumowanie"""
+        self.ai.close()
+        # Zapisz wszystko, co czeka w kolejce, zanim wypiszemy statystyki
+        self.writer.close()
+        self.seen_urls.save()
+        self.db.close()
         self.logger.info("=" * 60)
         self.logger.info("Zakończono scraping policji")
         self.logger.info("-" * 60)
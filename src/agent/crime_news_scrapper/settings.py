@@ -1,5 +1,6 @@
 # Scrapy settings for crime_news_scrapper
 # Dokumentacja: https://docs.scrapy.org/en/latest/topics/settings.html
+import os
 
 BOT_NAME = 'crime_news_scrapper'
 
@@ -11,9 +12,27 @@ ROBOTSTXT_OBEY = False
 USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
 
 # Configure delays
-DOWNLOAD_DELAY = 3
-CONCURRENT_REQUESTS = 1
-CONCURRENT_REQUESTS_PER_DOMAIN = 1
+# Limity są per źródło (DOWNLOAD_SLOTS), więc łączna przepustowość rośnie
+# z liczbą źródeł; DOWNLOAD_DELAY to tylko dolna granica dla AutoThrottle
+CONCURRENT_REQUESTS = 16
+CONCURRENT_REQUESTS_PER_DOMAIN = 2
+DOWNLOAD_DELAY = 0.5
+
+# Sloty per serwis - klucz to końcówka hosta (SourceThrottleMiddleware),
+# wszystkie subdomeny naszemiasto.pl dzielą jeden limit
+DOWNLOAD_SLOTS = {
+    'tvn24.pl': {'concurrency': 2, 'delay': 1.0},
+    'naszemiasto.pl': {'concurrency': 2, 'delay': 1.0},
+    'fakt.pl': {'concurrency': 2, 'delay': 1.0},
+    'gazetakrakowska.pl': {'concurrency': 2, 'delay': 1.0},
+    'policja.gov.pl': {'concurrency': 1, 'delay': 2.0},
+}
+
+# Opóźnienie slotu dostrajane do czasu odpowiedzi serwera
+AUTOTHROTTLE_ENABLED = True
+AUTOTHROTTLE_START_DELAY = 2.0
+AUTOTHROTTLE_MAX_DELAY = 60.0
+AUTOTHROTTLE_TARGET_CONCURRENCY = 1.5
 
 # Disable cookies
 COOKIES_ENABLED = False
@@ -23,6 +42,35 @@ LOG_LEVEL = 'INFO'
 LOG_FORMAT = '%(asctime)s [%(name)s] %(levelname)s: %(message)s'
 LOG_DATEFORMAT = '%Y-%m-%d %H:%M:%S'
 
+# Ekstrakcja AI poza spiderem: zapisuj tylko raw_articles, a przetwarzaj
+# je osobno przez `python -m agent.enrichment_worker` (kolejka z dzierżawami)
+DEFER_ENRICHMENT = False
+
+# Zapytania warunkowe (ETag / Last-Modified) dla stron z listami artykułów:
+# niezmieniona strona wraca jako 304 i nie jest parsowana ani filtrowana przez AI
+DOWNLOADER_MIDDLEWARES = {
+    'agent.crime_news_scrapper.middlewares.ConditionalGetMiddleware': 580,
+    # Przed RetryMiddleware (550) w drodze odpowiedzi - widzi 429/5xx
+    'agent.crime_news_scrapper.middlewares.SourceThrottleMiddleware': 590,
+}
+CONDITIONAL_GET_ENABLED = True
+CRIME_DB_PATH = 'data/crime_data.db'
+
+# Cache odpowiedzi na dysku (.scrapy/httpcache) do odtwarzania crawli przy
+# pracy nad spiderami: SCRAPY_HTTPCACHE=1, TTL w sekundach (0 = bez wygasania)
+HTTPCACHE_ENABLED = os.environ.get('SCRAPY_HTTPCACHE') == '1'
+HTTPCACHE_EXPIRATION_SECS = int(os.environ.get('SCRAPY_HTTPCACHE_TTL', 86400))
+HTTPCACHE_IGNORE_HTTP_CODES = [304, 403, 429, 500, 502, 503, 504]
+
+# `scrapy runspider` nie czyta tego pliku - spidery dołączają te ustawienia
+# do custom_settings (run_scheduler.py wczytuje cały moduł)
+SHARED_SPIDER_SETTINGS = {name: globals()[name] for name in (
+    'CONCURRENT_REQUESTS', 'CONCURRENT_REQUESTS_PER_DOMAIN', 'DOWNLOAD_DELAY', 'DOWNLOAD_SLOTS',
+    'AUTOTHROTTLE_ENABLED', 'AUTOTHROTTLE_START_DELAY', 'AUTOTHROTTLE_MAX_DELAY',
+    'AUTOTHROTTLE_TARGET_CONCURRENCY', 'DOWNLOADER_MIDDLEWARES',
+    'HTTPCACHE_ENABLED', 'HTTPCACHE_EXPIRATION_SECS', 'HTTPCACHE_IGNORE_HTTP_CODES',
+)}
+
 # Item pipelines
 ITEM_PIPELINES = {}
 
@@ -1,13 +1,131 @@
+import hashlib
+import math
+import queue
+import re
 import sqlite3
+import threading
+import time
+import unicodedata
+import zlib
+from contextlib import contextmanager
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
+from urllib.parse import urldefrag
 import os
 
+try:
+    import zstandard
+except ImportError:  # zstd opcjonalny - bez niego treść kompresuje zlib
+    zstandard = None
+
+
+# Prefiksy z odpowiedzi LLM, które nie zmieniają miejsca ("ul. Wielicka" = "Wielicka")
+_LOCATION_PREFIXES = re.compile(r'^(ulica|ul\.|aleja|al\.|osiedle|os\.|plac|pl\.)\s*',
+                                re.IGNORECASE)
+
+
+def _location_key(text: str) -> str:
+    text = text.lower().replace('ł', 'l')
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return ' '.join(re.findall(r'\w+', text))
+
+
+def normalize_location(name: str) -> Optional[Tuple[str, str, str, str]]:
+    """
+    Rozkłada nazwę miejsca z LLM na (nazwa, gmina, klucz, klucz gminy).
+    "ul. Wielicka, Kraków" -> ("Wielicka, Kraków", "Kraków",
+                                "wielicka, krakow", "krakow")
+    Klucz (małe litery, bez polskich znaków) identyfikuje wiersz w locations.
+    """
+    parts = [_LOCATION_PREFIXES.sub('', p.strip()) for p in (name or '').split(',')]
+    parts = [p for p in parts if _location_key(p)]
+    if not parts:
+        return None
+    municipality = parts[-1]
+    canonical = ', '.join(parts)
+    key = ', '.join(_location_key(p) for p in parts)
+    return canonical, municipality, key, _location_key(municipality)
+
+
+def url_hash(url: str) -> int:
+    """64-bitowy skrót URL (bez #fragmentu) - klucz w seen_urls i w filtrze Blooma"""
+    digest = hashlib.sha1(urldefrag(url)[0].encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big', signed=True)
+
+
+class TextCodec:
+    """
+    Kompresja treści artykułów zapisywanych w raw_articles.raw_text.
+
+    Skompresowana wartość to BLOB z 1-bajtowym znacznikiem kodeka:
+    b'z' + zlib, b'Z' + ramka zstd (id słownika zapisany w ramce).
+    Zwykły TEXT to treść nieskompresowana (stare wiersze sprzed backfillu).
+
+    Słownik nieznany w tym procesie (wytrenowany przez inny proces po starcie)
+    jest pobierany przez `load_dictionary(dict_id) -> bytes | None` i
+    zapamiętywany.
+    """
+
+    ZLIB = b'z'
+    ZSTD = b'Z'
+
+    def __init__(self, load_dictionary=None):
+        self.dictionaries = {}  # id słownika zstd -> ZstdCompressionDict
+        self.active_dict_id = None
+        self.load_dictionary = load_dictionary
+        self._lock = threading.Lock()
+
+    def add_dictionary(self, dict_id: int, data: bytes, activate: bool = True):
+        with self._lock:
+            self.dictionaries[dict_id] = zstandard.ZstdCompressionDict(data)
+            if activate:
+                self.active_dict_id = dict_id
+
+    def _dictionary(self, dict_id: int):
+        zdict = self.dictionaries.get(dict_id)
+        if zdict is not None:
+            return zdict
+        data = self.load_dictionary(dict_id) if self.load_dictionary else None
+        if data is None:
+            raise LookupError(f"Brak słownika zstd id={dict_id} w text_dictionaries")
+        # Tylko do odczytu - aktywny słownik dla nowych zapisów się nie zmienia
+        self.add_dictionary(dict_id, data, activate=False)
+        return self.dictionaries[dict_id]
+
+    def compress(self, text: str):
+        raw = text.encode('utf-8')
+        if zstandard is not None:
+            zdict = self.dictionaries.get(self.active_dict_id)
+            packed = self.ZSTD + zstandard.ZstdCompressor(level=9, dict_data=zdict).compress(raw)
+        else:
+            packed = self.ZLIB + zlib.compress(raw, 9)
+        # Krótkie teksty potrafią urosnąć - wtedy zostają zwykłym TEXT
+        return packed if len(packed) < len(raw) else text
+
+    def decompress(self, value):
+        if value is None or isinstance(value, str):
+            return value
+        value = bytes(value)
+        codec, payload = value[:1], value[1:]
+        if codec == self.ZLIB:
+            return zlib.decompress(payload).decode('utf-8')
+        if codec == self.ZSTD:
+            if zstandard is None:
+                raise RuntimeError("Treść skompresowana zstd - zainstaluj pakiet zstandard")
+            dict_id = zstandard.get_frame_parameters(payload).dict_id
+            zdict = self._dictionary(dict_id) if dict_id else None
+            return zstandard.ZstdDecompressor(dict_data=zdict).decompress(payload).decode('utf-8')
+        raise ValueError(f"Nieznany kodek treści: {codec!r}")
+
 class DatabaseManager:
     """Menedżer bazy danych dla systemu analizy przestępstw"""
     
     def __init__(self, db_path: str = "crime_data.db"):
         self.db_path = db_path
+        # Jedno połączenie na wątek, używane ponownie przez wszystkie metody
+        self._local = threading.local()
+        self.codec = TextCodec(load_dictionary=self._fetch_dictionary)
 
         db_dir = os.path.dirname(self.db_path)
         if db_dir and not os.path.exists(db_dir):
@@ -16,15 +134,408 @@ class DatabaseManager:
         self.init_database()
     
     def get_connection(self):
-        """Tworzy połączenie z bazą danych"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row  # Zwraca wiersze jako słowniki
+        """
+        Zwraca połączenie bieżącego wątku (tworzone przy pierwszym użyciu).
+        Połączenie działa w trybie autocommit - zapisy grupuje transaction().
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, isolation_level=None)
+            conn.row_factory = sqlite3.Row  # Zwraca wiersze jako słowniki
+            # WAL: czytelnicy nie blokują zapisu (spidery + raporty równolegle)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            # Odczyt skompresowanej treści w SQL (widok FTS, zapytania o raw_text)
+            conn.create_function("article_text", 1, self.codec.decompress,
+                                 deterministic=True)
+            self._local.conn = conn
+            self._local.depth = 0
         return conn
+
+    @contextmanager
+    def transaction(self):
+        """
+        Transakcja na połączeniu bieżącego wątku: COMMIT na końcu bloku,
+        ROLLBACK przy wyjątku. Zagnieżdżone wywołania dołączają do zewnętrznej
+        transakcji, więc kilka zapisów kosztuje jeden commit; każde z nich
+        to SAVEPOINT, więc wyjątek złapany przez wywołującego cofa tylko
+        zapisy z wewnętrznego bloku, a nie całą transakcję.
+        """
+        conn = self.get_connection()
+        depth = self._local.depth
+        savepoint = f"sp_{depth}"
+        if depth == 0:
+            conn.execute("BEGIN IMMEDIATE")
+        else:
+            conn.execute(f"SAVEPOINT {savepoint}")
+        self._local.depth += 1
+        try:
+            yield conn.cursor()
+        except BaseException:
+            self._local.depth -= 1
+            if depth == 0:
+                conn.execute("ROLLBACK")
+            else:
+                conn.execute(f"ROLLBACK TO {savepoint}")
+                conn.execute(f"RELEASE {savepoint}")
+            raise
+        else:
+            self._local.depth -= 1
+            if depth == 0:
+                conn.execute("COMMIT")
+            else:
+                conn.execute(f"RELEASE {savepoint}")
+
+    def close(self):
+        """Zamyka połączenie bieżącego wątku (kolejne użycie otworzy nowe)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
     
     def init_database(self):
         """Inicjalizuje strukturę bazy danych"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        with self.transaction() as cursor:
+            self._create_schema(cursor)
+            self._migrate(cursor)
+            self._load_dictionaries(cursor)
+        print(f"Baza danych zainicjalizowana: {self.db_path}")
+
+    def _migrate(self, cursor):
+        """Aktualizuje schemat; postęp zapisany w PRAGMA user_version"""
+        cursor.execute('PRAGMA user_version')
+        version = cursor.fetchone()[0]
+        for target in range(version + 1, len(self.MIGRATIONS) + 1):
+            self.MIGRATIONS[target - 1](self, cursor)
+            cursor.execute(f'PRAGMA user_version = {target}')
+
+    def _migrate_last_seen(self, cursor):
+        """last_seen_at: ustawiane przy ponownym napotkaniu URL (upsert w save_raw_article)"""
+        cursor.execute('ALTER TABLE raw_articles ADD COLUMN last_seen_at TIMESTAMP')
+
+    def _migrate_leases(self, cursor):
+        """Dzierżawy (lease) dla kolejki przetwarzania: kto i do kiedy trzyma wiersz"""
+        cursor.execute('ALTER TABLE raw_articles ADD COLUMN lease_owner TEXT')
+        cursor.execute('ALTER TABLE raw_articles ADD COLUMN lease_expires_at TIMESTAMP')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_pending
+            ON raw_articles(scraped_at) WHERE is_processed = 0
+        ''')
+
+    def _migrate_fts(self, cursor):
+        """
+        Indeks pełnotekstowy FTS5: tytuł i treść z raw_articles + streszczenia
+        i lokalizacje z processed_articles (jeden wiersz FTS na artykuł,
+        rowid = raw_articles.id). Treść nie jest kopiowana - FTS czyta ją
+        z widoku articles_fts_content, a triggery aktualizują tylko indeks.
+        """
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_processed_raw
+            ON processed_articles(raw_article_id)
+        ''')
+        cursor.execute('''
+            CREATE VIEW articles_fts_content AS
+            SELECT r.id AS id, r.title AS title, r.raw_text AS raw_text,
+                   (SELECT group_concat(p.summary, ' ') FROM processed_articles p
+                    WHERE p.raw_article_id = r.id) AS summary,
+                   (SELECT group_concat(p.location, ' ') FROM processed_articles p
+                    WHERE p.raw_article_id = r.id) AS location
+            FROM raw_articles r
+        ''')
+        # remove_diacritics 2: "krakow" znajduje "Kraków"; prefix: szybkie "krak*"
+        cursor.execute('''
+            CREATE VIRTUAL TABLE articles_fts USING fts5(
+                title, raw_text, summary, location,
+                content='articles_fts_content', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2',
+                prefix='2 3'
+            )
+        ''')
+
+        # Tabela z zewnętrzną treścią: przed zmianą usuwamy z indeksu stary stan
+        # widoku ('delete' ze starymi wartościami), po zmianie dodajemy nowy
+        def unindex(ids):
+            return f'''
+                INSERT INTO articles_fts(articles_fts, rowid, title, raw_text, summary, location)
+                SELECT 'delete', id, title, raw_text, summary, location
+                FROM articles_fts_content WHERE id IN ({ids});'''
+
+        def index(ids):
+            return f'''
+                INSERT INTO articles_fts(rowid, title, raw_text, summary, location)
+                SELECT id, title, raw_text, summary, location
+                FROM articles_fts_content WHERE id IN ({ids});'''
+
+        triggers = [
+            ('raw_fts_ai', 'AFTER INSERT ON raw_articles', index('new.id')),
+            ('raw_fts_bu', 'BEFORE UPDATE OF title, raw_text ON raw_articles', unindex('old.id')),
+            ('raw_fts_au', 'AFTER UPDATE OF title, raw_text ON raw_articles', index('new.id')),
+            ('raw_fts_bd', 'BEFORE DELETE ON raw_articles', unindex('old.id')),
+            ('processed_fts_bi', 'BEFORE INSERT ON processed_articles',
+             unindex('new.raw_article_id')),
+            ('processed_fts_ai', 'AFTER INSERT ON processed_articles',
+             index('new.raw_article_id')),
+            ('processed_fts_bu',
+             'BEFORE UPDATE OF summary, location, raw_article_id ON processed_articles',
+             unindex('old.raw_article_id, new.raw_article_id')),
+            ('processed_fts_au',
+             'AFTER UPDATE OF summary, location, raw_article_id ON processed_articles',
+             index('old.raw_article_id, new.raw_article_id')),
+            ('processed_fts_bd', 'BEFORE DELETE ON processed_articles',
+             unindex('old.raw_article_id')),
+            ('processed_fts_ad', 'AFTER DELETE ON processed_articles',
+             index('old.raw_article_id')),
+        ]
+        for name, event, body in triggers:
+            cursor.execute(f'CREATE TRIGGER {name} {event} BEGIN {body} END')
+
+        cursor.execute("INSERT INTO articles_fts(articles_fts) VALUES ('rebuild')")
+
+    def _migrate_compression(self, cursor):
+        """
+        Słowniki zstd dla kompresji treści + widok FTS czytający treść przez
+        article_text(), żeby indeks widział tekst, a nie skompresowany BLOB
+        """
+        cursor.execute('''
+            CREATE TABLE text_dictionaries (
+                id INTEGER PRIMARY KEY,
+                data BLOB NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('DROP VIEW articles_fts_content')
+        cursor.execute('''
+            CREATE VIEW articles_fts_content AS
+            SELECT r.id AS id, r.title AS title, article_text(r.raw_text) AS raw_text,
+                   (SELECT group_concat(p.summary, ' ') FROM processed_articles p
+                    WHERE p.raw_article_id = r.id) AS summary,
+                   (SELECT group_concat(p.location, ' ') FROM processed_articles p
+                    WHERE p.raw_article_id = r.id) AS location
+            FROM raw_articles r
+        ''')
+
+    def _migrate_stats(self, cursor):
+        """
+        Liczniki dla get_statistics utrzymywane przez triggery: per źródło
+        (wszystkie / przetworzone / ostatni scraping) i per typ przestępstwa.
+        Odczyt statystyk nie skanuje już raw_articles.
+        """
+        cursor.execute('''
+            CREATE TABLE source_stats (
+                source TEXT PRIMARY KEY,
+                total INTEGER NOT NULL DEFAULT 0,
+                processed INTEGER NOT NULL DEFAULT 0,
+                last_scraped_at TIMESTAMP
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE crime_type_stats (
+                crime_type TEXT PRIMARY KEY,
+                count INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+
+        def add_source(row):
+            return f'''
+                INSERT INTO source_stats (source, total, processed, last_scraped_at)
+                VALUES (COALESCE({row}.source, 'unknown'), 1, {row}.is_processed != 0, {row}.scraped_at)
+                ON CONFLICT(source) DO UPDATE SET
+                    total = total + 1,
+                    processed = processed + excluded.processed,
+                    last_scraped_at = max(COALESCE(last_scraped_at, ''), excluded.last_scraped_at);'''
+
+        def remove_source(row):
+            return f'''
+                UPDATE source_stats
+                SET total = total - 1, processed = processed - ({row}.is_processed != 0)
+                WHERE source = COALESCE({row}.source, 'unknown');'''
+
+        def add_type(row):
+            return f'''
+                INSERT INTO crime_type_stats (crime_type, count)
+                VALUES (COALESCE({row}.crime_type, 'inne'), 1)
+                ON CONFLICT(crime_type) DO UPDATE SET count = count + 1;'''
+
+        def remove_type(row):
+            return f'''
+                UPDATE crime_type_stats SET count = count - 1
+                WHERE crime_type = COALESCE({row}.crime_type, 'inne');'''
+
+        triggers = [
+            ('raw_stats_ai', 'AFTER INSERT ON raw_articles', add_source('new')),
+            ('raw_stats_ad', 'AFTER DELETE ON raw_articles', remove_source('old')),
+            ('raw_stats_au',
+             'AFTER UPDATE OF is_processed, source ON raw_articles '
+             'WHEN (old.is_processed != 0) != (new.is_processed != 0) '
+             'OR old.source IS NOT new.source',
+             remove_source('old') + add_source('new')),
+            ('processed_stats_ai', 'AFTER INSERT ON processed_articles', add_type('new')),
+            ('processed_stats_ad', 'AFTER DELETE ON processed_articles', remove_type('old')),
+            ('processed_stats_au',
+             'AFTER UPDATE OF crime_type ON processed_articles '
+             'WHEN old.crime_type IS NOT new.crime_type',
+             remove_type('old') + add_type('new')),
+        ]
+        for name, event, body in triggers:
+            cursor.execute(f'CREATE TRIGGER {name} {event} BEGIN {body} END')
+
+        cursor.execute('''
+            INSERT INTO source_stats (source, total, processed, last_scraped_at)
+            SELECT COALESCE(source, 'unknown'), COUNT(*), SUM(is_processed != 0), MAX(scraped_at)
+            FROM raw_articles GROUP BY 1
+        ''')
+        cursor.execute('''
+            INSERT INTO crime_type_stats (crime_type, count)
+            SELECT COALESCE(crime_type, 'inne'), COUNT(*)
+            FROM processed_articles GROUP BY 1
+        ''')
+
+    def _migrate_locations(self, cursor):
+        """
+        Słownik miejsc: processed_articles.location_id zamiast wolnego tekstu.
+        """
+        cursor.execute('''
+            CREATE TABLE locations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                municipality TEXT NOT NULL,
+                normalized_key TEXT UNIQUE NOT NULL,
+                municipality_key TEXT NOT NULL,
+                latitude REAL,
+                longitude REAL
+            )
+        ''')
+        cursor.execute('CREATE INDEX idx_locations_municipality ON locations(municipality_key)')
+        cursor.execute('''
+            ALTER TABLE processed_articles
+            ADD COLUMN location_id INTEGER REFERENCES locations(id)
+        ''')
+        cursor.execute('''
+            CREATE INDEX idx_processed_location_id
+            ON processed_articles(location_id, processed_at)
+        ''')
+
+        rows = cursor.execute('''
+            SELECT id, location, latitude, longitude FROM processed_articles
+            WHERE location IS NOT NULL ORDER BY id
+        ''').fetchall()
+        for article_id, location, lat, lon in rows:
+            location_id = self._location_id(cursor, location, lat, lon)
+            cursor.execute('UPDATE processed_articles SET location_id = ? WHERE id = ?',
+                           (location_id, article_id))
+
+    def _migrate_seen_urls(self, cursor):
+        """
+        Trwały zbiór odwiedzonych URL (skróty 64-bit) dla wszystkich lat, nie
+        tylko 7 dni, oraz zapisany filtr Blooma, który go przykrywa w pamięci
+        """
+        cursor.execute('''
+            CREATE TABLE seen_urls (
+                id INTEGER PRIMARY KEY,
+                url_hash INTEGER UNIQUE NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE bloom_filters (
+                name TEXT PRIMARY KEY,
+                bits BLOB NOT NULL,
+                num_hashes INTEGER NOT NULL,
+                capacity INTEGER NOT NULL,
+                covered_id INTEGER NOT NULL
+            )
+        ''')
+        cursor.executemany('INSERT OR IGNORE INTO seen_urls (url_hash) VALUES (?)',
+                           ((url_hash(row[0]),) for row in
+                            cursor.execute('SELECT url FROM raw_articles ORDER BY id').fetchall()))
+
+    def _migrate_severity(self, cursor):
+        """Waga zdarzenia 1-10 z LLM - z niej synchronizacja liczy trust dla heatmapy"""
+        cursor.execute('ALTER TABLE processed_articles ADD COLUMN severity INTEGER')
+
+    def _migrate_http_validators(self, cursor):
+        """
+        ETag / Last-Modified stron z listami artykułów - kolejne pobranie
+        wysyła zapytanie warunkowe, a niezmieniona strona wraca jako 304
+        """
+        cursor.execute('''
+            CREATE TABLE http_validators (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+    def _migrate_feeds(self, cursor):
+        """
+        Kanały RSS / Atom / sitemapy news znalezione dla stron z listami -
+        kolejne crawle pobierają kanał zamiast strony HTML
+        """
+        cursor.execute('''
+            CREATE TABLE discovered_feeds (
+                listing_url TEXT PRIMARY KEY,
+                feed_url TEXT NOT NULL,
+                discovered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+    def _migrate_unique_processed(self, cursor):
+        """
+        Jeden wiersz processed_articles na artykuł. Powtórne zapisy tego samego
+        URL (równoległe odpowiedzi, ponowny crawl, kanał + HTML) dopisywały
+        kolejne wiersze - zostaje najstarszy, a indeks pilnuje reszty.
+        """
+        cursor.execute('''
+            DELETE FROM processed_articles WHERE id NOT IN (
+                SELECT MIN(id) FROM processed_articles GROUP BY raw_article_id)
+        ''')
+        cursor.execute('DROP INDEX IF EXISTS idx_processed_raw')
+        cursor.execute('CREATE UNIQUE INDEX idx_processed_raw ON processed_articles(raw_article_id)')
+
+    def _migrate_published(self, cursor):
+        """
+        published_at: data publikacji z kanału / strony artykułu (UTC) - data
+        zdarzenia dla heatmapy; NULL, gdy źródło jej nie podaje
+        """
+        cursor.execute('ALTER TABLE raw_articles ADD COLUMN published_at TIMESTAMP')
+
+    # Indeks i w MIGRATIONS podnosi schemat z user_version i do i + 1
+    MIGRATIONS = [
+        _migrate_last_seen,
+        _migrate_leases,
+        _migrate_fts,
+        _migrate_compression,
+        _migrate_stats,
+        _migrate_locations,
+        _migrate_seen_urls,
+        _migrate_severity,
+        _migrate_http_validators,
+        _migrate_feeds,
+        _migrate_unique_processed,
+        _migrate_published,
+    ]
+
+    def _load_dictionaries(self, cursor):
+        if zstandard is None:
+            return
+        # Ostatni dodany słownik zostaje aktywny dla nowych zapisów
+        for row in cursor.execute('SELECT id, data FROM text_dictionaries ORDER BY created_at, rowid'):
+            self.codec.add_dictionary(row[0], row[1])
+
+    def _fetch_dictionary(self, dict_id: int) -> Optional[bytes]:
+        """
+        Słownik z text_dictionaries po id. Osobne połączenie, bo wywołanie
+        przychodzi też z wnętrza zapytania (funkcja SQL article_text).
+        """
+        conn = sqlite3.connect(self.db_path)
+        try:
+            row = conn.execute('SELECT data FROM text_dictionaries WHERE id = ?',
+                               (dict_id,)).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else None
+
+    def _create_schema(self, cursor):
         
         # Tabela z surowymi artykułami
         cursor.execute('''
@@ -66,38 +577,43 @@ class DatabaseManager:
             CREATE INDEX IF NOT EXISTS idx_location 
             ON processed_articles(location)
         ''')
-        
-        conn.commit()
-        conn.close()
-        print(f"Baza danych zainicjalizowana: {self.db_path}")
     
     def save_raw_article(self, url: str, title: str, raw_text: str, 
-                        source: str = "unknown") -> Optional[int]:
+                        source: str = "unknown",
+                        published_at: str = None) -> Tuple[int, bool]:
         """
-        Zapisuje surowy artykuł do bazy
+        Zapisuje surowy artykuł do bazy (jedno zapytanie: upsert z RETURNING)
         
         Returns:
-            ID artykułu lub None jeśli już istnieje
+            (ID artykułu, True jeśli wstawiono nowy / False jeśli już istniał)
         """
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute('''
-                INSERT INTO raw_articles (url, title, raw_text, source)
-                VALUES (?, ?, ?, ?)
-            ''', (url, title, raw_text, source))
-            
-            conn.commit()
-            article_id = cursor.lastrowid
+        with self.transaction() as cursor:
+            article_id, inserted = self._upsert_raw(cursor, url, title, raw_text, source,
+                                                    published_at)
+
+        if inserted:
             print(f"Zapisano artykuł ID={article_id}: {title[:50]}...")
-            return article_id
-            
-        except sqlite3.IntegrityError:
+        else:
             print(f"Artykuł już istnieje: {url}")
-            return None
-        finally:
-            conn.close()
+        return article_id, inserted
+
+    def _upsert_raw(self, cursor, url, title, raw_text, source,
+                    published_at=None) -> Tuple[int, bool]:
+        # Przy konflikcie tylko oznaczamy ponowne napotkanie (i uzupełniamy brakującą
+        # datę publikacji) - last_seen_at pozostaje NULL wyłącznie dla świeżo wstawionego wiersza
+        cursor.execute('''
+            INSERT INTO raw_articles (url, title, raw_text, source, published_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(url) DO UPDATE SET
+                last_seen_at = CURRENT_TIMESTAMP,
+                published_at = COALESCE(published_at, excluded.published_at)
+            RETURNING id, last_seen_at IS NULL
+        ''', (url, title, self.codec.compress(raw_text), source, published_at))
+        article_id, inserted = cursor.fetchone()
+        if inserted:
+            cursor.execute('INSERT OR IGNORE INTO seen_urls (url_hash) VALUES (?)',
+                           (url_hash(url),))
+        return article_id, bool(inserted)
     
     def get_unprocessed_articles(self, limit: int = 10) -> List[Dict]:
         """
@@ -106,11 +622,10 @@ class DatabaseManager:
         Args:
             limit: Maksymalna liczba artykułów do pobrania
         """
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        cursor = self.get_connection().cursor()
         
         cursor.execute('''
-            SELECT id, url, title, raw_text, source
+            SELECT id, url, title, article_text(raw_text) AS raw_text, source
             FROM raw_articles
             WHERE is_processed = 0 AND processing_attempts < 3
             ORDER BY scraped_at DESC
@@ -118,86 +633,347 @@ class DatabaseManager:
         ''', (limit,))
         
         articles = [dict(row) for row in cursor.fetchall()]
-        conn.close()
         
         print(f"Pobrano {len(articles)} nieprzetworzonych artykułów")
         return articles
     
+    def claim_articles(self, owner: str, limit: int = 10,
+                       lease_seconds: int = 300, max_attempts: int = 3) -> List[Dict]:
+        """
+        Atomowo rezerwuje do `limit` nieprzetworzonych artykułów dla `owner`
+        na `lease_seconds` sekund. Wiersze z wygasłą dzierżawą (np. po awarii
+        workera) wracają do puli. Każde pobranie liczy się jako próba.
+
+        Po przetworzeniu: ack_article(), po błędzie: nack_article().
+        """
+        with self.transaction() as cursor:
+            cursor.execute('''
+                UPDATE raw_articles
+                SET lease_owner = ?,
+                    lease_expires_at = datetime('now', ?),
+                    processing_attempts = processing_attempts + 1
+                WHERE id IN (
+                    SELECT id FROM raw_articles
+                    WHERE is_processed = 0
+                      AND processing_attempts < ?
+                      AND (lease_expires_at IS NULL OR lease_expires_at < datetime('now'))
+                    ORDER BY scraped_at DESC
+                    LIMIT ?
+                )
+                RETURNING id, url, title, article_text(raw_text) AS raw_text, source
+            ''', (owner, f'+{int(lease_seconds)} seconds', max_attempts, limit))
+            return [dict(row) for row in cursor.fetchall()]
+
+    def ack_article(self, raw_article_id: int, owner: str,
+                    processed: Optional[Dict] = None) -> bool:
+        """
+        Kończy dzierżawę sukcesem. `processed` to argumenty dla
+        processed_articles (crime_type, location, summary, keywords,
+        latitude, longitude); None - artykuł odrzucony, tylko oznaczany.
+
+        Returns:
+            False jeśli dzierżawa wygasła i wiersz przejął inny worker
+        """
+        with self.transaction() as cursor:
+            cursor.execute('''
+                UPDATE raw_articles
+                SET is_processed = 1, lease_owner = NULL, lease_expires_at = NULL
+                WHERE id = ? AND lease_owner = ?
+            ''', (raw_article_id, owner))
+            if cursor.rowcount == 0:
+                return False
+            if processed is not None:
+                self._insert_processed(cursor, raw_article_id,
+                                       processed.get('crime_type'),
+                                       processed.get('location'),
+                                       processed.get('summary'),
+                                       processed.get('keywords'),
+                                       processed.get('latitude'),
+                                       processed.get('longitude'),
+                                       processed.get('severity'))
+        return True
+
+    def nack_article(self, raw_article_id: int, owner: str):
+        """Zwalnia dzierżawę po błędzie - wiersz wraca do puli (do max_attempts prób)"""
+        with self.transaction() as cursor:
+            cursor.execute('''
+                UPDATE raw_articles
+                SET lease_owner = NULL, lease_expires_at = NULL
+                WHERE id = ? AND lease_owner = ?
+            ''', (raw_article_id, owner))
+
     def update_processed_article(self, raw_article_id: int, 
                                  crime_type: str, location: str,
                                  summary: str, keywords: str,
                                  latitude: float = None, 
-                                 longitude: float = None):
+                                 longitude: float = None,
+                                 severity: int = None):
         """Zapisuje przetworzone dane artykułu"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
         try:
-            # Zapisz przetworzone dane
-            cursor.execute('''
-                INSERT INTO processed_articles 
-                (raw_article_id, crime_type, location, summary, keywords, 
-                 latitude, longitude)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (raw_article_id, crime_type, location, summary, keywords,
-                  latitude, longitude))
-            
-            # Oznacz artykuł jako przetworzony
-            cursor.execute('''
-                UPDATE raw_articles 
-                SET is_processed = 1 
-                WHERE id = ?
-            ''', (raw_article_id,))
-            
-            conn.commit()
+            with self.transaction() as cursor:
+                self._insert_processed(cursor, raw_article_id, crime_type, location,
+                                       summary, keywords, latitude, longitude, severity)
             print(f"Przetworzono artykuł ID={raw_article_id}")
             
         except Exception as e:
             print(f"Błąd przetwarzania artykułu ID={raw_article_id}: {e}")
             # Zwiększ licznik prób
-            cursor.execute('''
-                UPDATE raw_articles 
-                SET processing_attempts = processing_attempts + 1 
-                WHERE id = ?
-            ''', (raw_article_id,))
-            conn.commit()
-        finally:
-            conn.close()
+            with self.transaction() as cursor:
+                cursor.execute('''
+                    UPDATE raw_articles 
+                    SET processing_attempts = processing_attempts + 1 
+                    WHERE id = ?
+                ''', (raw_article_id,))
+
+    def _insert_processed(self, cursor, raw_article_id, crime_type, location,
+                          summary, keywords, latitude, longitude, severity=None) -> bool:
+        """
+        Zapisuje przetworzone dane, jeśli artykuł ich jeszcze nie ma.
+        Returns: False, gdy artykuł był już przetworzony (nic nie zapisano)
+        """
+        # Sprawdzenie i zapis w jednej transakcji (BEGIN IMMEDIATE) - bez wyścigu
+        if cursor.execute('SELECT 1 FROM processed_articles WHERE raw_article_id = ?',
+                          (raw_article_id,)).fetchone():
+            return False
+
+        # Zapisz przetworzone dane
+        location_id = self._location_id(cursor, location, latitude, longitude)
+        cursor.execute('''
+            INSERT INTO processed_articles 
+            (raw_article_id, crime_type, location, summary, keywords, 
+             latitude, longitude, location_id, severity)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (raw_article_id, crime_type, location, summary, keywords,
+              latitude, longitude, location_id, severity))
+        
+        # Oznacz artykuł jako przetworzony
+        cursor.execute('''
+            UPDATE raw_articles 
+            SET is_processed = 1 
+            WHERE id = ?
+        ''', (raw_article_id,))
+        return True
+
+    def _location_id(self, cursor, location, latitude, longitude) -> Optional[int]:
+        """Id miejsca z tabeli locations (tworzy wiersz przy pierwszym wystąpieniu)"""
+        parsed = normalize_location(location)
+        if parsed is None:
+            return None
+        name, municipality, key, municipality_key = parsed
+        # Współrzędne z pierwszego geokodowania; puste uzupełniamy później
+        cursor.execute('''
+            INSERT INTO locations (name, municipality, normalized_key, municipality_key,
+                                   latitude, longitude)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(normalized_key) DO UPDATE SET
+                latitude = COALESCE(latitude, excluded.latitude),
+                longitude = COALESCE(longitude, excluded.longitude)
+            RETURNING id
+        ''', (name, municipality, key, municipality_key, latitude, longitude))
+        return cursor.fetchone()[0]
+
+    def save_article(self, url: str, title: str, raw_text: str, source: str,
+                     crime_type: str, location: str, summary: str, keywords: str,
+                     latitude: float = None, longitude: float = None,
+                     severity: int = None, published_at: str = None) -> int:
+        """
+        Zapisuje surowy artykuł i jego przetworzone dane w JEDNEJ transakcji
+        (jeden commit zamiast osobnych zapisów). Jeśli artykuł o tym URL już
+        istnieje, dopisuje przetworzone dane do istniejącego wiersza - chyba że
+        ten ma je już z wcześniejszego zapisu (wtedy nic nie zmienia).
+
+        Returns:
+            ID surowego artykułu
+        """
+        with self.transaction() as cursor:
+            raw_article_id, _ = self._upsert_raw(cursor, url, title, raw_text, source,
+                                                 published_at)
+            processed = self._insert_processed(cursor, raw_article_id, crime_type, location,
+                                               summary, keywords, latitude, longitude, severity)
+
+        if processed:
+            print(f"Zapisano i przetworzono artykuł ID={raw_article_id}: {title[:50]}...")
+        else:
+            print(f"Artykuł już przetworzony: {url}")
+        return raw_article_id
     
-    def get_statistics(self) -> Dict:
-        """Zwraca statystyki bazy danych"""
+    def get_article_text(self, article_id: int) -> Optional[str]:
+        """Zwraca (rozpakowaną) treść jednego artykułu"""
+        row = self.get_connection().execute(
+            'SELECT raw_text FROM raw_articles WHERE id = ?', (article_id,)
+        ).fetchone()
+        return self.codec.decompress(row[0]) if row else None
+
+    def train_text_dictionary(self, samples: int = 1000,
+                              dict_size: int = 110 * 1024) -> Optional[int]:
+        """
+        Trenuje słownik zstd na najnowszych artykułach (powtarzalne stopki,
+        formułki policyjnych komunikatów) i ustawia go jako aktywny.
+        Kolejne zapisy i compress_existing() go używają.
+
+        Returns:
+            id słownika lub None, gdy zstd niedostępny / za mało danych
+        """
+        if zstandard is None:
+            print("Brak pakietu zstandard - słownik niedostępny, używam zlib")
+            return None
+
+        texts = [self.codec.decompress(row[0]).encode('utf-8') for row in
+                 self.get_connection().execute(
+                     'SELECT raw_text FROM raw_articles ORDER BY id DESC LIMIT ?',
+                     (samples,))]
+        try:
+            zdict = zstandard.train_dictionary(dict_size, texts)
+        except zstandard.ZstdError as e:
+            print(f"Nie udało się wytrenować słownika ({len(texts)} próbek): {e}")
+            return None
+
+        dict_id = zdict.dict_id()
+        with self.transaction() as cursor:
+            cursor.execute('INSERT OR REPLACE INTO text_dictionaries (id, data) VALUES (?, ?)',
+                           (dict_id, zdict.as_bytes()))
+        self.codec.add_dictionary(dict_id, zdict.as_bytes())
+        print(f"Słownik zstd id={dict_id}: {len(zdict.as_bytes())} B z {len(texts)} artykułów")
+        return dict_id
+
+    def compress_existing(self, batch_size: int = 200) -> Dict:
+        """
+        Backfill: kompresuje treść wierszy zapisanych jeszcze jako TEXT.
+        Miejsce w pliku wraca do systemu dopiero po VACUUM.
+
+        Returns:
+            Liczba wierszy i rozmiar treści przed/po (bajty)
+        """
+        report = {'rows': 0, 'bytes_before': 0, 'bytes_after': 0}
+        last_id = 0
+        while True:
+            rows = self.get_connection().execute('''
+                SELECT id, raw_text FROM raw_articles
+                WHERE id > ? AND typeof(raw_text) = 'text'
+                ORDER BY id LIMIT ?
+            ''', (last_id, batch_size)).fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            updates = []
+            for article_id, text in rows:
+                packed = self.codec.compress(text)
+                if isinstance(packed, bytes):
+                    updates.append((packed, article_id))
+                    report['rows'] += 1
+                    report['bytes_before'] += len(text.encode('utf-8'))
+                    report['bytes_after'] += len(packed)
+
+            with self.transaction() as cursor:
+                cursor.executemany('UPDATE raw_articles SET raw_text = ? WHERE id = ?', updates)
+
         conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT COUNT(*) FROM raw_articles')
-        total_articles = cursor.fetchone()[0]
-        
-        cursor.execute('SELECT COUNT(*) FROM raw_articles WHERE is_processed = 1')
-        processed_articles = cursor.fetchone()[0]
-        
-        cursor.execute('SELECT COUNT(*) FROM raw_articles WHERE is_processed = 0')
-        pending_articles = cursor.fetchone()[0]
+        page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+        report['reclaimable_bytes'] = conn.execute('PRAGMA freelist_count').fetchone()[0] * page_size
+
+        saved = report['bytes_before'] - report['bytes_after']
+        ratio = 100 * saved / report['bytes_before'] if report['bytes_before'] else 0
+        print(f"Skompresowano {report['rows']} artykułów: "
+              f"{report['bytes_before']} B -> {report['bytes_after']} B "
+              f"(oszczędność {saved} B, {ratio:.1f}%)")
+        print(f"Wolne strony do odzyskania przez VACUUM: {report['reclaimable_bytes']} B")
+        return report
+
+    def get_statistics(self) -> Dict:
+        """Zwraca statystyki bazy danych (z liczników utrzymywanych przez triggery)"""
+        cursor = self.get_connection().cursor()
         
-        conn.close()
+        cursor.execute('''
+            SELECT source, total, processed, last_scraped_at
+            FROM source_stats WHERE total > 0
+            ORDER BY total DESC
+        ''')
+        sources = [dict(row) for row in cursor.fetchall()]
+
+        cursor.execute('''
+            SELECT crime_type, count FROM crime_type_stats
+            WHERE count > 0 ORDER BY count DESC
+        ''')
+        crime_types = {row['crime_type']: row['count'] for row in cursor.fetchall()}
+
+        total_articles = sum(s['total'] for s in sources)
+        processed_articles = sum(s['processed'] for s in sources)
+        pending_articles = total_articles - processed_articles
         
         return {
             'total_articles': total_articles,
             'processed': processed_articles,
             'pending': pending_articles,
-            'completion_rate': f"{(processed_articles/total_articles*100):.1f}%" if total_articles > 0 else "0%"
+            'completion_rate': f"{(processed_articles/total_articles*100):.1f}%" if total_articles > 0 else "0%",
+            'last_scraped_at': max((s['last_scraped_at'] or '' for s in sources), default=None) or None,
+            'sources': sources,
+            'crime_types': crime_types,
         }
     
+    @staticmethod
+    def _fts_query(text: str, column: str = None, prefix: bool = True) -> Optional[str]:
+        """
+        Zamienia tekst użytkownika na bezpieczne zapytanie FTS5: każde słowo
+        jako fraza w cudzysłowie (opcjonalnie z prefiksem *), wszystkie
+        wymagane. None gdy w tekście nie ma słów.
+        """
+        words = re.findall(r'\w+', text or '')
+        if not words:
+            return None
+        star = '*' if prefix else ''
+        query = ' '.join(f'"{w}"{star}' for w in words)
+        if column:
+            query = f'{column} : ({query})'
+        return query
+
+    def search_articles(self, query: str, limit: int = 20,
+                        prefix: bool = True) -> List[Dict]:
+        """
+        Wyszukiwanie pełnotekstowe w tytułach, treści, streszczeniach
+        i lokalizacjach, posortowane wg trafności (bm25).
+
+        Args:
+            query: Słowa do wyszukania, np. "kradzież krak" (prefiksy)
+        """
+        match = self._fts_query(query, prefix=prefix)
+        if match is None:
+            return []
+
+        cursor = self.get_connection().cursor()
+        # Wagi bm25: tytuł i lokalizacja ważą więcej niż treść
+        cursor.execute('''
+            SELECT
+                r.id,
+                r.title,
+                r.url,
+                r.source,
+                r.scraped_at,
+                snippet(articles_fts, 1, '[', ']', '…', 12) AS snippet,
+                bm25(articles_fts, 10.0, 1.0, 4.0, 6.0) AS score
+            FROM articles_fts
+            JOIN raw_articles r ON r.id = articles_fts.rowid
+            WHERE articles_fts MATCH ?
+            ORDER BY score
+            LIMIT ?
+        ''', (match, limit))
+
+        return [dict(row) for row in cursor.fetchall()]
+
     def get_crimes_by_location(self, location_filter: str = None) -> List[Dict]:
         """
         Pobiera przestępstwa z opcjonalnym filtrem lokalizacji
         
         Args:
-            location_filter: Fragment nazwy lokalizacji (np. "Kraków")
+            location_filter: Początek nazwy miejsca lub gminy (np. "Kraków",
+                "krak", "Wielicka") - bez znaczenia wielkość liter i polskie znaki
         """
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        cursor = self.get_connection().cursor()
+        key = _location_key(location_filter or '')
         
-        if location_filter:
+        if key:
+            # Zakresy po kluczach zamiast LIKE - oba warunki idą po indeksach
+            upper = key + '\uffff'
             cursor.execute('''
                 SELECT 
                     r.title,
@@ -209,12 +985,16 @@ class DatabaseManager:
                     p.keywords,
                     p.latitude,
                     p.longitude,
-                    p.processed_at
-                FROM processed_articles p
-                JOIN raw_articles r ON p.raw_article_id = r.id
-                WHERE p.location LIKE ?
+                    p.processed_at,
+                    l.id AS location_id,
+                    l.municipality
+                FROM locations l
+                JOIN processed_articles p ON p.location_id = l.id
+                JOIN raw_articles r ON r.id = p.raw_article_id
+                WHERE (l.municipality_key >= ? AND l.municipality_key < ?)
+                   OR (l.normalized_key >= ? AND l.normalized_key < ?)
                 ORDER BY p.processed_at DESC
-            ''', (f'%{location_filter}%',))
+            ''', (key, upper, key, upper))
         else:
             cursor.execute('''
                 SELECT 
@@ -234,10 +1014,299 @@ class DatabaseManager:
             ''')
         
         crimes = [dict(row) for row in cursor.fetchall()]
-        conn.close()
         
         return crimes
 
+    def get_processed_since(self, after_id: int = 0, limit: int = 500) -> List[Dict]:
+        """
+        Przetworzone artykuły z id > after_id (rosnąco) - dla przyrostowej
+        synchronizacji do heatmapy; koszt zależy tylko od liczby nowych wierszy
+        """
+        cursor = self.get_connection().cursor()
+        cursor.execute('''
+            SELECT
+                p.id,
+                p.crime_type,
+                p.location,
+                p.latitude,
+                p.longitude,
+                p.severity,
+                p.processed_at,
+                r.published_at,
+                l.municipality
+            FROM processed_articles p
+            JOIN raw_articles r ON r.id = p.raw_article_id
+            LEFT JOIN locations l ON l.id = p.location_id
+            WHERE p.id > ?
+            ORDER BY p.id
+            LIMIT ?
+        ''', (after_id, limit))
+
+        return [dict(row) for row in cursor.fetchall()]
+
+    def get_http_validators(self, url: str) -> Optional[Dict]:
+        """Zapisane ETag / Last-Modified dla URL albo None"""
+        row = self.get_connection().execute(
+            'SELECT etag, last_modified FROM http_validators WHERE url = ?', (url,)).fetchone()
+        return dict(row) if row else None
+
+    def save_http_validators(self, url: str, etag: Optional[str], last_modified: Optional[str]):
+        """Zapisuje walidatory odpowiedzi; checked_at liczy się też dla 304 (retencja)"""
+        with self.transaction() as cursor:
+            cursor.execute('''
+                INSERT INTO http_validators (url, etag, last_modified) VALUES (?, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                    etag = excluded.etag,
+                    last_modified = excluded.last_modified,
+                    checked_at = CURRENT_TIMESTAMP
+            ''', (url, etag, last_modified))
+
+    def get_feed(self, listing_url: str) -> Optional[str]:
+        """URL kanału zapisanego dla strony z listą albo None"""
+        row = self.get_connection().execute(
+            'SELECT feed_url FROM discovered_feeds WHERE listing_url = ?', (listing_url,)).fetchone()
+        return row[0] if row else None
+
+    def save_feed(self, listing_url: str, feed_url: str):
+        with self.transaction() as cursor:
+            cursor.execute('''
+                INSERT INTO discovered_feeds (listing_url, feed_url) VALUES (?, ?)
+                ON CONFLICT(listing_url) DO UPDATE SET
+                    feed_url = excluded.feed_url,
+                    discovered_at = CURRENT_TIMESTAMP
+            ''', (listing_url, feed_url))
+
+    def drop_feed(self, listing_url: str):
+        """Usuwa niedziałający kanał - strona wraca do zbierania linków z HTML"""
+        with self.transaction() as cursor:
+            cursor.execute('DELETE FROM discovered_feeds WHERE listing_url = ?', (listing_url,))
+
+    def get_location_stats(self, by_municipality: bool = True, limit: int = 50) -> List[Dict]:
+        """
+        Liczba zdarzeń per miejsce (lub per gmina), od najczęstszych
+
+        Args:
+            by_municipality: True - grupuj po gminie, False - po konkretnym miejscu
+        """
+        group = 'l.municipality_key' if by_municipality else 'l.id'
+        name = 'l.municipality' if by_municipality else 'l.name'
+        cursor = self.get_connection().cursor()
+        cursor.execute(f'''
+            SELECT
+                {name} AS name,
+                l.municipality,
+                AVG(l.latitude) AS latitude,
+                AVG(l.longitude) AS longitude,
+                COUNT(*) AS count,
+                MAX(p.processed_at) AS last_processed_at
+            FROM processed_articles p
+            JOIN locations l ON l.id = p.location_id
+            GROUP BY {group}
+            ORDER BY count DESC
+            LIMIT ?
+        ''', (limit,))
+
+        return [dict(row) for row in cursor.fetchall()]
+
+class UrlSeenIndex:
+    """
+    Zbiór już zapisanych URL dla spiderów: filtr Blooma w pamięci przed
+    tabelą seen_urls. Start wczytuje jeden BLOB filtra i dopisuje tylko URL
+    dodane od ostatniego zapisu (id > covered_id) - bez ładowania historii.
+    "Nie" z filtra jest pewne; "może" sprawdzamy jednym zapytaniem po indeksie.
+    """
+
+    NAME = 'seen_urls'
+
+    def __init__(self, db: DatabaseManager, capacity: int = 100_000,
+                 error_rate: float = 0.001):
+        self.db = db
+        self.error_rate = error_rate
+        self._added = set()  # dodane w tej sesji (mogą czekać w kolejce zapisu)
+
+        row = db.get_connection().execute(
+            'SELECT bits, num_hashes, capacity, covered_id FROM bloom_filters WHERE name = ?',
+            (self.NAME,)).fetchone()
+        total = db.get_connection().execute('SELECT MAX(id) FROM seen_urls').fetchone()[0] or 0
+        if row is None or row['capacity'] < total:
+            # Pierwsze uruchomienie albo filtr przepełniony - budujemy większy
+            self._reset(max(capacity, 2 * total))
+        else:
+            self.bits = bytearray(row['bits'])
+            self.num_hashes = row['num_hashes']
+            self.capacity = row['capacity']
+            self.covered_id = row['covered_id']
+        self._catch_up()
+
+    def _reset(self, capacity):
+        self.capacity = capacity
+        num_bits = max(8, int(-capacity * math.log(self.error_rate) / math.log(2) ** 2))
+        self.bits = bytearray((num_bits + 7) // 8)
+        self.num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+        self.covered_id = 0
+
+    def _positions(self, h):
+        # Podwójne haszowanie z 64-bitowego skrótu: h1 + i * h2
+        h &= (1 << 64) - 1
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        num_bits = len(self.bits) * 8
+        return ((h1 + i * h2) % num_bits for i in range(self.num_hashes))
+
+    def _add_hash(self, h):
+        for pos in self._positions(h):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def _might_contain(self, h):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(h))
+
+    def _catch_up(self):
+        for row in self.db.get_connection().execute(
+                'SELECT id, url_hash FROM seen_urls WHERE id > ? ORDER BY id',
+                (self.covered_id,)):
+            self._add_hash(row[1])
+            self.covered_id = row[0]
+
+    def __contains__(self, url: str) -> bool:
+        h = url_hash(url)
+        if not self._might_contain(h):
+            return False
+        if h in self._added:
+            return True
+        return self.db.get_connection().execute(
+            'SELECT 1 FROM seen_urls WHERE url_hash = ?', (h,)).fetchone() is not None
+
+    def add(self, url: str):
+        """
+        Oznacza URL w pamięci. Do seen_urls trafia razem z artykułem
+        (save_raw_article / AsyncArticleWriter), bez osobnego zapisu tutaj.
+        """
+        h = url_hash(url)
+        self._added.add(h)
+        self._add_hash(h)
+
+    def __len__(self):
+        return self.covered_id + len(self._added)
+
+    def save(self):
+        """Zapisuje filtr (po dociągnięciu wpisów innych procesów) na następny start"""
+        self._catch_up()
+        with self.db.transaction() as cursor:
+            cursor.execute('''
+                INSERT OR REPLACE INTO bloom_filters (name, bits, num_hashes, capacity, covered_id)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (self.NAME, bytes(self.bits), self.num_hashes, self.capacity, self.covered_id))
+
+
+class AsyncArticleWriter:
+    """
+    Zapis artykułów w tle (write-behind): callbacki spidera tylko wrzucają
+    rekordy do kolejki, a osobny wątek zapisuje je paczkami - co
+    `batch_size` rekordów albo co `flush_interval_ms` ms, jedna transakcja
+    (jeden fsync) na paczkę. Reaktor Twisted nie czeka na dysk.
+
+    Wyniki trafiają do słownika `stats` (saved_to_db, db_write_errors).
+    close() zapisuje wszystko, co zostało w kolejce, i robi checkpoint WAL -
+    po jego powrocie każdy przyjęty rekord jest trwale w bazie albo policzony
+    w db_write_errors.
+    """
+
+    _STOP = object()
+
+    def __init__(self, db: DatabaseManager, batch_size: int = 50,
+                 flush_interval_ms: int = 500, stats: Dict = None,
+                 max_pending: int = 1000):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.stats = stats if stats is not None else {}
+        self.stats.setdefault("saved_to_db", 0)
+        self.stats.setdefault("db_write_errors", 0)
+        self._stats_lock = threading.Lock()
+        # Ograniczona kolejka: gdy dysk nie nadąża, submit() spowalnia spidera
+        # zamiast zbierać rekordy w pamięci bez końca
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="article-writer",
+                                        daemon=True)
+        self._thread.start()
+
+    def submit_article(self, **record):
+        """Kolejkuje surowy + przetworzony artykuł (argumenty jak save_article)"""
+        self._submit(("article", record))
+
+    def submit_raw_article(self, **record):
+        """Kolejkuje sam surowy artykuł (argumenty jak save_raw_article)"""
+        self._submit(("raw", record))
+
+    def _submit(self, item):
+        if self._closed:
+            raise RuntimeError("AsyncArticleWriter jest zamknięty")
+        self._queue.put(item)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            if batch:
+                self._flush(batch)
+        self.db.close()
+
+    def _flush(self, batch):
+        try:
+            with self.db.transaction() as cursor:
+                for item in batch:
+                    self._write(cursor, item)
+            self._count("saved_to_db", len(batch))
+        except Exception as e:
+            # Jeden zły rekord nie może zabrać całej paczki - zapis pojedynczo
+            print(f"Błąd zapisu paczki ({len(batch)} rekordów): {e}")
+            for item in batch:
+                try:
+                    with self.db.transaction() as cursor:
+                        self._write(cursor, item)
+                    self._count("saved_to_db", 1)
+                except Exception as e:
+                    print(f"Błąd zapisu artykułu {item[1].get('url')}: {e}")
+                    self._count("db_write_errors", 1)
+
+    def _write(self, cursor, item):
+        kind, r = item
+        raw_article_id, _ = self.db._upsert_raw(cursor, r["url"], r["title"],
+                                                r["raw_text"], r.get("source", "unknown"),
+                                                r.get("published_at"))
+        if kind == "article":
+            self.db._insert_processed(cursor, raw_article_id, r["crime_type"],
+                                      r["location"], r["summary"], r["keywords"],
+                                      r.get("latitude"), r.get("longitude"),
+                                      r.get("severity"))
+
+    def _count(self, key, n):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def close(self):
+        """Zapisuje zaległe rekordy, czeka na wątek i robi checkpoint WAL"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(self._STOP)
+        self._thread.join()
+        # synchronous=NORMAL w WAL: checkpoint zapisuje commity do pliku bazy
+        self.db.get_connection().execute("PRAGMA wal_checkpoint(FULL)")
+
 
 # Globalna instancja (singleton)
 DB_MANAGER: Optional['DatabaseManager'] = None 
@@ -247,4 +1316,15 @@ def initialize_db_manager(db_path: str):
     global DB_MANAGER
     if DB_MANAGER is None:
         DB_MANAGER = DatabaseManager(db_path=db_path)
-    return DB_MANAGER
\ No newline at end of file
+    return DB_MANAGER
+
+
+if __name__ == "__main__":
+    import sys
+
+    # python -m agent.db compress [--train]   (z katalogu src/)
+    if len(sys.argv) > 1 and sys.argv[1] == "compress":
+        db = DatabaseManager("data/crime_data.db")
+        if "--train" in sys.argv:
+            db.train_text_dictionary()
+        db.compress_existing()
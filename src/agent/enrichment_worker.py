@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Pula workerów wzbogacających raw_articles przez LLM, niezależna od crawlera.
+
+Spider z DEFER_ENRICHMENT=1 zapisuje tylko surowe artykuły; ten proces
+pobiera je przez dzierżawy (claim_articles), wyciąga szczegóły przez AI
+i potwierdza (ack) albo zwalnia (nack). Upadły worker nie gubi pracy -
+jego dzierżawy wygasają i wiersze wracają do puli.
+
+Uruchomienie (z katalogu src/):
+    python -m agent.enrichment_worker --workers 4 --backend ollama
+"""
+import argparse
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from agent.db import DatabaseManager
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def load_ai_filter(backend: str):
+    if backend == "groq":
+        from agent.crime_news_scrapper.ai_filter_groq import CrimeFilterLocal
+    elif backend == "gemini":
+        from agent.crime_news_scrapper.ai_filter_gemini import CrimeFilterLocal
+    else:
+        from agent.crime_news_scrapper.ai_filter_ollama import CrimeFilterLocal
+    return CrimeFilterLocal()
+
+
+class EnrichmentWorkerPool:
+    def __init__(self, db: DatabaseManager, ai_filter, workers=4, batch_size=5,
+                 lease_seconds=300, poll_seconds=0):
+        self.db = db
+        self.ai_filter = ai_filter
+        self.workers = workers
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        # 0 = zakończ, gdy kolejka pusta; >0 = czekaj na nowe artykuły
+        self.poll_seconds = poll_seconds
+        self.stop_event = threading.Event()
+
+        self.stats = {"claimed": 0, "enriched": 0, "rejected": 0,
+                      "failed": 0, "lease_lost": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def run(self):
+        logger.info(f"Start puli: {self.workers} workerów, paczki po {self.batch_size}")
+        with ThreadPoolExecutor(max_workers=self.workers,
+                                thread_name_prefix="enrich") as pool:
+            futures = [pool.submit(self._worker_loop, i) for i in range(self.workers)]
+            try:
+                for f in futures:
+                    f.result()
+            except KeyboardInterrupt:
+                logger.info("Przerwano - kończę bieżące artykuły...")
+                self.stop_event.set()
+
+        try:
+            self.ai_filter._save_cache()
+        except Exception as e:
+            logger.error(f"Błąd zapisu cache: {e}")
+
+        logger.info("=" * 60)
+        for k, v in self.stats.items():
+            logger.info(f"  {k}: {v}")
+        logger.info("=" * 60)
+
+    def _worker_loop(self, index):
+        owner = f"{socket.gethostname()}:{os.getpid()}:{index}"
+        try:
+            while not self.stop_event.is_set():
+                articles = self.db.claim_articles(owner, limit=self.batch_size,
+                                                  lease_seconds=self.lease_seconds)
+                if not articles:
+                    if not self.poll_seconds:
+                        return
+                    self.stop_event.wait(self.poll_seconds)
+                    continue
+
+                self._count("claimed", len(articles))
+                for article in articles:
+                    if self.stop_event.is_set():
+                        # Nieprzetworzone zwracamy od razu zamiast czekać na wygaśnięcie
+                        self.db.nack_article(article["id"], owner)
+                        continue
+                    self._process(article, owner)
+        finally:
+            self.db.close()
+
+    def _process(self, article, owner):
+        article_id = article["id"]
+        try:
+            info = self.ai_filter.extract_event_info(article["title"], "",
+                                                     article["raw_text"])
+        except Exception as e:
+            logger.error(f"Błąd AI dla ID={article_id}: {e}")
+            self.db.nack_article(article_id, owner)
+            self._count("failed")
+            return
+
+        if info.get("latitude") is None or info.get("longitude") is None:
+            # Bez współrzędnych nie trafi na mapę - oznaczamy jako obsłużony
+            processed = None
+        else:
+            processed = {
+                "crime_type": info["crime_type"],
+                "location": info["location_name"],
+                "summary": info["short_summary"],
+                "keywords": info["crime_type"],
+                "latitude": info["latitude"],
+                "longitude": info["longitude"],
+                "severity": info.get("severity"),
+            }
+
+        if not self.db.ack_article(article_id, owner, processed):
+            logger.warning(f"Dzierżawa ID={article_id} wygasła - wynik odrzucony")
+            self._count("lease_lost")
+        elif processed is None:
+            self._count("rejected")
+        else:
+            self._count("enriched")
+            logger.info(f"ID={article_id}: {info['crime_type']} @ {info['location_name']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Wzbogacanie raw_articles przez LLM")
+    parser.add_argument("--db", default="data/crime_data.db")
+    parser.add_argument("--backend", choices=["ollama", "groq", "gemini"], default="ollama")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch", type=int, default=5)
+    parser.add_argument("--lease", type=int, default=300,
+                        help="czas dzierżawy w sekundach")
+    parser.add_argument("--follow", type=float, default=0,
+                        help="zamiast kończyć na pustej kolejce, sprawdzaj co N sekund")
+    args = parser.parse_args()
+
+    db = DatabaseManager(args.db)
+    pool = EnrichmentWorkerPool(db, load_ai_filter(args.backend),
+                                workers=args.workers, batch_size=args.batch,
+                                lease_seconds=args.lease, poll_seconds=args.follow)
+    start = time.time()
+    pool.run()
+    logger.info(f"Czas: {time.time() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,12 @@
 import os
 import sqlite3
 import json
-from datetime import datetime
+import itertools
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
 
 from flask_wtf import FlaskForm
 from wtforms import StringField, SubmitField
@@ -10,6 +15,16 @@ from wtforms.validators import DataRequired, Email
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(BASE_DIR, "data.db")
+# Cold partition of scrapped_data, ATTACHed only when a query needs it
+ARCHIVE_PATH = os.path.join(BASE_DIR, "archive.db")
+ARCHIVE_HORIZON_DAYS = int(os.environ.get("ARCHIVE_HORIZON_DAYS", 365))
+# Optional read snapshot for the web tier (READ_SNAPSHOT=1), see connect_read_db
+READ_SNAPSHOT = os.environ.get("READ_SNAPSHOT", "0") == "1"
+READ_SNAPSHOT_INTERVAL = int(os.environ.get("READ_SNAPSHOT_INTERVAL", 30))
+# "thread": each web process refreshes the snapshot in a background thread;
+# "job": only `python -m src.database.db snapshot` does (one copy for all workers)
+READ_SNAPSHOT_REFRESH = os.environ.get("READ_SNAPSHOT_REFRESH", "thread")
+SNAPSHOT_PATH = os.path.join(BASE_DIR, "data_snapshot.db")
 
 
 class LoginForm(FlaskForm):
@@ -17,10 +32,23 @@ class LoginForm(FlaskForm):
     submit = SubmitField('Wyślij link logowania')
 
 
+# Database paths whose schema was already created/migrated by this process
+_schema_ready = set()
+
+
 def connect_db():
-    """Connects to the SQLite database and creates the tables if they don’t exist."""
+    """Connects to the SQLite database and creates the tables if they don’t exist.
+
+    The schema is checked once per process and database path, so later
+    connections cost no extra statements.
+    """
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
+    if DB_PATH in _schema_ready:
+        return conn
+
+    # WAL (persistent in the file): readers and the snapshot copy do not block writers
+    conn.execute("PRAGMA journal_mode=WAL")
     cursor = conn.cursor()
 
     cursor.execute("""
@@ -64,11 +92,455 @@ def connect_db():
     """)
 
     conn.commit()
+    _migrate(conn)
+    _schema_ready.add(DB_PATH)
+    return conn
+
+
+# --- Coordinates ---
+
+_transformer = None
+
+
+def convert_point(x, y):
+    """
+    Converts stored coordinates to (lat, lon) in EPSG:4326.
+    Values > 10000 are treated as PUWG 1992 (EPSG:2180), as returned by KMZB.
+    """
+    global _transformer
+    if x > 10000 and y > 10000:
+        if _transformer is None:
+            from pyproj import Transformer
+            _transformer = Transformer.from_crs("EPSG:2180", "EPSG:4326", always_xy=True)
+        lon, lat = _transformer.transform(x, y)
+        return lat, lon
+    # Już w formacie lat, lon
+    return x, y
+
+
+# --- Read snapshot ---
+
+_snapshot_lock = threading.Lock()
+_snapshot_refresher = None
+
+
+def connect_read_db():
+    """
+    Connection for read-only queries.
+
+    With READ_SNAPSHOT=1 it opens the current read-only copy of data.db
+    instead, so long reads from the web tier never contend for locks with
+    ingestion (scrap.py, spiders, report POSTs). Opening never copies
+    anything: the copy is refreshed in the background, by a thread started
+    here (READ_SNAPSHOT_REFRESH=thread, the default) or by a separate
+    `python -m src.database.db snapshot` job (READ_SNAPSHOT_REFRESH=job).
+    Until the first copy exists, reads go to data.db itself.
+    """
+    if not READ_SNAPSHOT:
+        return connect_db()
+
+    if READ_SNAPSHOT_REFRESH == "thread":
+        _start_snapshot_refresher()
+    if not os.path.exists(SNAPSHOT_PATH):
+        return connect_db()
+    conn = sqlite3.connect(f"file:{SNAPSHOT_PATH}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
     return conn
 
 
+def _start_snapshot_refresher():
+    """Starts the per-process daemon thread that keeps the snapshot fresh (once)."""
+    global _snapshot_refresher
+    if _snapshot_refresher is not None:
+        return
+    with _snapshot_lock:
+        if _snapshot_refresher is None:
+            _snapshot_refresher = threading.Thread(target=run_snapshot_refresher,
+                                                   name="snapshot-refresher", daemon=True)
+            _snapshot_refresher.start()
+
+
+def run_snapshot_refresher(interval=None):
+    """Refreshes the snapshot every `interval` seconds (READ_SNAPSHOT_INTERVAL) forever."""
+    interval = READ_SNAPSHOT_INTERVAL if interval is None else interval
+    while True:
+        try:
+            refresh_snapshot()
+        except Exception as e:
+            print(f"Read snapshot refresh failed: {e}")
+        time.sleep(interval)
+
+
+def _snapshot_version():
+    if not os.path.exists(SNAPSHOT_PATH):
+        return None
+    conn = sqlite3.connect(f"file:{SNAPSHOT_PATH}?mode=ro", uri=True)
+    try:
+        return conn.execute("SELECT version FROM data_version WHERE id = 1").fetchone()[0]
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.close()
+
+
+def refresh_snapshot(force=False):
+    """
+    Copies data.db to a temporary file with the online backup API and swaps it
+    in atomically (os.replace), so readers see either the old or the new copy.
+
+    The copy is only made when data_version in data.db differs from the
+    snapshot's, so when several worker processes refresh, whoever is first
+    does the work and the others find the snapshot current. data.db runs in
+    WAL mode, so the copy reads a consistent state without blocking writers.
+    Returns True if the snapshot was refreshed.
+    """
+    with _snapshot_lock:
+        source = connect_db()
+        try:
+            version = source.execute("SELECT version FROM data_version WHERE id = 1").fetchone()[0]
+            if not force and version == _snapshot_version():
+                return False
+
+            tmp_path = f"{SNAPSHOT_PATH}.{os.getpid()}.tmp"
+            target = sqlite3.connect(tmp_path)
+            try:
+                source.backup(target)
+                # The snapshot is opened read-only, which cannot use a WAL file
+                target.execute("PRAGMA journal_mode=DELETE")
+            finally:
+                target.close()
+        finally:
+            source.close()
+
+        os.replace(tmp_path, SNAPSHOT_PATH)
+        print(f"Read snapshot refreshed (data version {version}).")
+        return True
+
+
+# --- Migrations ---
+
+def _coord_key(coordinates):
+    """Normalized coordinates part of the dedup key (rounded to 6 decimal places)."""
+    if coordinates is None:
+        return None
+    return f"{float(coordinates[0]):.6f},{float(coordinates[1]):.6f}"
+
+
+def _migrate_dedup_key(cursor):
+    """Adds coord_key, collapses existing duplicates and enforces a unique dedup key."""
+    cursor.execute("ALTER TABLE scrapped_data ADD COLUMN coord_key TEXT")
+
+    cursor.execute("SELECT id, coordinates FROM scrapped_data WHERE coordinates IS NOT NULL")
+    keys = [(_coord_key(json.loads(row["coordinates"])), row["id"]) for row in cursor.fetchall()]
+    cursor.executemany("UPDATE scrapped_data SET coord_key = ? WHERE id = ?", keys)
+
+    cursor.execute("""
+        DELETE FROM scrapped_data
+        WHERE coord_key IS NOT NULL AND id NOT IN (
+            SELECT MIN(id) FROM scrapped_data
+            WHERE coord_key IS NOT NULL
+            GROUP BY date, label, coord_key
+        )
+    """)
+    if cursor.rowcount:
+        print(f"Migration: removed {cursor.rowcount} duplicate rows from scrapped_data.")
+
+    cursor.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_scrapped_dedup
+        ON scrapped_data(date, label, coord_key)
+    """)
+
+
+def _migrate_lat_lon(cursor):
+    """Adds typed lat/lon (WGS84) columns and backfills them from the coordinates JSON."""
+    cursor.execute("ALTER TABLE scrapped_data ADD COLUMN lat REAL")
+    cursor.execute("ALTER TABLE scrapped_data ADD COLUMN lon REAL")
+
+    cursor.execute("SELECT id, coordinates FROM scrapped_data WHERE coordinates IS NOT NULL")
+    points = [(*convert_point(*json.loads(row["coordinates"])), row["id"]) for row in cursor.fetchall()]
+    cursor.executemany("UPDATE scrapped_data SET lat = ?, lon = ? WHERE id = ?", points)
+
+
+def _migrate_spatial_index(cursor):
+    """Adds R*Tree indexes over incidents and user alerts, kept in sync by triggers."""
+    cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS scrapped_data_geo
+        USING rtree(id, min_lat, max_lat, min_lon, max_lon)
+    """)
+    cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS coordinate_geo
+        USING rtree(id, min_lat, max_lat, min_lon, max_lon)
+    """)
+
+    triggers = [
+        """
+        CREATE TRIGGER IF NOT EXISTS scrapped_data_geo_insert
+        AFTER INSERT ON scrapped_data WHEN new.lat IS NOT NULL AND new.lon IS NOT NULL
+        BEGIN
+            INSERT INTO scrapped_data_geo VALUES (new.id, new.lat, new.lat, new.lon, new.lon);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS scrapped_data_geo_update
+        AFTER UPDATE OF lat, lon ON scrapped_data
+        BEGIN
+            DELETE FROM scrapped_data_geo WHERE id = old.id;
+            INSERT INTO scrapped_data_geo
+            SELECT new.id, new.lat, new.lat, new.lon, new.lon
+            WHERE new.lat IS NOT NULL AND new.lon IS NOT NULL;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS scrapped_data_geo_delete
+        AFTER DELETE ON scrapped_data
+        BEGIN
+            DELETE FROM scrapped_data_geo WHERE id = old.id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS coordinate_geo_insert
+        AFTER INSERT ON Coordinate
+        BEGIN
+            INSERT INTO coordinate_geo VALUES (new.id, new.x, new.x, new.y, new.y);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS coordinate_geo_update
+        AFTER UPDATE OF x, y ON Coordinate
+        BEGIN
+            UPDATE coordinate_geo
+            SET min_lat = new.x, max_lat = new.x, min_lon = new.y, max_lon = new.y
+            WHERE id = new.id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS coordinate_geo_delete
+        AFTER DELETE ON Coordinate
+        BEGIN
+            DELETE FROM coordinate_geo WHERE id = old.id;
+        END
+        """,
+    ]
+    for trigger in triggers:
+        cursor.execute(trigger)
+
+    cursor.execute("""
+        INSERT INTO scrapped_data_geo
+        SELECT id, lat, lat, lon, lon FROM scrapped_data
+        WHERE lat IS NOT NULL AND lon IS NOT NULL
+    """)
+    cursor.execute("INSERT INTO coordinate_geo SELECT id, x, x, y, y FROM Coordinate")
+
+
+def _migrate_data_version(cursor):
+    """
+    Adds the single-row data_version table, bumped by triggers on every change
+    to scrapped_data and Coordinate, so caches can cheaply detect new data.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS data_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL DEFAULT 0,
+            scrapped_data_version INTEGER NOT NULL DEFAULT 0,
+            scrapped_data_max_rowid INTEGER NOT NULL DEFAULT 0,
+            coordinate_version INTEGER NOT NULL DEFAULT 0,
+            coordinate_max_rowid INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("""
+        INSERT OR IGNORE INTO data_version (id, scrapped_data_max_rowid, coordinate_max_rowid)
+        VALUES (1,
+                (SELECT IFNULL(MAX(id), 0) FROM scrapped_data),
+                (SELECT IFNULL(MAX(id), 0) FROM Coordinate))
+    """)
+
+    for table, prefix in (("scrapped_data", "scrapped_data"), ("Coordinate", "coordinate")):
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {prefix}_version_insert
+            AFTER INSERT ON {table}
+            BEGIN
+                UPDATE data_version
+                SET version = version + 1,
+                    {prefix}_version = {prefix}_version + 1,
+                    {prefix}_max_rowid = MAX({prefix}_max_rowid, new.id)
+                WHERE id = 1;
+            END
+        """)
+        for event in ("UPDATE", "DELETE"):
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {prefix}_version_{event.lower()}
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE data_version
+                    SET version = version + 1, {prefix}_version = {prefix}_version + 1
+                    WHERE id = 1;
+                END
+            """)
+
+
+def _migrate_date_index(cursor):
+    """Indexes scrapped_data.date for time-window queries."""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_scrapped_date ON scrapped_data(date)")
+
+
+def _migrate_archive_state(cursor):
+    """Tracks the hot/cold boundary: rows dated before archive_state.cutoff live in archive.db."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS archive_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            cutoff TEXT
+        )
+    """)
+    cursor.execute("INSERT OR IGNORE INTO archive_state (id, cutoff) VALUES (1, NULL)")
+
+
+def _migrate_alert_indexes(cursor):
+    """Indexes alert history per user and by date, and caches each user's alert count."""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_coordinate_email_date ON Coordinate(email, date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_coordinate_date ON Coordinate(date)")
+
+    cursor.execute("ALTER TABLE User ADD COLUMN alert_count INTEGER NOT NULL DEFAULT 0")
+    cursor.execute("""
+        UPDATE User SET alert_count = (SELECT COUNT(*) FROM Coordinate WHERE Coordinate.email = User.email)
+    """)
+
+    triggers = [
+        """
+        CREATE TRIGGER IF NOT EXISTS coordinate_count_insert
+        AFTER INSERT ON Coordinate
+        BEGIN
+            UPDATE User SET alert_count = alert_count + 1 WHERE email = new.email;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS coordinate_count_delete
+        AFTER DELETE ON Coordinate
+        BEGIN
+            UPDATE User SET alert_count = alert_count - 1 WHERE email = old.email;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS coordinate_count_update
+        AFTER UPDATE OF email ON Coordinate
+        BEGIN
+            UPDATE User SET alert_count = alert_count - 1 WHERE email = old.email;
+            UPDATE User SET alert_count = alert_count + 1 WHERE email = new.email;
+        END
+        """,
+    ]
+    for trigger in triggers:
+        cursor.execute(trigger)
+
+
+def _migrate_sync_state(cursor):
+    """Watermarks of incremental imports from other stores (last source rowid copied)."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sync_state (
+            name TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL DEFAULT 0,
+            synced_at TEXT
+        )
+    """)
+
+
+# Index i in MIGRATIONS upgrades the schema from user_version i to i + 1.
+MIGRATIONS = [
+    _migrate_dedup_key,
+    _migrate_lat_lon,
+    _migrate_spatial_index,
+    _migrate_data_version,
+    _migrate_date_index,
+    _migrate_archive_state,
+    _migrate_alert_indexes,
+    _migrate_sync_state,
+]
+
+
+def _migrate(conn):
+    """Brings the schema up to date, tracking progress in PRAGMA user_version."""
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= len(MIGRATIONS):
+        return
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Re-read under the write lock - another process may have migrated meanwhile.
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for target in range(version + 1, len(MIGRATIONS) + 1):
+            MIGRATIONS[target - 1](conn.cursor())
+            conn.execute(f"PRAGMA user_version = {target}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
 def add_row(date=None, label=None, address=None, city=None, coordinates=None, trust=None):
-    """Adds a new row to scrapped_data."""
+    """Adds a new row to scrapped_data.
+
+    Returns True if the row was inserted, False if an identical row
+    (same date, label and rounded coordinates) already exists.
+    """
+    conn = connect_db()
+    cursor = conn.cursor()
+    inserted = _insert_row(conn, cursor, get_archive_cutoff(conn),
+                           date, label, address, city, coordinates, trust)
+    conn.commit()
+    conn.close()
+
+    if inserted:
+        print("Row added successfully.")
+    else:
+        print("Row already exists, skipped.")
+    return inserted
+
+
+def add_rows(rows, watermark=None):
+    """
+    Adds many rows (dicts with add_row's keyword arguments) in one transaction.
+
+    watermark=(name, last_id) is stored in sync_state in the same transaction,
+    so an import either lands together with its progress marker or not at all.
+    Returns the number of rows inserted (duplicates are skipped).
+    """
+    rows = list(rows)
+    conn = connect_db()
+    cursor = conn.cursor()
+    try:
+        cutoff = get_archive_cutoff(conn)
+        if cutoff is not None and any(row.get("date") and row["date"] < cutoff for row in rows):
+            # ATTACH is not allowed inside the transaction the inserts open
+            _attach_archive(conn)
+        inserted = sum(_insert_row(conn, cursor, cutoff, **row) for row in rows)
+        if watermark is not None:
+            name, last_id = watermark
+            cursor.execute("""
+                INSERT INTO sync_state (name, last_id, synced_at)
+                VALUES (?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET
+                    last_id = excluded.last_id, synced_at = excluded.synced_at
+            """, (name, last_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return inserted
+
+
+def get_sync_watermark(name):
+    """Returns the last source rowid imported by the sync job `name` (0 if never run)."""
+    conn = connect_db()
+    cursor = conn.cursor()
+    cursor.execute("SELECT last_id FROM sync_state WHERE name = ?", (name,))
+    row = cursor.fetchone()
+    conn.close()
+    return row[0] if row else 0
+
+
+def _insert_row(conn, cursor, cutoff, date=None, label=None, address=None, city=None,
+                coordinates=None, trust=None):
+    """Inserts one scrapped_data row without committing; rows older than cutoff go to the archive."""
     if date is None:
         date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
@@ -76,18 +548,27 @@ def add_row(date=None, label=None, address=None, city=None, coordinates=None, tr
         if not (isinstance(coordinates, list) and len(coordinates) == 2 and all(isinstance(c, float) for c in coordinates)):
             raise ValueError("coordinates must be a list of two floats: [latitude, longitude]")
         coord_json = json.dumps(coordinates)
+        lat, lon = convert_point(*coordinates)
     else:
         coord_json = None
+        lat = lon = None
+
+    to_archive = cutoff is not None and date < cutoff
+    if to_archive:
+        _attach_archive(conn)
+        if _archived_row_exists(cursor, date, label, _coord_key(coordinates)):
+            return False
 
-    conn = connect_db()
-    cursor = conn.cursor()
     cursor.execute("""
-        INSERT INTO scrapped_data (date, label, address, city, coordinates, trust)
-        VALUES (?, ?, ?, ?, ?, ?)
-    """, (date, label, address, city, coord_json, trust))
-    conn.commit()
-    conn.close()
-    print("Row added successfully.")
+        INSERT INTO scrapped_data (date, label, address, city, coordinates, coord_key, lat, lon, trust)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT DO NOTHING
+    """, (date, label, address, city, coord_json, _coord_key(coordinates), lat, lon, trust))
+    inserted = cursor.rowcount == 1
+    if inserted and to_archive:
+        # Old row: it belongs to the cold partition, keep the id from the hot sequence
+        _move_to_archive(cursor, "id = ?", (cursor.lastrowid,))
+    return inserted
 
 
 def delete_row(row_id: int):
@@ -102,44 +583,367 @@ def delete_row(row_id: int):
 
 def view_all():
     """Returns all rows in scrapped_data."""
-    conn = connect_db()
+    conn = connect_read_db()
     cursor = conn.cursor()
     cursor.execute("SELECT * FROM scrapped_data")
     rows = cursor.fetchall()
     conn.close()
 
-    result = []
-    for row in rows:
-        row_dict = {
-            "id": row["id"],
-            "date": row["date"],
-            "label": row["label"],
-            "address": row["address"],
-            "city": row["city"],
-            "coordinates": json.loads(row["coordinates"]) if row["coordinates"] else None,
-            "trust": row["trust"],
-        }
-        result.append(row_dict)
-    return result
+    return [_row_to_dict(row) for row in rows]
+
+
+def iter_all(chunk_size=500):
+    """
+    Yields scrapped_data rows one by one, fetching them from SQLite in chunks
+    of chunk_size, so memory stays flat regardless of table size.
+    """
+    conn = connect_read_db()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM scrapped_data ORDER BY id")
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                yield _row_to_dict(row)
+    finally:
+        conn.close()
+
+
+def _row_to_dict(row):
+    """Converts a scrapped_data row to the dict shape returned by the API."""
+    return {
+        "id": row["id"],
+        "date": row["date"],
+        "label": row["label"],
+        "address": row["address"],
+        "city": row["city"],
+        "coordinates": json.loads(row["coordinates"]) if row["coordinates"] else None,
+        "lat": row["lat"],
+        "lon": row["lon"],
+        "trust": row["trust"],
+    }
+
+
+# Columns available to view_all_arrays; "month" is the month index year * 12 + (month - 1)
+ARRAY_COLUMNS = {
+    "id": "d.id",
+    "lat": "d.lat",
+    "lon": "d.lon",
+    "trust": "d.trust",
+    "month": "(CAST(substr(d.date, 1, 4) AS INTEGER) * 12 + CAST(substr(d.date, 6, 2) AS INTEGER) - 1)",
+}
+
+
+def view_all_arrays(columns=("lat", "lon", "trust"), bbox=None, since=None, until=None, include_archive=None,
+                    after_id=None):
+    """
+    Returns scrapped_data columns as NumPy float arrays, e.g. {"lat": array, ...}.
+    Rows with NULL in any requested column are skipped. Values are read straight
+    from the cursor, without building a dict per row.
+
+    bbox: optional (min_lat, min_lon, max_lat, max_lon); only rows inside it
+    are read, via the R*Tree index.
+    since, until: optional date strings; only rows with since <= date < until.
+    include_archive: read archive.db as well; by default only when a time
+    window is given and it reaches before the archive cutoff.
+    after_id: only rows with id > after_id (rows added since a data_version
+    max rowid was read).
+    """
+    unknown = set(columns) - set(ARRAY_COLUMNS)
+    if unknown:
+        raise ValueError(f"unsupported columns: {sorted(unknown)}")
+
+    where = [f"{ARRAY_COLUMNS[c]} IS NOT NULL" for c in columns]
+    params = []
+    if since is not None:
+        where.append("d.date >= ?")
+        params.append(since)
+    if until is not None:
+        where.append("d.date < ?")
+        params.append(until)
+    if after_id is not None:
+        where.append("d.id > ?")
+        params.append(after_id)
+
+    conn = connect_read_db()
+    conn.row_factory = None
+    if include_archive is None:
+        include_archive = (since is not None or until is not None) and _archive_needed(conn, since)
+
+    select = ", ".join(ARRAY_COLUMNS[c] for c in columns)
+    parts, part_params = [], []
+    if bbox is not None:
+        bbox_where, bbox_params = _bbox_filter(*bbox)
+        parts.append(f"""
+            SELECT {select} FROM scrapped_data_geo g JOIN main.scrapped_data d ON d.id = g.id
+            WHERE {" AND ".join(where + [bbox_where])}
+        """)
+        part_params += params + bbox_params
+    else:
+        parts.append(f"SELECT {select} FROM main.scrapped_data d WHERE {' AND '.join(where)}")
+        part_params += params
+
+    if include_archive:
+        _attach_archive(conn)
+        archive_where = list(where)
+        archive_params = list(params)
+        if bbox is not None:
+            # Archiwum nie ma R*Tree - zwykły filtr po lat/lon
+            archive_where.append("d.lat BETWEEN ? AND ? AND d.lon BETWEEN ? AND ?")
+            archive_params += [bbox[0], bbox[2], bbox[1], bbox[3]]
+        parts.append(f"SELECT {select} FROM archive.scrapped_data d WHERE {' AND '.join(archive_where)}")
+        part_params += archive_params
+
+    cursor = conn.cursor()
+    cursor.execute(" UNION ALL ".join(parts), part_params)
+    values = np.fromiter(itertools.chain.from_iterable(cursor), dtype=float)
+    conn.close()
+
+    values = values.reshape(-1, len(columns))
+    return {column: values[:, i] for i, column in enumerate(columns)}
+
+
+def count_rows_between(after_id, upto_id):
+    """Number of hot scrapped_data rows with after_id < id <= upto_id (a primary key range scan)."""
+    conn = connect_read_db()
+    count = conn.execute("SELECT COUNT(*) FROM scrapped_data WHERE id > ? AND id <= ?",
+                         (after_id, upto_id)).fetchone()[0]
+    conn.close()
+    return count
+
+
+def _bbox_filter(min_lat, min_lon, max_lat, max_lon, table="d", lat="lat", lon="lon"):
+    """
+    WHERE clause for a bounding box query joining an R*Tree (aliased g) to its table.
+    The R*Tree stores float32 boxes rounded outwards, so it is probed with an
+    overlap test and the exact columns are re-checked.
+    """
+    where = f"""
+        g.max_lat >= ? AND g.min_lat <= ?
+        AND g.max_lon >= ? AND g.min_lon <= ?
+        AND {table}.{lat} BETWEEN ? AND ? AND {table}.{lon} BETWEEN ? AND ?
+    """
+    params = [min_lat, max_lat, min_lon, max_lon, min_lat, max_lat, min_lon, max_lon]
+    return where, params
+
+
+def query_bbox(min_lat, min_lon, max_lat, max_lon, since=None):
+    """
+    Returns scrapped_data rows inside the bounding box (WGS84 degrees),
+    optionally only those dated on or after `since` (archive.db is read as
+    well when `since` is before the archive cutoff).
+    """
+    where, params = _bbox_filter(min_lat, min_lon, max_lat, max_lon)
+    if since is not None:
+        where += " AND d.date >= ?"
+        params.append(since)
+
+    conn = connect_read_db()
+    sql = f"""
+        SELECT {", ".join(f"d.{c.strip()}" for c in SCRAPPED_COLUMNS.split(","))}
+        FROM scrapped_data_geo g
+        JOIN main.scrapped_data d ON d.id = g.id
+        WHERE {where}
+    """
+    if since is not None and _archive_needed(conn, since):
+        _attach_archive(conn)
+        sql += f"""
+            UNION ALL
+            SELECT {SCRAPPED_COLUMNS} FROM archive.scrapped_data
+            WHERE lat BETWEEN ? AND ? AND lon BETWEEN ? AND ? AND date >= ?
+        """
+        params += [min_lat, max_lat, min_lon, max_lon, since]
+
+    cursor = conn.cursor()
+    cursor.execute(sql, params)
+    rows = cursor.fetchall()
+    conn.close()
+
+    return [_row_to_dict(row) for row in rows]
+
+
+def query_range(since=None, until=None):
+    """
+    Returns scrapped_data rows with since <= date < until, oldest first.
+    Either bound may be None. Uses the idx_scrapped_date index; when the window
+    reaches before the archive cutoff, archive.db is read as well.
+    """
+    where, params = [], []
+    if since is not None:
+        where.append("date >= ?")
+        params.append(since)
+    if until is not None:
+        where.append("date < ?")
+        params.append(until)
+    where = "WHERE " + " AND ".join(where) if where else ""
+
+    conn = connect_read_db()
+    tables = ["main.scrapped_data"]
+    if _archive_needed(conn, since):
+        _attach_archive(conn)
+        tables.append("archive.scrapped_data")
+
+    cursor = conn.cursor()
+    cursor.execute(
+        " UNION ALL ".join(f"SELECT {SCRAPPED_COLUMNS} FROM {table} {where}" for table in tables)
+        + " ORDER BY date",
+        params * len(tables)
+    )
+    rows = cursor.fetchall()
+    conn.close()
+
+    return [_row_to_dict(row) for row in rows]
 
 
 def row_exists(date, label=None, coordinates=None):
-    """Check if a row with the same date, label, and coordinates exists."""
+    """Check if a row with the same date, label, and coordinates exists.
+
+    Probes the idx_scrapped_dedup index. Prefer add_row's return value
+    when the row is going to be inserted anyway.
+    """
     conn = connect_db()
     cursor = conn.cursor()
-    coord_json = json.dumps(coordinates) if coordinates else None
 
     cursor.execute("""
         SELECT 1 FROM scrapped_data
-        WHERE date = ? AND label = ? AND coordinates = ?
+        WHERE date = ? AND label = ? AND coord_key = ?
         LIMIT 1
-    """, (date, label, coord_json))
+    """, (date, label, _coord_key(coordinates)))
 
     exists = cursor.fetchone() is not None
     conn.close()
     return exists
 
 
+# --- Archive (hot/cold partitioning) ---
+
+SCRAPPED_COLUMNS = "id, date, label, address, city, coordinates, coord_key, lat, lon, trust"
+
+
+def get_archive_cutoff(conn=None):
+    """Returns the archive cutoff date; rows dated before it live in archive.db (None = no archive)."""
+    own_conn = conn is None
+    if own_conn:
+        conn = connect_read_db()
+    cutoff = conn.execute("SELECT cutoff FROM main.archive_state WHERE id = 1").fetchone()[0]
+    if own_conn:
+        conn.close()
+    return cutoff
+
+
+def _archive_needed(conn, since):
+    """Whether a time window starting at `since` (None = from the beginning) reaches the archive."""
+    cutoff = get_archive_cutoff(conn)
+    return cutoff is not None and (since is None or since < cutoff)
+
+
+def _attach_archive(conn):
+    """ATTACHes archive.db as schema "archive", creating its table on first use."""
+    if any(row[1] == "archive" for row in conn.execute("PRAGMA database_list")):
+        return
+    conn.execute("ATTACH DATABASE ? AS archive", (ARCHIVE_PATH,))
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS archive.scrapped_data (
+            id INTEGER PRIMARY KEY,
+            date TEXT NOT NULL,
+            label TEXT NOT NULL,
+            address TEXT,
+            city TEXT,
+            coordinates TEXT,
+            coord_key TEXT,
+            lat REAL,
+            lon REAL,
+            trust INTEGER
+        )
+    """)
+    conn.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS archive.idx_archive_dedup
+        ON scrapped_data(date, label, coord_key)
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS archive.idx_archive_date ON scrapped_data(date)")
+
+
+def _archived_row_exists(cursor, date, label, coord_key):
+    cursor.execute("""
+        SELECT 1 FROM archive.scrapped_data
+        WHERE date = ? AND label = ? AND coord_key = ?
+        LIMIT 1
+    """, (date, label, coord_key))
+    return cursor.fetchone() is not None
+
+
+def _move_to_archive(cursor, where, params):
+    """Moves matching hot rows to archive.db; triggers keep R*Tree and data_version in sync."""
+    cursor.execute(f"""
+        INSERT OR IGNORE INTO archive.scrapped_data ({SCRAPPED_COLUMNS})
+        SELECT {SCRAPPED_COLUMNS} FROM main.scrapped_data WHERE {where}
+    """, params)
+    cursor.execute(f"DELETE FROM main.scrapped_data WHERE {where}", params)
+    return cursor.rowcount
+
+
+def archive_old_rows(horizon_days=ARCHIVE_HORIZON_DAYS, batch_size=1000):
+    """
+    Moves scrapped_data rows older than horizon_days into archive.db.
+
+    The cutoff only moves forward. Rows are moved in batches, each in its own
+    transaction, so readers and writers are never blocked for long; the new
+    cutoff is committed together with the first batch, so queries already
+    look into the archive while the job is still running.
+    Returns the number of rows moved.
+    """
+    cutoff = (datetime.now() - timedelta(days=horizon_days)).strftime("%Y-%m-%d")
+
+    conn = connect_db()
+    _attach_archive(conn)
+    cursor = conn.cursor()
+    current = get_archive_cutoff(conn)
+    if current is not None and current > cutoff:
+        cutoff = current
+
+    moved = 0
+    try:
+        cursor.execute("UPDATE main.archive_state SET cutoff = ? WHERE id = 1", (cutoff,))
+        while True:
+            count = _move_to_archive(
+                cursor,
+                "id IN (SELECT id FROM main.scrapped_data WHERE date < ? ORDER BY id LIMIT ?)",
+                (cutoff, batch_size)
+            )
+            conn.commit()
+            moved += count
+            if count < batch_size:
+                break
+    finally:
+        conn.close()
+
+    print(f"Archived {moved} rows older than {cutoff} to {ARCHIVE_PATH}.")
+    return moved
+
+
+def get_data_version():
+    """
+    Returns the current data version as a dict:
+    version (any change), scrapped_data_version / coordinate_version
+    (changes per table) and scrapped_data_max_rowid / coordinate_max_rowid.
+
+    All counters only grow and are maintained by triggers, so the values are
+    consistent across processes; reading them is a single primary key lookup.
+    In snapshot mode this is the version of the snapshot the reads come from.
+    """
+    conn = connect_read_db()
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM data_version WHERE id = 1")
+    row = cursor.fetchone()
+    conn.close()
+
+    version = dict(row)
+    del version["id"]
+    return version
+
+
 # --- User Alerts ---
 
 def add_user_alert(email: str, lat: float, lng: float, label: str = "Alert użytkownika"):
@@ -170,24 +974,111 @@ def add_user_alert(email: str, lat: float, lng: float, label: str = "Alert użyt
 
 def get_user_alerts(email: str):
     """Get all alerts for a specific user."""
-    conn = connect_db()
+    conn = connect_read_db()
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM Coordinate WHERE email = ? ORDER BY date DESC", (email,))
+    cursor.execute("SELECT * FROM Coordinate WHERE email = ? ORDER BY date DESC, id DESC", (email,))
     rows = cursor.fetchall()
     conn.close()
 
-    return [{"id": row["id"], "date": row["date"], "x": row["x"], "y": row["y"], "email": row["email"]} for row in rows]
+    return [_alert_to_dict(row) for row in rows]
 
 
 def get_all_alerts():
     """Get all user alerts."""
-    conn = connect_db()
+    conn = connect_read_db()
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM Coordinate ORDER BY date DESC")
+    cursor.execute("SELECT * FROM Coordinate ORDER BY date DESC, id DESC")
     rows = cursor.fetchall()
     conn.close()
 
-    return [{"id": row["id"], "date": row["date"], "x": row["x"], "y": row["y"], "email": row["email"]} for row in rows]
+    return [_alert_to_dict(row) for row in rows]
+
+
+def iter_alerts(chunk_size=500):
+    """Yields all user alerts in get_alerts_page order, fetched in chunks of chunk_size."""
+    conn = connect_read_db()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM Coordinate ORDER BY date DESC, id DESC")
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                yield _alert_to_dict(row)
+    finally:
+        conn.close()
+
+
+def get_alerts_page(after_id=None, limit=100, email=None):
+    """
+    Keyset pagination over user alerts, newest first (date DESC, id DESC),
+    optionally only for one user.
+
+    Returns (alerts, next_after_id); pass next_after_id back to get the
+    following page. next_after_id is None on the last page. Pages are read
+    through idx_coordinate_date / idx_coordinate_email_date, so neither the
+    table nor the sort is materialized.
+    """
+    where, params = [], []
+    if email is not None:
+        where.append("email = ?")
+        params.append(email)
+    if after_id is not None:
+        # Kotwica: (date, id) ostatniego alertu z poprzedniej strony
+        where.append("(date, id) < (SELECT date, id FROM Coordinate WHERE id = ?)")
+        params.append(after_id)
+    params.append(limit)
+
+    conn = connect_read_db()
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT * FROM Coordinate
+        {"WHERE " + " AND ".join(where) if where else ""}
+        ORDER BY date DESC, id DESC
+        LIMIT ?
+    """, params)
+    rows = cursor.fetchall()
+    conn.close()
+
+    alerts = [_alert_to_dict(row) for row in rows]
+    next_after_id = alerts[-1]["id"] if len(alerts) == limit else None
+    return alerts, next_after_id
+
+
+def get_user_alert_count(email: str):
+    """Returns the number of alerts of a user (cached in User.alert_count by triggers)."""
+    conn = connect_read_db()
+    cursor = conn.cursor()
+    cursor.execute("SELECT alert_count FROM User WHERE email = ?", (email,))
+    row = cursor.fetchone()
+    conn.close()
+    return row["alert_count"] if row else 0
+
+
+def query_alerts_bbox(min_lat, min_lon, max_lat, max_lon, since=None):
+    """Get user alerts inside the bounding box, newest first."""
+    where, params = _bbox_filter(min_lat, min_lon, max_lat, max_lon, table="c", lat="x", lon="y")
+    if since is not None:
+        where += " AND c.date >= ?"
+        params.append(since)
+
+    conn = connect_read_db()
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT c.* FROM coordinate_geo g
+        JOIN Coordinate c ON c.id = g.id
+        WHERE {where}
+        ORDER BY c.date DESC
+    """, params)
+    rows = cursor.fetchall()
+    conn.close()
+
+    return [_alert_to_dict(row) for row in rows]
+
+
+def _alert_to_dict(row):
+    return {"id": row["id"], "date": row["date"], "x": row["x"], "y": row["y"], "email": row["email"]}
 
 
 # --- Users ---
@@ -219,5 +1110,17 @@ def get_user_by_email(email: str):
 
 
 if __name__ == '__main__':
+    import sys
+
     connect_db()
     print("Database initialized successfully.")
+
+    # python -m src.database.db archive [horizon_days]
+    if len(sys.argv) > 1 and sys.argv[1] == "archive":
+        archive_old_rows(int(sys.argv[2]) if len(sys.argv) > 2 else ARCHIVE_HORIZON_DAYS)
+
+    # python -m src.database.db snapshot [--loop]  (READ_SNAPSHOT_REFRESH=job)
+    if len(sys.argv) > 1 and sys.argv[1] == "snapshot":
+        if "--loop" in sys.argv:
+            run_snapshot_refresher()
+        refresh_snapshot()
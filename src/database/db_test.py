@@ -1,5 +1,26 @@
+import os
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+
 import db
 
+
+@contextmanager
+def temp_database(module=db):
+    """Points the db module at a fresh data.db / archive.db / snapshot in a temporary directory."""
+    saved = module.DB_PATH, module.ARCHIVE_PATH, module.SNAPSHOT_PATH
+    directory = tempfile.mkdtemp()
+    module.DB_PATH = os.path.join(directory, "data.db")
+    module.ARCHIVE_PATH = os.path.join(directory, "archive.db")
+    module.SNAPSHOT_PATH = os.path.join(directory, "data_snapshot.db")
+    try:
+        yield directory
+    finally:
+        module.DB_PATH, module.ARCHIVE_PATH, module.SNAPSHOT_PATH = saved
+
 def test_row_exists():
     # Test data
     test_date = "2025-10-04 12:00:00"
@@ -9,39 +30,373 @@ def test_row_exists():
 
     print("=== Starting row_exists tests ===")
 
-    # Ensure the row does not exist yet
-    assert not db.row_exists(test_date, test_label, test_coordinates), "Row should not exist yet"
-
-    # Add the test row
-    db.add_row(
-        date=test_date,
-        label=test_label,
-        address="Test Address",
-        city="Test City",
-        coordinates=test_coordinates,
-        trust=test_trust
-    )
-
-    # Check that row_exists returns True
-    assert db.row_exists(test_date, test_label, test_coordinates), "Row should exist after insertion"
-    print("✅ row_exists detected the inserted row correctly")
-
-    # Check that a different row does not exist
-    assert not db.row_exists(test_date, "Nonexistent Crime", test_coordinates), "Non-existent row should not exist"
-    print("✅ row_exists correctly ignored a non-existent row")
-
-    # Clean up: delete the inserted row
-    rows = db.view_all()
-    for row in rows:
-        if row['date'] == test_date and row['label'] == test_label:
+    with temp_database():
+        # Ensure the row does not exist yet
+        assert not db.row_exists(test_date, test_label, test_coordinates), "Row should not exist yet"
+
+        # Add the test row
+        db.add_row(
+            date=test_date,
+            label=test_label,
+            address="Test Address",
+            city="Test City",
+            coordinates=test_coordinates,
+            trust=test_trust
+        )
+
+        # Check that row_exists returns True
+        assert db.row_exists(test_date, test_label, test_coordinates), "Row should exist after insertion"
+        print("✅ row_exists detected the inserted row correctly")
+
+        # Check that a different row does not exist
+        assert not db.row_exists(test_date, "Nonexistent Crime", test_coordinates), "Non-existent row should not exist"
+        print("✅ row_exists correctly ignored a non-existent row")
+
+        # Clean up: delete the inserted row
+        rows = db.view_all()
+        for row in rows:
+            if row['date'] == test_date and row['label'] == test_label:
+                db.delete_row(row['id'])
+
+        # Ensure cleanup
+        assert not db.row_exists(test_date, test_label, test_coordinates), "Row should be deleted"
+        print("✅ Cleanup successful, row deleted")
+
+    print("=== All tests passed ===")
+
+
+def test_add_row_ignores_duplicates():
+    test_date = "2025-10-04 13:00:00"
+    test_label = "Test Duplicate"
+
+    print("=== Starting add_row dedup tests ===")
+
+    with temp_database():
+        assert db.add_row(date=test_date, label=test_label, coordinates=[50.0614, 19.9366], trust=1), \
+            "First insert should succeed"
+        # Float noise below the rounding precision must still be treated as the same row
+        assert not db.add_row(date=test_date, label=test_label, coordinates=[50.06140000001, 19.9366], trust=1), \
+            "Duplicate insert should be ignored"
+        print("✅ add_row ignored the duplicate row")
+
+        matching = [row for row in db.view_all() if row['date'] == test_date and row['label'] == test_label]
+        assert len(matching) == 1, "Exactly one row should be stored"
+
+        for row in matching:
             db.delete_row(row['id'])
 
-    # Ensure cleanup
-    assert not db.row_exists(test_date, test_label, test_coordinates), "Row should be deleted"
-    print("✅ Cleanup successful, row deleted")
+    print("=== All tests passed ===")
+
+
+def test_query_bbox():
+    test_date = "2025-10-04 14:00:00"
+    test_label = "Test BBox"
+
+    print("=== Starting query_bbox tests ===")
+
+    with temp_database():
+        db.add_row(date=test_date, label=test_label, coordinates=[50.0614, 19.9366], trust=1)
+        db.add_row(date=test_date, label=test_label, coordinates=[49.2992, 19.9496], trust=1)
+
+        inside = [row for row in db.query_bbox(50.0, 19.9, 50.1, 20.0) if row['label'] == test_label]
+        assert [row['lat'] for row in inside] == [50.0614], "Only the Kraków point should be in the box"
+        assert not [row for row in db.query_bbox(50.0, 19.9, 50.1, 20.0, since="2099-01-01") if row['label'] == test_label], \
+            "since should filter out older rows"
+        print("✅ query_bbox returned only rows inside the box")
+
+        for row in db.view_all():
+            if row['label'] == test_label:
+                db.delete_row(row['id'])
+
+        assert not [row for row in db.query_bbox(49.0, 19.0, 51.0, 21.0) if row['label'] == test_label], \
+            "Deleted rows should leave the spatial index"
+    print("=== All tests passed ===")
+
+
+def test_window_heatmap_matches_brute_force():
+    # heatmap_algo reads through src.database.db, a separate module object from `db`
+    from src.database import db as app_db
+    from src import heatmap_algo
+
+    resolution, radius = 40, 500
+
+    def check(since, until):
+        heatmap, _, grid_info = heatmap_algo.create_window_heatmap(resolution, radius, since=since, until=until)
+        layers = heatmap_algo._get_time_layers(resolution, radius, True, False)
+        rows = app_db.view_all_arrays(("lat", "lon", "trust"), since=since, until=until)
+        expected = np.zeros((resolution, resolution))
+        heatmap_algo._accumulate(expected, rows["lat"], rows["lon"],
+                                 heatmap_algo._weights(rows["trust"], layers["scale"]), layers["geo"])
+        assert np.allclose(heatmap, expected), f"Window {since}..{until} differs from brute force"
+        assert grid_info["num_points"] == len(rows["lat"]), f"Wrong point count for {since}..{until}"
+
+    windows = [(None, "2025-04-01"), ("2025-02-10", "2025-05-20 08:00:00"), ("2025-03-01", None)]
+
+    print("=== Starting window heatmap tests ===")
+
+    with temp_database(app_db):
+        heatmap_algo._layers_cache.clear()
+        rng = np.random.default_rng(7)
+        for i in range(60):
+            app_db.add_row(date=f"2025-{1 + i % 6:02d}-{1 + i % 27:02d} 12:00:00", label=f"Test Window {i}",
+                           coordinates=[50.0 + 0.1 * rng.random(), 19.9 + 0.1 * rng.random()], trust=1 + i % 3)
+
+        for since, until in windows:
+            check(since, until)
+        print("✅ Windows from cumulative layers match brute force")
+
+        # A new row in the last month extends the cached layers instead of rebuilding them
+        app_db.add_row(date="2025-06-28 12:00:00", label="Test Window new",
+                       coordinates=[50.05, 19.95], trust=2)
+        for since, until in windows:
+            check(since, until)
+        entry = next(iter(heatmap_algo._layers_cache.values()))
+        assert entry["max_rowid"] == app_db.get_data_version()["scrapped_data_max_rowid"], \
+            "Cached layers should include the new row"
+        print("✅ Layers extended with a new row still match brute force")
+
+        heatmap_algo._layers_cache.clear()
+
+    print("=== All tests passed ===")
+
+
+def test_layers_cache_byte_limit():
+    from src.database import db as app_db
+    from src import heatmap_algo
+
+    print("=== Starting layers cache limit tests ===")
+
+    saved = heatmap_algo.LAYERS_CACHE_MAX_BYTES
+    with temp_database(app_db):
+        heatmap_algo._layers_cache.clear()
+        try:
+            for i in range(12):
+                app_db.add_row(date=f"2025-{1 + i % 6:02d}-10 12:00:00", label=f"Test Cache {i}",
+                               coordinates=[50.0 + i / 100, 19.9 + i / 100], trust=1 + i % 3)
+
+            small = heatmap_algo._get_time_layers(20, 500, True, False)
+            heatmap_algo.LAYERS_CACHE_MAX_BYTES = 2 * small['prefix'].nbytes
+            heatmap_algo._get_time_layers(20, 400, True, False)
+            assert len(heatmap_algo._layers_cache) == 2, "Two small entries fit in the byte limit"
+
+            heatmap_algo._get_time_layers(60, 500, True, False)
+            assert list(heatmap_algo._layers_cache) == [(60, 500, True, False)], \
+                "Older entries should be evicted once the limit is exceeded"
+            print("✅ Least recently used layers evicted by total size")
+
+            heatmap_algo._get_time_layers(60, 500, True, False)
+            assert len(heatmap_algo._layers_cache) == 1, "An entry above the limit alone should stay cached"
+            print("✅ The entry in use stays cached even above the limit")
+        finally:
+            heatmap_algo.LAYERS_CACHE_MAX_BYTES = saved
+            heatmap_algo._layers_cache.clear()
+
+    print("=== All tests passed ===")
+
+
+def test_archive_round_trip():
+    old_date = "2000-01-05 12:00:00"
+    new_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    test_label = "Test Archive"
+
+    print("=== Starting archive round-trip tests ===")
+
+    with temp_database():
+        db.add_row(date=old_date, label=test_label, coordinates=[50.0614, 19.9366], trust=1)
+        db.add_row(date=new_date, label=test_label, coordinates=[50.0614, 19.9366], trust=1)
+
+        assert db.archive_old_rows(horizon_days=365) == 1, "Only the old row should be archived"
+        assert [row['date'] for row in db.view_all()] == [new_date], "The old row should leave the hot table"
+        print("✅ archive_old_rows moved the old row to archive.db")
+
+        archived = db.query_range(since="1999-12-01", until="2000-02-01")
+        assert [(row['date'], row['label']) for row in archived] == [(old_date, test_label)], \
+            "query_range should read the archived row"
+        assert len(db.view_all_arrays(since="1999-01-01")["lat"]) == 2, \
+            "Windows before the cutoff should include archived rows"
+        print("✅ Time-window queries read the archived row back")
+
+        assert not db.add_row(date=old_date, label=test_label, coordinates=[50.0614, 19.9366], trust=1), \
+            "A duplicate of an archived row should be ignored"
+        assert db.add_row(date="2000-01-06 12:00:00", label=test_label, coordinates=[50.0614, 19.9366], trust=1), \
+            "A new old row should be inserted"
+        assert len(db.query_range(since="1999-12-01", until="2000-02-01")) == 2, \
+            "Old rows inserted after archiving should go straight to archive.db"
+        assert len(db.view_all()) == 1, "The hot table should keep only the recent row"
+        print("✅ Rows older than the cutoff are deduplicated against and written to archive.db")
+
+    print("=== All tests passed ===")
+
+
+def test_read_snapshot_refresh():
+    test_label = "Test Snapshot"
+
+    print("=== Starting read snapshot tests ===")
+
+    saved = db.READ_SNAPSHOT, db.READ_SNAPSHOT_REFRESH
+    # "job": no background thread, the test refreshes explicitly
+    db.READ_SNAPSHOT, db.READ_SNAPSHOT_REFRESH = True, "job"
+    try:
+        with temp_database():
+            db.add_row(date="2025-10-04 15:00:00", label=test_label, coordinates=[50.0614, 19.9366], trust=1)
+            assert db.get_data_version()["scrapped_data_version"] == 1, \
+                "Without a snapshot file reads should go to data.db"
+
+            assert db.refresh_snapshot(), "First refresh should create the snapshot"
+            assert not db.refresh_snapshot(), "Unchanged data should not be copied again"
+            print("✅ refresh_snapshot copies only when data_version changes")
+
+            db.add_row(date="2025-10-04 16:00:00", label=test_label, coordinates=[50.0614, 19.9366], trust=1)
+            assert db.get_data_version()["scrapped_data_version"] == 1, \
+                "Reads should come from the snapshot until it is refreshed"
+            assert db.refresh_snapshot(), "Changed data should refresh the snapshot"
+            assert db.get_data_version()["scrapped_data_version"] == 2, "Refreshed snapshot should see the new row"
+            assert not [name for name in os.listdir(os.path.dirname(db.SNAPSHOT_PATH)) if name.endswith(".tmp")], \
+                "The temporary copy should be renamed over the snapshot"
+            print("✅ connect_read_db reads the current snapshot file")
+    finally:
+        db.READ_SNAPSHOT, db.READ_SNAPSHOT_REFRESH = saved
+
+    print("=== All tests passed ===")
+
+
+def test_alerts_page_keyset():
+    print("=== Starting alert pagination tests ===")
+
+    with temp_database():
+        # Alerts added within one second share a date; id breaks the tie
+        for i in range(7):
+            db.add_user_alert("a@example.com" if i % 2 else "b@example.com", 50.0 + i / 100, 19.9)
+
+        pages, after_id = [], None
+        while True:
+            alerts, after_id = db.get_alerts_page(after_id, limit=3)
+            pages.extend(alerts)
+            if after_id is None:
+                break
+        assert [alert['id'] for alert in pages] == [alert['id'] for alert in db.iter_alerts()] == list(range(7, 0, -1)), \
+            "Pages should follow iter_alerts order, newest first, without gaps or repeats"
+        user_pages = db.get_alerts_page(limit=10, email="a@example.com")[0]
+        assert [alert['id'] for alert in user_pages] == [alert['id'] for alert in db.get_user_alerts("a@example.com")], \
+            "Per-user pages should match the per-user list"
+        print("✅ Keyset pages concatenate to the full alert list")
+
+        conn = db.connect_db()
+        plan = " ".join(row[3] for row in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM Coordinate WHERE (date, id) < (SELECT date, id FROM Coordinate WHERE id = ?)"
+            " ORDER BY date DESC, id DESC LIMIT 3", (4,)))
+        conn.close()
+        assert "idx_coordinate_date" in plan and "TEMP B-TREE" not in plan, f"Page query should walk the index: {plan}"
+        print("✅ Page query reads idx_coordinate_date without a sort")
+
+    print("=== All tests passed ===")
+
+
+def test_maintenance_retention():
+    import time
+    from src.database import db as app_db
+    from src.database import maintenance
+    from src.agent.db import DatabaseManager
+
+    print("=== Starting maintenance retention tests ===")
+
+    saved_path = maintenance.CRIME_DB_PATH
+    with temp_database(app_db) as directory:
+        maintenance.CRIME_DB_PATH = os.path.join(directory, "crime_data.db")
+        manager = DatabaseManager(maintenance.CRIME_DB_PATH)
+        try:
+            conn = app_db.connect_db()
+            conn.executemany("INSERT INTO tokens (token, email, created_at) VALUES (?, ?, ?)",
+                             [("old", "a@example.com", time.time() - 8 * 86400),
+                              ("fresh", "a@example.com", time.time())])
+            conn.commit()
+            conn.close()
+
+            for name, source, attempts, age_days in [("failed-old", "dead", 3, 40), ("failed-old-2", "dead", 5, 31),
+                                                     ("failed-new", "test", 3, 1), ("retry-old", "test", 1, 40)]:
+                article_id, _ = manager.save_raw_article(f"https://example.com/{name}", name, "Treść", source)
+                with manager.transaction() as cursor:
+                    cursor.execute("UPDATE raw_articles SET processing_attempts = ?, "
+                                   "scraped_at = datetime('now', ?) WHERE id = ?",
+                                   (attempts, f"-{age_days} days", article_id))
+            manager.save_http_validators("https://example.com/old-list", '"a"', None)
+            manager.save_http_validators("https://example.com/list", '"b"', None)
+            with manager.transaction() as cursor:
+                cursor.execute("UPDATE http_validators SET checked_at = datetime('now', '-31 days') "
+                               "WHERE url = 'https://example.com/old-list'")
+
+            data_report = maintenance.maintain("data")
+            crime_report = maintenance.maintain("crime")
+            assert data_report["deleted"]["tokens"] == 1, "Only the expired token should be deleted"
+            assert crime_report["deleted"] == {"failed_raw_articles": 2, "stale_http_validators": 1,
+                                               "empty_source_stats": 1, "empty_crime_type_stats": 0}, \
+                f"Unexpected retention counts: {crime_report['deleted']}"
+
+            conn = manager.get_connection()
+            assert [row[0] for row in conn.execute("SELECT title FROM raw_articles ORDER BY id")] == \
+                ["failed-new", "retry-old"], "Recent failures and articles still retried should stay"
+            assert manager.get_http_validators("https://example.com/list") is not None, \
+                "Fresh validators should stay"
+            assert [row[0] for row in conn.execute("SELECT source FROM source_stats")] == ["test"], \
+                "The emptied source counter should be removed"
+            print("✅ Retention deletes only rows past their policy")
+        finally:
+            manager.close()
+            maintenance.CRIME_DB_PATH = saved_path
+
+    print("=== All tests passed ===")
+
+
+def test_sync_news_watermark():
+    from src.database import db as app_db
+    from src.agent.db import DatabaseManager
+    from src import sync_news
+
+    def save(manager, n, published_at=None, latitude=50.0614):
+        manager.save_article(f"https://example.com/sync/{n}", f"Test Sync {n}", "Treść " * 20, "test",
+                             "kradzież", "Kraków", "Skradziono rower", "kradzież",
+                             latitude, 19.9366, severity=5, published_at=published_at)
+
+    print("=== Starting sync_news tests ===")
+
+    saved_path = sync_news.CRIME_DB_PATH
+    with temp_database(app_db) as directory:
+        sync_news.CRIME_DB_PATH = os.path.join(directory, "crime_data.db")
+        manager = DatabaseManager(sync_news.CRIME_DB_PATH)
+        try:
+            save(manager, 1, published_at="2025-03-01 08:00:00")
+            save(manager, 2)
+            save(manager, 3, latitude=None)
+
+            assert sync_news.sync_news(batch_size=2) == 2, "Both articles with a position should be synced"
+            processed_at = manager.get_connection().execute(
+                "SELECT processed_at FROM processed_articles WHERE id = 2").fetchone()[0]
+            assert sorted(row['date'] for row in app_db.view_all()) == sorted(["2025-03-01 08:00:00", processed_at]), \
+                "The publication date should be used, processed_at only without one"
+            assert app_db.get_sync_watermark(sync_news.SYNC_NAME) == 3, \
+                "The watermark should pass articles without a position too"
+            print("✅ sync_news copied new articles with their publication date")
+
+            assert sync_news.sync_news() == 0, "A second run should find nothing new"
+            save(manager, 4, published_at="2025-03-02 09:30:00")
+            assert sync_news.sync_news() == 1, "Only the article after the watermark should be synced"
+            assert len(app_db.view_all()) == 3, "Earlier articles should not be copied again"
+            print("✅ sync_news resumes from the stored watermark")
+        finally:
+            manager.close()
+            sync_news.CRIME_DB_PATH = saved_path
 
     print("=== All tests passed ===")
 
 
 if __name__ == "__main__":
-    test_row_exists()
\ No newline at end of file
+    test_row_exists()
+    test_add_row_ignores_duplicates()
+    test_query_bbox()
+    test_window_heatmap_matches_brute_force()
+    test_layers_cache_byte_limit()
+    test_archive_round_trip()
+    test_read_snapshot_refresh()
+    test_alerts_page_keyset()
+    test_maintenance_retention()
+    test_sync_news_watermark()
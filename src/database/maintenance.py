@@ -0,0 +1,261 @@
+# maintenance.py
+"""
+Retention, pruning and VACUUM/ANALYZE for data.db and crime_data.db.
+
+Run off-peak, e.g. from cron every night:
+    python -m src.database.maintenance            # only inside MAINTENANCE_WINDOW
+    python -m src.database.maintenance --force    # now
+    python -m src.database.maintenance --force --enable-incremental-vacuum
+"""
+import os
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from src.database import db
+
+CRIME_DB_PATH = os.path.join(os.path.dirname(db.BASE_DIR), "data", "crime_data.db")
+
+# Off-peak window, local time "HH:MM-HH:MM" (may wrap past midnight)
+MAINTENANCE_WINDOW = os.environ.get("MAINTENANCE_WINDOW", "02:00-05:00")
+# Rows deleted per transaction and pages freed per incremental_vacuum step;
+# small steps keep each write lock short so readers are not stalled
+BATCH_SIZE = int(os.environ.get("MAINTENANCE_BATCH_SIZE", 500))
+VACUUM_STEP_PAGES = int(os.environ.get("MAINTENANCE_VACUUM_STEP", 256))
+
+TOKEN_RETENTION_DAYS = int(os.environ.get("TOKEN_RETENTION_DAYS", 7))
+FAILED_ARTICLE_RETENTION_DAYS = int(os.environ.get("FAILED_ARTICLE_RETENTION_DAYS", 30))
+HTTP_VALIDATOR_RETENTION_DAYS = int(os.environ.get("HTTP_VALIDATOR_RETENTION_DAYS", 30))
+MAX_PROCESSING_ATTEMPTS = 3
+
+
+# where: SQL condition with ? placeholders, params: callable -> tuple (evaluated at run time)
+RetentionPolicy = namedtuple("RetentionPolicy", "name database table where params")
+
+
+def _days_ago(days, fmt="%Y-%m-%d %H:%M:%S"):
+    return (datetime.now() - timedelta(days=days)).strftime(fmt)
+
+
+RETENTION_POLICIES = [
+    # Magic-link tokens: used or expired ones older than the retention period
+    RetentionPolicy(
+        "tokens", "data", "tokens",
+        "created_at < ?",
+        lambda: (time.time() - TOKEN_RETENTION_DAYS * 86400,),
+    ),
+    # Articles the LLM failed on repeatedly; seen_urls keeps them from being re-fetched
+    RetentionPolicy(
+        "failed_raw_articles", "crime", "raw_articles",
+        "is_processed = 0 AND processing_attempts >= ? AND scraped_at < ?",
+        lambda: (MAX_PROCESSING_ATTEMPTS, _days_ago(FAILED_ARTICLE_RETENTION_DAYS)),
+    ),
+    # ETag / Last-Modified of listing pages no longer crawled (removed start URLs, old pagination)
+    RetentionPolicy(
+        "stale_http_validators", "crime", "http_validators",
+        "checked_at < ?",
+        lambda: (_days_ago(HTTP_VALIDATOR_RETENTION_DAYS),),
+    ),
+    # Counter rows that dropped to zero after deletes
+    RetentionPolicy("empty_source_stats", "crime", "source_stats", "total <= 0", lambda: ()),
+    RetentionPolicy("empty_crime_type_stats", "crime", "crime_type_stats", "count <= 0", lambda: ()),
+]
+
+# Representative queries whose plans are compared before and after ANALYZE
+PLAN_QUERIES = {
+    "data": {
+        "heatmap_window": ("SELECT lat, lon, trust FROM scrapped_data WHERE date >= ? AND date < ?",
+                           ("2024-01-01", "2025-01-01")),
+        "dedup_probe": ("SELECT 1 FROM scrapped_data WHERE date = ? AND label = ? AND coord_key = ?",
+                        ("2024-01-01", "x", "0,0")),
+        "user_alerts": ("SELECT * FROM Coordinate WHERE email = ? ORDER BY date DESC, id DESC LIMIT 100",
+                        ("a@b.c",)),
+    },
+    "crime": {
+        "pending_articles": ("SELECT id FROM raw_articles WHERE is_processed = 0 "
+                             "AND processing_attempts < 3 ORDER BY scraped_at DESC LIMIT 10", ()),
+        "processed_since": ("SELECT p.id FROM processed_articles p "
+                            "LEFT JOIN locations l ON l.id = p.location_id WHERE p.id > ? ORDER BY p.id",
+                            (0,)),
+        "crimes_by_place": ("SELECT p.id FROM locations l JOIN processed_articles p ON p.location_id = l.id "
+                            "WHERE l.municipality_key >= ? AND l.municipality_key < ?", ("krakow", "krakowz")),
+    },
+}
+
+
+def in_window(now=None, window=MAINTENANCE_WINDOW):
+    """True if `now` falls into the "HH:MM-HH:MM" window (the end is exclusive)."""
+    now = (now or datetime.now()).strftime("%H:%M")
+    start, end = window.split("-")
+    if start <= end:
+        return start <= now < end
+    return now >= start or now < end
+
+
+def _connect(database):
+    if database == "data":
+        return db.connect_db()
+    # crime_data.db triggers call article_text(), which only DatabaseManager registers
+    from src.agent.db import DatabaseManager
+    return DatabaseManager(CRIME_DB_PATH).get_connection()
+
+
+def _page_stats(conn):
+    return {
+        "page_count": conn.execute("PRAGMA page_count").fetchone()[0],
+        "freelist_count": conn.execute("PRAGMA freelist_count").fetchone()[0],
+        "page_size": conn.execute("PRAGMA page_size").fetchone()[0],
+    }
+
+
+def _query_plans(conn, database):
+    plans = {}
+    for name, (sql, params) in PLAN_QUERIES[database].items():
+        try:
+            rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+            plans[name] = [row[3] for row in rows]
+        except Exception as e:  # table from a later migration may be missing
+            plans[name] = [f"error: {e}"]
+    return plans
+
+
+def apply_retention(conn, database, batch_size=BATCH_SIZE):
+    """Deletes rows matched by the database's policies in short transactions; returns counts."""
+    deleted = {}
+    for policy in RETENTION_POLICIES:
+        if policy.database != database:
+            continue
+        params = policy.params()
+        total = 0
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = conn.execute(f"""
+                    DELETE FROM {policy.table} WHERE rowid IN (
+                        SELECT rowid FROM {policy.table} WHERE {policy.where} LIMIT ?
+                    )
+                """, params + (batch_size,))
+                count = cursor.rowcount
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            total += count
+            if count < batch_size:
+                break
+        deleted[policy.name] = total
+    return deleted
+
+
+def incremental_vacuum(conn, enable=False, step_pages=VACUUM_STEP_PAGES):
+    """
+    Returns free pages to the filesystem in small steps.
+
+    Needs auto_vacuum=INCREMENTAL; switching an existing database to it takes
+    one full VACUUM (exclusive lock, copies the whole file), so it is done only
+    when enable=True. Returns the number of pages released.
+    """
+    mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    if mode != 2:
+        if not enable:
+            return 0
+        before = conn.execute("PRAGMA page_count").fetchone()[0]
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        return before - conn.execute("PRAGMA page_count").fetchone()[0]
+
+    released = 0
+    while True:
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if free == 0:
+            break
+        conn.execute(f"PRAGMA incremental_vacuum({min(free, step_pages)})")
+        if conn.in_transaction:
+            conn.commit()
+        released += free - conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return released
+
+
+def optimize(conn):
+    """ANALYZE on first run (no statistics yet), otherwise the cheap PRAGMA optimize."""
+    has_stats = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'"
+    ).fetchone() is not None
+    if has_stats:
+        # analysis_limit bounds the work per index so the run stays short
+        conn.execute("PRAGMA analysis_limit = 400")
+        conn.execute("PRAGMA optimize")
+    else:
+        conn.execute("ANALYZE")
+    if conn.in_transaction:
+        conn.commit()
+
+
+def maintain(database, enable_incremental_vacuum=False):
+    """Runs retention, vacuum and optimize on one database; returns its report."""
+    conn = _connect(database)
+    try:
+        pages_before = _page_stats(conn)
+        plans_before = _query_plans(conn, database)
+
+        deleted = apply_retention(conn, database)
+        freed_by_retention = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        released = incremental_vacuum(conn, enable=enable_incremental_vacuum)
+        optimize(conn)
+        if conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal":
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+        pages_after = _page_stats(conn)
+        plans_after = _query_plans(conn, database)
+    finally:
+        conn.close()
+
+    return {
+        "database": database,
+        "deleted": deleted,
+        "free_pages_after_retention": freed_by_retention,
+        "pages_released": released,
+        "pages_before": pages_before,
+        "pages_after": pages_after,
+        "plan_changes": {name: {"before": plans_before[name], "after": plans_after[name]}
+                         for name in plans_after if plans_before.get(name) != plans_after[name]},
+    }
+
+
+def print_report(report):
+    print(f"=== {report['database']} ===")
+    for name, count in report["deleted"].items():
+        print(f"  retention {name}: {count} rows deleted")
+    before, after = report["pages_before"], report["pages_after"]
+    print(f"  pages: {before['page_count']} -> {after['page_count']} "
+          f"(released {report['pages_released']}, "
+          f"{report['pages_released'] * after['page_size']} bytes), "
+          f"free pages left: {after['freelist_count']}")
+    if not report["plan_changes"]:
+        print("  query plans: unchanged")
+    for name, change in report["plan_changes"].items():
+        print(f"  query plan changed: {name}")
+        for line in change["before"]:
+            print(f"    - {line}")
+        for line in change["after"]:
+            print(f"    + {line}")
+
+
+def run_maintenance(force=False, enable_incremental_vacuum=False):
+    """Maintains both databases; outside MAINTENANCE_WINDOW does nothing unless force=True."""
+    if not force and not in_window():
+        print(f"Outside maintenance window {MAINTENANCE_WINDOW}, skipping.")
+        return []
+
+    reports = [maintain("data", enable_incremental_vacuum)]
+    if os.path.exists(CRIME_DB_PATH):
+        reports.append(maintain("crime", enable_incremental_vacuum))
+    for report in reports:
+        print_report(report)
+    return reports
+
+
+if __name__ == "__main__":
+    run_maintenance(force="--force" in sys.argv,
+                    enable_incremental_vacuum="--enable-incremental-vacuum" in sys.argv)
@@ -1,24 +1,9 @@
 import numpy as np
 import matplotlib.pyplot as plt
-from src.database.db import view_all
+from src.database.db import view_all_arrays, get_data_version, get_archive_cutoff, count_rows_between
 import math
-from pyproj import Transformer
-
-# Transformer do konwersji EPSG:2180 (PUWG 1992) -> EPSG:4326 (WGS84)
-transformer = Transformer.from_crs("EPSG:2180", "EPSG:4326", always_xy=True)
-
-def convert_point(x, y):
-    """
-    Konwertuje współrzędne z EPSG:2180 na (lat, lon) w EPSG:4326.
-    Zakłada, że wartości > 10000 to współrzędne w PUWG 1992.
-    """
-    # PUWG 1992 ma wartości rzędu setek tysięcy
-    if x > 10000 and y > 10000:
-        lon, lat = transformer.transform(x, y)
-        return lat, lon
-    else:
-        # Już w formacie lat, lon
-        return x, y
+import threading
+from collections import OrderedDict
 
 def degrees_to_meters_approx(lat, degrees):
     """
@@ -40,49 +25,10 @@ def meters_to_degrees(lat, meters):
     
     return degrees_lat, degrees_lon
 
-def create_heatmap(resolution=100, radius_meters=500, normalize=True):
-    """
-    Tworzy heatmapę na podstawie danych z bazy.
-    
-    Args:
-        resolution: Rozdzielczość siatki (NxN)
-        radius_meters: Promień wpływu punktu w metrach
-        normalize: Czy normalizować wartości trust
-    """
-    # 1. Pobranie i przygotowanie danych
-    data = view_all()
-    print(f"[HEATMAP] Retrieved {len(data) if data else 0} rows from database")
-    
-    if not data:
-        print("[HEATMAP] No data returned from view_all()")
-        return None, None, None
-
-    # Debug: pokaż przykładowy rekord
-    if data:
-        print(f"[HEATMAP] Sample record keys: {list(data[0].keys())}")
-        print(f"[HEATMAP] Sample record: {data[0]}")
-
-    points = []
-    skipped = 0
-    for row in data:
-        if row.get('coordinates') and row.get('trust') is not None:
-            # Konwersja współrzędnych jeśli potrzeba
-            x, y = row['coordinates']
-            lat, lon = convert_point(x, y)
-            points.append({'lat': lat, 'lon': lon, 'trust': row['trust']})
-        else:
-            skipped += 1
-
-    print(f"[HEATMAP] Processed {len(points)} valid points, skipped {skipped}")
-    
-    if not points:
-        print("[HEATMAP] No valid points after filtering")
-        return None, None, None
-
-    lats = [p['lat'] for p in points]
-    lons = [p['lon'] for p in points]
-    min_lat, max_lat = min(lats), max(lats)
-    min_lon, max_lon = min(lons), max(lons)
+def _grid_geometry(lats, lons, resolution, radius_meters):
+    """Wyznacza granice siatki (z paddingiem ~100m), krok komórek i promień wpływu."""
+    min_lat, max_lat = float(lats.min()), float(lats.max())
+    min_lon, max_lon = float(lons.min()), float(lons.max())
 
     # Padding (około 100m)
     center_lat = (min_lat + max_lat) / 2
@@ -93,85 +39,342 @@ def create_heatmap(resolution=100, radius_meters=500, normalize=True):
     min_lon -= lon_padding
     max_lon += lon_padding
 
-    bounds = {
-        'min_lat': min_lat, 'max_lat': max_lat,
-        'min_lon': min_lon, 'max_lon': max_lon
-    }
-
-    # Normalizacja wartości trust
-    trust_values = [p['trust'] for p in points]
-    if normalize and trust_values:
-        min_trust = min(trust_values)
-        max_trust = max(trust_values)
-        trust_range = max_trust - min_trust if max_trust != min_trust else 1
-        for p in points:
-            p['trust_scaled'] = (p['trust'] - min_trust) / trust_range
-    else:
-        for p in points:
-            p['trust_scaled'] = p['trust']
-
-    # Inicjalizacja siatki heatmapy
-    heatmap = np.zeros((resolution, resolution))
     lat_step = (max_lat - min_lat) / resolution
     lon_step = (max_lon - min_lon) / resolution
 
     # Konwersja promienia z metrów na stopnie (dla centrum obszaru)
     center_lat = (min_lat + max_lat) / 2
     radius_deg_lat, radius_deg_lon = meters_to_degrees(center_lat, radius_meters)
-    
-    # Używamy średniego promienia w stopniach
-    radius_degrees = (radius_deg_lat + radius_deg_lon) / 2
 
-    # Obliczanie zakresu wpływu w komórkach siatki
-    delta_i = math.ceil(radius_deg_lat / lat_step)
-    delta_j = math.ceil(radius_deg_lon / lon_step)
+    return {
+        'min_lat': min_lat, 'max_lat': max_lat,
+        'min_lon': min_lon, 'max_lon': max_lon,
+        'resolution': resolution,
+        'lat_step': lat_step,
+        'lon_step': lon_step,
+        'radius_deg_lat': radius_deg_lat,
+        'radius_deg_lon': radius_deg_lon,
+        # Obliczanie zakresu wpływu w komórkach siatki
+        'delta_i': math.ceil(radius_deg_lat / lat_step),
+        'delta_j': math.ceil(radius_deg_lon / lon_step),
+    }
+
 
-    # Generowanie heatmapy
-    for point in points:
+def _trust_scale(trust, normalize):
+    """Zwraca (min_trust, trust_range) używane do normalizacji wartości trust."""
+    if not normalize:
+        return 0, 1
+    min_trust, max_trust = float(trust.min()), float(trust.max())
+    trust_range = max_trust - min_trust if max_trust != min_trust else 1
+    return min_trust, trust_range
+
+
+def _accumulate(heatmap, lats, lons, weights, geo):
+    """Dodaje wpływ punktów (jądro Gaussa) do siatki heatmapy."""
+    resolution = geo['resolution']
+    min_lat, min_lon = geo['min_lat'], geo['min_lon']
+    lat_step, lon_step = geo['lat_step'], geo['lon_step']
+    delta_i, delta_j = geo['delta_i'], geo['delta_j']
+
+    for lat, lon, weight in zip(lats, lons, weights):
         # Znajdź komórkę środkową dla punktu
-        i_center = int((point['lat'] - min_lat) / lat_step)
-        j_center = int((point['lon'] - min_lon) / lon_step)
+        i_center = int((lat - min_lat) / lat_step)
+        j_center = int((lon - min_lon) / lon_step)
 
         # Zakres wpływu (z optymalizacją)
         i_min = max(0, i_center - delta_i)
         i_max = min(resolution, i_center + delta_i + 1)
         j_min = max(0, j_center - delta_j)
         j_max = min(resolution, j_center + delta_j + 1)
+        if i_min >= i_max or j_min >= j_max:
+            continue
+
+        # Środki komórek siatki w oknie wpływu
+        grid_lat = min_lat + (np.arange(i_min, i_max) + 0.5) * lat_step
+        grid_lon = min_lon + (np.arange(j_min, j_max) + 0.5) * lon_step
+
+        # Znormalizowana odległość od punktu
+        distance = np.sqrt(
+            ((lat - grid_lat[:, None]) / geo['radius_deg_lat']) ** 2 +
+            ((lon - grid_lon[None, :]) / geo['radius_deg_lon']) ** 2
+        )
+
+        # Funkcja jądra Gaussa z lepszym wypełnieniem centrum, tylko w zasięgu
+        influence = np.where(distance <= 1.0, np.exp(-distance ** 2 / 0.3), 0.0)
+        heatmap[i_min:i_max, j_min:j_max] += weight * influence
+
+
+def _weights(trust, scale):
+    min_trust, trust_range = scale
+    return np.abs((trust - min_trust) / trust_range) * 3  # Zwiększony mnożnik
 
-        for i in range(i_min, i_max):
-            for j in range(j_min, j_max):
-                # Środek komórki siatki
-                grid_lat = min_lat + (i + 0.5) * lat_step
-                grid_lon = min_lon + (j + 0.5) * lon_step
-
-                # Oblicz odległość w stopniach
-                distance_degrees = math.sqrt(
-                    ((point['lat'] - grid_lat) / radius_deg_lat) ** 2 + 
-                    ((point['lon'] - grid_lon) / radius_deg_lon) ** 2
-                )
-
-                # Jeśli w zasięgu, dodaj wpływ
-                if distance_degrees <= 1.0:  # Znormalizowana odległość
-                    # Funkcja jądra Gaussa z lepszym wypełnieniem centrum
-                    # Zmniejszamy wykładnik, żeby centrum było bardziej wypełnione
-                    influence = math.exp(-distance_degrees ** 2 / 0.3)  # Było 0.5
-                    heatmap[i, j] += abs(point['trust_scaled']) * influence * 3  # Zwiększony mnożnik
 
+def _result(heatmap, geo, radius_meters, num_points, normalize, **extra):
+    """Buduje (heatmap, bounds, grid_info) w formacie oczekiwanym przez API."""
+    bounds = {
+        'min_lat': geo['min_lat'], 'max_lat': geo['max_lat'],
+        'min_lon': geo['min_lon'], 'max_lon': geo['max_lon']
+    }
     grid_info = {
-        'resolution': resolution,
+        'resolution': geo['resolution'],
         'radius_meters': radius_meters,
-        'radius_degrees': radius_degrees,
-        'lat_step': lat_step,
-        'lon_step': lon_step,
-        'num_points': len(points),
+        # Używamy średniego promienia w stopniach
+        'radius_degrees': (geo['radius_deg_lat'] + geo['radius_deg_lon']) / 2,
+        'lat_step': geo['lat_step'],
+        'lon_step': geo['lon_step'],
+        'num_points': num_points,
         'normalized': normalize,
-        'delta_i': delta_i,
-        'delta_j': delta_j
+        'delta_i': geo['delta_i'],
+        'delta_j': geo['delta_j'],
+        **extra
     }
-
     return heatmap, bounds, grid_info
 
 
+def create_heatmap(resolution=100, radius_meters=500, normalize=True, bbox=None, since=None, until=None):
+    """
+    Tworzy heatmapę na podstawie danych z bazy.
+    
+    Args:
+        resolution: Rozdzielczość siatki (NxN)
+        radius_meters: Promień wpływu punktu w metrach
+        normalize: Czy normalizować wartości trust
+        bbox: Opcjonalnie (min_lat, min_lon, max_lat, max_lon) - tylko punkty w widoku
+        since, until: Opcjonalne okno czasowe [since, until) - patrz create_window_heatmap
+    """
+    if since is not None or until is not None:
+        return create_window_heatmap(resolution, radius_meters, normalize, bbox, since, until)
+    return _direct_heatmap(resolution, radius_meters, normalize, bbox)
+
+
+def _direct_heatmap(resolution, radius_meters, normalize, bbox, since=None, until=None):
+    """Heatmapa liczona wprost z punktów (geometria i normalizacja z tych punktów)."""
+    # 1. Pobranie danych jako tablice NumPy (lat/lon już w WGS84)
+    data = view_all_arrays(("lat", "lon", "trust"), bbox=bbox, since=since, until=until)
+    lats, lons, trust = data["lat"], data["lon"], data["trust"]
+    print(f"[HEATMAP] Retrieved {len(lats)} valid points from database")
+
+    if not len(lats):
+        print("[HEATMAP] No valid points in database")
+        return None, None, None
+
+    geo = _grid_geometry(lats, lons, resolution, radius_meters)
+
+    # Generowanie heatmapy
+    heatmap = np.zeros((resolution, resolution))
+    _accumulate(heatmap, lats, lons, _weights(trust, _trust_scale(trust, normalize)), geo)
+
+    window = {'since': since, 'until': until} if since is not None or until is not None else {}
+    return _result(heatmap, geo, radius_meters, len(lats), normalize, **window)
+
+
+# --- Okna czasowe: skumulowane warstwy miesięczne ---
+
+# Każdy wpis to stos (miesiące + 1) siatek float64 - przy resolution=300 to ok.
+# 720 KB na miesiąc historii - więc trzymamy tylko kilka ostatnio używanych
+# kombinacji parametrów (LRU), do łącznego limitu bajtów; bbox nie jest częścią klucza
+LAYERS_CACHE_SIZE = 4
+LAYERS_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# (resolution, radius_meters, normalize, include_archive) -> {'version', 'max_rowid', 'layers'}
+_layers_cache = OrderedDict()
+_layers_lock = threading.Lock()
+
+
+def _month_index(date):
+    """'YYYY-MM-...' -> year * 12 + (month - 1), tak jak kolumna "month" w view_all_arrays."""
+    return int(date[:4]) * 12 + int(date[5:7]) - 1
+
+
+def _month_start(date):
+    return f"{date[:7]}-01"
+
+
+def _build_time_layers(resolution, radius_meters, normalize, include_archive, max_rowid):
+    """
+    Liczy siatkę dla każdego miesiąca z danymi i sumy prefiksowe:
+    prefix[k] = suma siatek pierwszych k miesięcy (prefix[0] = 0).
+    Geometria i normalizacja są wspólne dla całej historii, więc warstwy się sumują.
+    Bierze tylko wiersze z id <= max_rowid, żeby kolejne dopisanie ich nie zdublowało.
+    """
+    data = view_all_arrays(("id", "lat", "lon", "trust", "month"), include_archive=include_archive)
+    keep = data["id"] <= max_rowid
+    if not keep.any():
+        return None
+
+    order = np.argsort(data["month"][keep], kind="stable")
+    lats, lons, trust = data["lat"][keep][order], data["lon"][keep][order], data["trust"][keep][order]
+    months_all = data["month"][keep][order].astype(int)
+
+    geo = _grid_geometry(lats, lons, resolution, radius_meters)
+    scale = _trust_scale(trust, normalize)
+    weights = _weights(trust, scale)
+
+    months, starts, counts = np.unique(months_all, return_index=True, return_counts=True)
+    prefix = np.zeros((len(months) + 1, resolution, resolution))
+    for k, (start, count) in enumerate(zip(starts, counts)):
+        prefix[k + 1] = prefix[k]
+        _accumulate(prefix[k + 1], lats[start:start + count], lons[start:start + count],
+                    weights[start:start + count], geo)
+
+    print(f"[HEATMAP] Built cumulative layers for {len(months)} months, {len(lats)} points")
+    return {
+        'geo': geo,
+        'scale': scale,
+        'normalize': normalize,
+        'trust_bounds': (float(trust.min()), float(trust.max())),
+        'months': months,
+        'prefix': prefix,
+        'prefix_counts': np.concatenate(([0], np.cumsum(counts))),
+    }
+
+
+def _extend_time_layers(layers, after_id, max_rowid):
+    """
+    Dopisuje wiersze after_id < id <= max_rowid do istniejących warstw.
+
+    Nowe punkty trafiają do ostatniego miesiąca (albo do nowych miesięcy na
+    końcu), bez przeliczania historii. Zwraca False, gdy się nie da: punkt
+    poza siatką, trust poza zakresem normalizacji albo data sprzed ostatniego
+    miesiąca - wtedy warstwy trzeba zbudować od nowa.
+    """
+    data = view_all_arrays(("id", "lat", "lon", "trust", "month"), after_id=after_id, include_archive=False)
+    keep = data["id"] <= max_rowid
+    lats, lons, trust = data["lat"][keep], data["lon"][keep], data["trust"][keep]
+    months_new = data["month"][keep].astype(int)
+    if not len(lats):
+        return True
+
+    geo = layers['geo']
+    min_trust, max_trust = layers['trust_bounds']
+    if (lats.min() < geo['min_lat'] or lats.max() > geo['max_lat']
+            or lons.min() < geo['min_lon'] or lons.max() > geo['max_lon']):
+        return False
+    if layers['normalize'] and (trust.min() < min_trust or trust.max() > max_trust):
+        return False
+    if months_new.min() < layers['months'][-1]:
+        return False
+
+    weights = _weights(trust, layers['scale'])
+    new_months = np.unique(months_new)
+    added = [m for m in new_months if m != layers['months'][-1]]
+    if added:
+        # Nowe miesiące zaczynają od sumy całej dotychczasowej historii
+        tail = np.repeat(layers['prefix'][-1:], len(added), axis=0)
+        layers['prefix'] = np.concatenate((layers['prefix'], tail))
+        layers['prefix_counts'] = np.concatenate(
+            (layers['prefix_counts'], np.repeat(layers['prefix_counts'][-1], len(added))))
+        layers['months'] = np.concatenate((layers['months'], added))
+
+    for month in new_months:
+        k = int(np.searchsorted(layers['months'], month)) + 1
+        rows = months_new == month
+        # Miesiąc k wchodzi do prefix[k] i wszystkich późniejszych
+        for j in range(k, len(layers['prefix'])):
+            _accumulate(layers['prefix'][j], lats[rows], lons[rows], weights[rows], geo)
+            layers['prefix_counts'][j] += int(rows.sum())
+
+    print(f"[HEATMAP] Added {len(lats)} new points to cumulative layers")
+    return True
+
+
+def _layers_nbytes(entry):
+    return 0 if entry['layers'] is None else entry['layers']['prefix'].nbytes
+
+
+def _get_time_layers(resolution, radius_meters, normalize, include_archive):
+    """
+    Zwraca warstwy z cache. Gdy od ich zbudowania tylko dopisano wiersze,
+    dokłada je do ostatniego miesiąca; po zmianach lub usunięciach przebudowuje.
+    """
+    key = (resolution, radius_meters, normalize, include_archive)
+    with _layers_lock:
+        version = get_data_version()
+        current, max_rowid = version['scrapped_data_version'], version['scrapped_data_max_rowid']
+        entry = _layers_cache.get(key)
+
+        if entry is not None and entry['version'] != current:
+            # Każdy INSERT podbija wersję o 1; jeśli przyrost wersji równa się liczbie
+            # nowych wierszy, nie było UPDATE ani DELETE (np. przeniesienia do archiwum)
+            only_inserts = (entry['layers'] is not None and current - entry['version']
+                            == count_rows_between(entry['max_rowid'], max_rowid))
+            if only_inserts and _extend_time_layers(entry['layers'], entry['max_rowid'], max_rowid):
+                entry.update(version=current, max_rowid=max_rowid)
+            else:
+                entry = None
+
+        if entry is None:
+            entry = {
+                'version': current,
+                'max_rowid': max_rowid,
+                'layers': _build_time_layers(resolution, radius_meters, normalize, include_archive, max_rowid),
+            }
+            _layers_cache[key] = entry
+
+        _layers_cache.move_to_end(key)
+        # Bieżący wpis zostaje nawet ponad limitem - bez niego każde okno budowałoby warstwy od nowa
+        total = sum(_layers_nbytes(e) for e in _layers_cache.values())
+        while len(_layers_cache) > 1 and (len(_layers_cache) > LAYERS_CACHE_SIZE
+                                          or total > LAYERS_CACHE_MAX_BYTES):
+            _, evicted = _layers_cache.popitem(last=False)
+            total -= _layers_nbytes(evicted)
+        return entry['layers']
+
+
+def _prefix_before(layers, date):
+    """Siatka i liczba punktów ze wszystkich miesięcy przed miesiącem `date` (None = od początku)."""
+    if date is None:
+        return 0, 0
+    k = int(np.searchsorted(layers['months'], _month_index(date), side='left'))
+    return layers['prefix'][k], int(layers['prefix_counts'][k])
+
+
+def create_window_heatmap(resolution=100, radius_meters=500, normalize=True, bbox=None, since=None, until=None):
+    """
+    Heatmapa dla okna czasowego [since, until) (daty 'YYYY-MM-DD[ HH:MM:SS]').
+    Sam `until` daje heatmapę "na dzień".
+
+    Bez bbox okno to różnica dwóch sum prefiksowych po pełnych miesiącach, plus
+    korekta o wiersze z niepełnych miesięcy na krańcach okna (indeks po dacie),
+    więc koszt nie zależy od liczby wierszy w oknie. Siatka i normalizacja są
+    wspólne dla całej historii, dzięki czemu okna są ze sobą porównywalne.
+    Z bbox (dowolny wycinek mapy) punkty okna są czytane wprost przez R*Tree
+    i indeks po dacie - warstw dla każdego widoku nie trzymamy.
+    Archiwum (archive.db) jest dołączane tylko gdy okno sięga przed datę odcięcia.
+    """
+    if bbox is not None:
+        return _direct_heatmap(resolution, radius_meters, normalize, bbox, since, until)
+
+    cutoff = get_archive_cutoff()
+    include_archive = cutoff is not None and (since is None or since < cutoff)
+    layers = _get_time_layers(resolution, radius_meters, normalize, include_archive)
+    if layers is None:
+        print("[HEATMAP] No valid points in database")
+        return None, None, None
+
+    geo, scale = layers['geo'], layers['scale']
+
+    if until is None:
+        upper, upper_count = layers['prefix'][-1], int(layers['prefix_counts'][-1])
+    else:
+        upper, upper_count = _prefix_before(layers, until)
+    lower, lower_count = _prefix_before(layers, since)
+    heatmap = np.array(upper - lower, dtype=float).reshape(resolution, resolution)
+    num_points = upper_count - lower_count
+
+    # Korekta o niepełne miesiące: + [początek miesiąca until, until), - [początek miesiąca since, since)
+    for edge, sign in ((until, 1), (since, -1)):
+        if edge is None or edge == _month_start(edge):
+            continue
+        rows = view_all_arrays(("lat", "lon", "trust"), since=_month_start(edge), until=edge)
+        _accumulate(heatmap, rows["lat"], rows["lon"], sign * _weights(rows["trust"], scale), geo)
+        num_points += sign * len(rows["lat"])
+
+    # Usuń szum numeryczny z odejmowania warstw
+    heatmap[np.abs(heatmap) < 1e-9] = 0.0
+
+    return _result(heatmap, geo, radius_meters, num_points, normalize, since=since, until=until)
+
+
 def print_heatmap_stats(heatmap, bounds, grid_info):
     """Wyświetla statystyki wygenerowanej heatmapy."""
     if heatmap is None:
@@ -224,18 +427,10 @@ def plot_heatmap(heatmap, bounds, grid_info, title="Trust Heatmap",
     plt.colorbar(im, ax=ax, label='Heat Intensity (Trust Value)')
 
     if show_points:
-        data = view_all() 
-        points = []
-        for row in data:
-            if row['coordinates'] and row['trust'] is not None:
-                x, y = row['coordinates']
-                lat, lon = convert_point(x, y)
-                points.append((lat, lon))
-        
-        if points:
-            lats = [p[0] for p in points]
-            lons = [p[1] for p in points]
+        data = view_all_arrays(("lat", "lon", "trust"))
+        lats, lons = data["lat"], data["lon"]
 
+        if len(lats):
             ax.scatter(
                 lons, lats,
                 c='cyan',
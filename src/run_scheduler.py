@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Długo działający scheduler crawli - zastępuje uruchamianie `scrapy runspider`
+w podprocesach; run_malopolska.py i run_scraper_batches.py to już tylko skróty
+do main() z gotowymi argumentami.
+
+Jeden proces trzyma "ciepłe": klienta AI z cache, indeks odwiedzonych URL
+i połączenie z bazą. Crawle startują przez CrawlerRunner według harmonogramu,
+a limit API pilnuje token bucket zamiast sztywnej pauzy 65 s.
+
+Uruchomienie (z katalogu src/):
+    python run_scheduler.py --minutes 60 --spiders malopolska,police
+"""
+import argparse
+import logging
+import threading
+import time
+
+from scrapy.crawler import CrawlerRunner
+from scrapy.settings import Settings
+from scrapy.utils.log import configure_logging
+from scrapy.utils.reactor import install_reactor
+from twisted.python.failure import Failure
+
+logger = logging.getLogger(__name__)
+
+CRIME_DB_PATH = "data/crime_data.db"
+
+# Ustawienia pojedynczego crawla (wcześniej przekazywane przez -s do runspider)
+JOB_SETTINGS = {
+    "CLOSESPIDER_ITEMCOUNT": 8,
+    "CLOSESPIDER_PAGECOUNT": 10,
+}
+
+
+class TokenBucket:
+    """
+    Limiter zapytań (thread-safe - LLM wołany jest z puli wątków).
+    `rate_per_minute` tokenów na minutę, do `burst` naraz; acquire() czeka
+    dokładnie tyle, ile trzeba do następnego tokenu.
+    """
+
+    def __init__(self, rate_per_minute: float, burst: int = 1):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.waited = 0.0
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+                self.waited += wait
+            time.sleep(wait)
+
+
+def rate_limit_llm(ai_filter, bucket: TokenBucket):
+    """Podmienia ask_llm filtra na wersję czekającą na token z bucketu"""
+    ask_llm = ai_filter.ask_llm
+
+    def limited(*args, **kwargs):
+        bucket.acquire()
+        return ask_llm(*args, **kwargs)
+
+    ai_filter.ask_llm = limited
+    return ai_filter
+
+
+def load_jobs(names):
+    """
+    Zadania harmonogramu: klasa spidera, filtr AI i co ile minut startować.
+    Importy dopiero tutaj - reaktor musi być zainstalowany wcześniej.
+    """
+    jobs = []
+    if "malopolska" in names:
+        from agent.crime_news_scrapper.malopolska_crime_spider import MalopolskaCrimeSpider
+        from agent.crime_news_scrapper.ai_filter_ollama import CrimeFilterLocal
+        # Ollama lokalnie: limit chroni tylko przed zalaniem modelu
+        bucket = TokenBucket(120, burst=4)
+        jobs.append({"spider": MalopolskaCrimeSpider, "interval_minutes": 10, "bucket": bucket,
+                     "ai_filter": rate_limit_llm(CrimeFilterLocal(), bucket)})
+    if "police" in names:
+        from agent.crime_news_scrapper.police_direct_spider import PoliceDirectSpider
+        from agent.crime_news_scrapper.ai_filter_groq import CrimeFilterLocal
+        # Groq: 30 zapytań/min na darmowym planie - zostawiamy zapas
+        bucket = TokenBucket(28, burst=2)
+        jobs.append({"spider": PoliceDirectSpider, "interval_minutes": 30, "bucket": bucket,
+                     "ai_filter": rate_limit_llm(CrimeFilterLocal(), bucket)})
+    return jobs
+
+
+class CrawlScheduler:
+    def __init__(self, runner: CrawlerRunner, jobs, duration_minutes=60):
+        from agent.db import initialize_db_manager, UrlSeenIndex
+
+        self.runner = runner
+        self.jobs = jobs
+        self.deadline = time.time() + duration_minutes * 60
+        self.start_time = time.time()
+        self.db = initialize_db_manager(CRIME_DB_PATH)
+        # Jeden indeks URL na całą sesję - wczytany raz, zapisywany po każdym crawlu
+        self.seen_urls = UrlSeenIndex(self.db)
+        self.running = set()
+        self.session = {"crawls": 0, "failed_crawls": 0}
+
+    def start(self):
+        for job in self.jobs:
+            self._run_job(job)
+
+    def _run_job(self, job):
+        from twisted.internet import reactor
+
+        if time.time() >= self.deadline:
+            self._maybe_stop()
+            return
+
+        name = job["spider"].name
+        started = time.time()
+        self.running.add(name)
+        logger.info(f"Start crawla {name} (sesja: {self.session['crawls']} crawli)")
+
+        spidercls = type(job["spider"].__name__, (job["spider"],), {
+            "custom_settings": {**(job["spider"].custom_settings or {}), **JOB_SETTINGS},
+        })
+        crawler = self.runner.create_crawler(spidercls)
+        d = self.runner.crawl(crawler, ai_filter=job["ai_filter"], seen_urls=self.seen_urls)
+
+        def finished(result):
+            self.running.discard(name)
+            self._collect(crawler, result)
+            # Interwał liczony od startu crawla, nie od jego końca
+            delay = max(0, job["interval_minutes"] * 60 - (time.time() - started))
+            if time.time() + delay < self.deadline:
+                logger.info(f"Następny crawl {name} za {delay / 60:.1f} min")
+                reactor.callLater(delay, self._run_job, job)
+            else:
+                self._maybe_stop()
+
+        d.addBoth(finished)
+
+    def _collect(self, crawler, result):
+        self.session["crawls"] += 1
+        if isinstance(result, Failure):
+            self.session["failed_crawls"] += 1
+            logger.error(f"Crawl zakończony błędem: {result}")
+
+        # Liczniki spidera (saved_to_db, duplicates_skipped, ...) + statystyki Scrapy
+        spider_stats = getattr(crawler.spider, "stats", {}) or {}
+        for key, value in spider_stats.items():
+            if isinstance(value, (int, float)):
+                self.session[key] = self.session.get(key, 0) + value
+        for key in ("response_received_count", "item_scraped_count", "downloader/request_count",
+                    "conditional_get/not_modified"):
+            value = crawler.stats.get_value(key)
+            if value:
+                self.session[key] = self.session.get(key, 0) + value
+
+    def _maybe_stop(self):
+        from twisted.internet import reactor
+
+        if not self.running and reactor.running:
+            reactor.stop()
+
+    def print_summary(self):
+        elapsed = time.time() - self.start_time
+        logger.info("=" * 70)
+        logger.info("PODSUMOWANIE SESJI")
+        logger.info("=" * 70)
+        logger.info(f"Całkowity czas działania: {elapsed / 60:.1f} minut")
+        for key, value in sorted(self.session.items()):
+            logger.info(f"  {key}: {value}")
+        for job in self.jobs:
+            logger.info(f"  oczekiwanie na limit LLM ({job['spider'].name}): {job['bucket'].waited:.0f}s")
+        logger.info(f"Baza danych: {CRIME_DB_PATH}")
+        logger.info("=" * 70)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scheduler crawli w jednym procesie")
+    parser.add_argument("--minutes", type=float, default=60, help="czas działania sesji")
+    parser.add_argument("--spiders", default="malopolska",
+                        help="lista po przecinku: malopolska,police")
+    args = parser.parse_args(argv)
+
+    settings = Settings()
+    settings.setmodule("agent.crime_news_scrapper.settings", priority="project")
+    if settings["TWISTED_REACTOR"]:
+        install_reactor(settings["TWISTED_REACTOR"])
+    configure_logging(settings)
+
+    from twisted.internet import reactor
+
+    jobs = load_jobs(args.spiders.split(","))
+    if not jobs:
+        logger.error(f"Brak znanych spiderów w: {args.spiders}")
+        return
+
+    scheduler = CrawlScheduler(CrawlerRunner(settings), jobs, duration_minutes=args.minutes)
+    reactor.callWhenRunning(scheduler.start)
+    # Podsumowanie także po Ctrl+C (Twisted zatrzymuje wtedy reaktor sam)
+    reactor.addSystemEventTrigger("before", "shutdown", scheduler.print_summary)
+    reactor.run()
+
+
+if __name__ == "__main__":
+    main()
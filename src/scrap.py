@@ -1,6 +1,6 @@
 import requests
 from time import sleep
-from src.database.db import add_row, row_exists
+from src.database.db import add_row
 from datetime import datetime
 
 # ----------CONFIG--------------
@@ -143,15 +143,13 @@ def insert_crime_data(data):
         trust = get_trust(attr['Status'])
         print(date, label, coordinates, trust)
 
-        if not row_exists(date=date, label=label, coordinates=coordinates):
-            add_row(
-                date=date,
-                label=label,
-                coordinates=coordinates,
-                trust=trust,
-                user=None
-            )
-        else:
+        # Duplicates are rejected by the unique dedup index inside add_row
+        if not add_row(
+            date=date,
+            label=label,
+            coordinates=coordinates,
+            trust=trust,
+        ):
             print(f"Crime already exists: {date}, {label}, {coordinates}")
 
 if __name__ == "__main__":
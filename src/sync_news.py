@@ -0,0 +1,76 @@
+import os
+from src.agent.db import DatabaseManager
+from src.database.db import add_rows, get_sync_watermark
+
+# ----------CONFIG--------------
+CRIME_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "crime_data.db")
+SYNC_NAME = "processed_articles"
+BATCH_SIZE = 500
+
+# Severity from the LLM (1-10) -> trust weight used by the heatmap
+TRUST_UNKNOWN_SEVERITY = 2
+# ----------CONFIG--------------
+
+
+def severity_to_trust(severity):
+    """1-3 (minor) -> 1, 4-6 (medium) -> 2, 7-10 (serious / fatal) -> 3."""
+    try:
+        severity = int(severity)
+    except (TypeError, ValueError):
+        return TRUST_UNKNOWN_SEVERITY
+    if severity <= 3:
+        return 1
+    if severity <= 6:
+        return 2
+    return 3
+
+
+def article_to_row(article):
+    """Maps a processed article to add_row's arguments; None when it has no position."""
+    if article["latitude"] is None or article["longitude"] is None:
+        return None
+    return {
+        # Publication date from the feed / article page; crawl time only when the source has none
+        "date": article["published_at"] or article["processed_at"],
+        "label": article["crime_type"] or "inne",
+        "address": article["location"],
+        "city": article["municipality"],
+        "coordinates": [float(article["latitude"]), float(article["longitude"])],
+        "trust": severity_to_trust(article["severity"]),
+    }
+
+
+def sync_news(batch_size=BATCH_SIZE):
+    """
+    Copies processed articles newer than the stored watermark into scrapped_data.
+
+    Each batch and its watermark are committed together, so an interrupted run
+    resumes where it stopped and work is proportional to new articles only.
+    Inserts bump data_version through the existing triggers.
+    Returns the number of rows added to the heatmap store.
+    """
+    if not os.path.exists(CRIME_DB_PATH):
+        print(f"No crime database at {CRIME_DB_PATH}, nothing to sync.")
+        return 0
+
+    crime_db = DatabaseManager(CRIME_DB_PATH)
+    last_id = get_sync_watermark(SYNC_NAME)
+    added = 0
+    try:
+        while True:
+            articles = crime_db.get_processed_since(last_id, batch_size)
+            if not articles:
+                break
+            last_id = articles[-1]["id"]
+            rows = [row for row in map(article_to_row, articles) if row is not None]
+            added += add_rows(rows, watermark=(SYNC_NAME, last_id))
+            print(f"  → Synced up to article {last_id} ({added} new rows)")
+    finally:
+        crime_db.close()
+
+    print(f"Sync finished: {added} new rows, watermark {last_id}.")
+    return added
+
+
+if __name__ == "__main__":
+    sync_news()
@@ -1,14 +1,89 @@
-from flask import Blueprint, jsonify, request, session
-from src.database.db import add_row, get_user_alerts, get_all_alerts
+import json
+import os
+from datetime import datetime
+from flask import Blueprint, Response, jsonify, request, session, stream_with_context
+from src.database.db import (add_row, get_user_alerts, iter_alerts, get_alerts_page, query_alerts_bbox,
+                             get_data_version, get_user_alert_count)
 from src.heatmap_algo import create_heatmap
+from src.agent.db import initialize_db_manager
 from src.website.auth.utils import verify_jwt
 
 api_bp = Blueprint("api", __name__)
 
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Baza artykułów zbieranych przez spidery (src/data/crime_data.db)
+CRIME_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', '..', 'data', 'crime_data.db')
+STATS_MAX_AGE = 30
+# Heatmap grid limits: the cost and the cached layers grow with resolution^2
+MIN_HEATMAP_RESOLUTION, MAX_HEATMAP_RESOLUTION = 10, 300
+MIN_HEATMAP_RADIUS, MAX_HEATMAP_RADIUS = 50, 5000
+
+
+def parse_bbox():
+    """
+    Reads ?bbox=min_lat,min_lon,max_lat,max_lon from the query string.
+    Returns None when absent; raises ValueError when malformed.
+    """
+    raw = request.args.get('bbox')
+    if not raw:
+        return None
+
+    parts = [float(v) for v in raw.split(',')]
+    if len(parts) != 4 or parts[0] > parts[2] or parts[1] > parts[3]:
+        raise ValueError("bbox must be min_lat,min_lon,max_lat,max_lon")
+    return tuple(parts)
+
+
+def parse_date_arg(name):
+    """Reads an ISO date ('YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS') query argument; raises ValueError."""
+    raw = request.args.get(name)
+    if not raw:
+        return None
+    datetime.fromisoformat(raw)
+    return raw
+
+
+def wants_page():
+    return 'after_id' in request.args or 'limit' in request.args
+
+
+def page_args():
+    """Reads ?after_id=&limit= for cursor pagination."""
+    after_id = request.args.get('after_id', type=int)
+    limit = request.args.get('limit', default=DEFAULT_PAGE_SIZE, type=int)
+    return after_id, max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def stream_json_array(items):
+    """Streams an iterable of dicts as a JSON array without building it in memory."""
+    def generate():
+        yield '['
+        for i, item in enumerate(items):
+            yield (',' if i else '') + json.dumps(item, ensure_ascii=False)
+        yield ']'
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+
 @api_bp.route('/reports', methods=['GET'])
 def show_reports():
-    alerts = get_all_alerts()
-    return jsonify(alerts)
+    try:
+        bbox = parse_bbox()
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    if bbox is not None:
+        return jsonify(query_alerts_bbox(*bbox))
+
+    # Keyset pagination: ?after_id=<id ostatniego alertu z poprzedniej strony>&limit=<n>
+    if wants_page():
+        after_id, limit = page_args()
+        alerts, next_after_id = get_alerts_page(after_id=after_id, limit=limit)
+        return jsonify({'status': 'ok', 'data': alerts, 'next_after_id': next_after_id})
+
+    return stream_json_array(iter_alerts())
 
 @api_bp.route('/reports', methods=['POST'])
 def handle_reports():
@@ -52,23 +127,67 @@ def get_my_alerts():
         return jsonify({'status': 'error', 'message': 'Invalid token'}), 401
     
     user_email = payload['email']
+    if wants_page():
+        after_id, limit = page_args()
+        alerts, next_after_id = get_alerts_page(after_id=after_id, limit=limit, email=user_email)
+        return jsonify({
+            'status': 'ok',
+            'data': alerts,
+            'next_after_id': next_after_id,
+            'total': get_user_alert_count(user_email)
+        })
+
     alerts = get_user_alerts(user_email)
     return jsonify(alerts)
 
 
+@api_bp.route('/stats', methods=['GET'])
+def get_stats():
+    """Scraper counters for the ops dashboard; read from trigger-maintained tables, no scans."""
+    if not os.path.exists(CRIME_DB_PATH):
+        return jsonify({'status': 'error', 'message': 'Crime database not found'}), 503
+
+    stats = initialize_db_manager(CRIME_DB_PATH).get_statistics()
+    response = jsonify({'status': 'ok', 'data': stats})
+    response.cache_control.public = True
+    response.cache_control.max_age = STATS_MAX_AGE
+    return response
+
+
 @api_bp.route('/heatmap', methods=['GET'])
 def get_heatmap():
     try:
         # Opcjonalne parametry
         radius = request.args.get('radius', default=500, type=int)
         resolution = request.args.get('resolution', default=100, type=int)
+        radius = max(MIN_HEATMAP_RADIUS, min(radius, MAX_HEATMAP_RADIUS))
+        resolution = max(MIN_HEATMAP_RESOLUTION, min(resolution, MAX_HEATMAP_RESOLUTION))
+        try:
+            bbox = parse_bbox()
+            # Okno czasowe [from, to); samo "to" daje heatmapę na dany dzień
+            since = parse_date_arg('from')
+            until = parse_date_arg('to')
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+        if since and until and since >= until:
+            return jsonify({'status': 'error', 'message': "'from' must be earlier than 'to'"}), 400
         
-        print(f"Generating heatmap with radius={radius}m, resolution={resolution}")
+        # ETag zależy tylko od wersji danych i parametrów - bez zmian nie liczymy ponownie
+        data_version = get_data_version()['scrapped_data_version']
+        etag = f"heatmap-{data_version}-{radius}-{resolution}-{bbox}-{since}-{until}"
+        if request.if_none_match.contains(etag):
+            return Response(status=304, headers={'ETag': f'"{etag}"'})
+
+        print(f"Generating heatmap with radius={radius}m, resolution={resolution}, bbox={bbox}, "
+              f"from={since}, to={until}")
         
         heatmap, bounds, grid_info = create_heatmap(
             radius_meters=radius,
             resolution=resolution,
-            normalize=True
+            normalize=True,
+            bbox=bbox,
+            since=since,
+            until=until
         )
         
         if heatmap is None:
@@ -81,7 +200,7 @@ def get_heatmap():
         print(f"Heatmap generated successfully: {grid_info['num_points']} points")
         
         # Format zgodny z oczekiwaniami JavaScript
-        return jsonify({
+        response = jsonify({
             'status': 'ok',
             'message': 'Heatmap generated successfully',
             'data': {
@@ -89,7 +208,9 @@ def get_heatmap():
                 'bounds': bounds,
                 'grid_info': grid_info
             }
-        }), 200
+        })
+        response.set_etag(etag)
+        return response, 200
         
     except Exception as e:
         import traceback
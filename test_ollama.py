@@ -169,8 +169,8 @@ def test_ollama():
     print(f"⚡ Szybkość: ~{elapsed:.1f}s/artykuł")
     print(f"💾 Cache: Duplikaty będą instant")
     print("\n🚀 Możesz uruchomić scraping:")
-    print("  python run_malopolska.py --quick    # Test 20 artykułów")
-    print("  python run_malopolska.py            # Pełny 150 artykułów")
+    print("  python run_malopolska.py --minutes 20    # Krótki test")
+    print("  python run_malopolska.py                 # Pełna sesja (60 min)")
     print("\n✨ ZALETY OLLAMA:")
     print("  ✅ ZERO limitów API")
     print("  ✅ Działa offline")